@@ -0,0 +1,204 @@
+"""
+Response cache for model calls.
+
+Keys are stable SHA-256 digests of (method, model name, generation config,
+normalized prompt, context fingerprint), so they match across workers and
+restarts. A size-bounded in-process LRU sits in front of the shared Django
+cache. Responses tied to a user include that user's financial data version
+(see ``apps.core.services.FinancialDataVersion``) in the key, so any change to
+their transactions, budgets or goals invalidates all of them at once.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.core.services import FinancialDataVersion
+
+KEY_PREFIX = 'ai_response'
+
+DEFAULT_TTLS = {
+    'generate_response': 300,
+    'generate_financial_response': 600,
+    'generate_insights': 3600,
+    'categorize_expense': 60 * 60 * 24 * 30,
+    'categorize_merchant': 60 * 60 * 24 * 30,
+}
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share a key"""
+    return ' '.join((text or '').split()).casefold()
+
+
+def fingerprint(value) -> str:
+    """Stable digest of a context string or JSON-serializable structure"""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(normalize_prompt(value).encode('utf-8')).hexdigest()
+
+
+class AIResponseCache:
+    """
+    Two-tier response cache with hit/miss counters.
+
+    Failed generations raise out of ``get_or_generate`` and are never cached.
+    """
+
+    def __init__(self, max_local_entries: int = 1024, ttls: Optional[Dict[str, int]] = None):
+        self.max_local_entries = max_local_entries
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    # Keys
+
+    def user_version(self, user_id) -> int:
+        return FinancialDataVersion.current(user_id)
+
+    def make_key(self, method: str, model_name: str, prompt: str, generation_config=None,
+                 context='', user_id=None) -> str:
+        parts = [
+            method,
+            model_name,
+            json.dumps(generation_config or {}, sort_keys=True, default=str),
+            normalize_prompt(prompt),
+            fingerprint(context),
+        ]
+        if user_id is not None:
+            parts += [str(user_id), str(self.user_version(user_id))]
+        digest = hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+        return f"{KEY_PREFIX}:{method}:{digest}"
+
+    def ttl_for(self, method: str) -> int:
+        return self.ttls.get(method, 300)
+
+    # Local tier
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value, ttl: int):
+        with self._lock:
+            self._local[key] = (value, time.monotonic() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def _count(self, stat: str):
+        self._count_many(stat, 1)
+
+    def _count_many(self, stat: str, amount: int):
+        with self._lock:
+            self.stats[stat] += amount
+
+    # Lookups
+
+    def get(self, key: str, method: str):
+        value = self._local_get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        value = cache.get(key)
+        if value is not None:
+            self._count('shared_hits')
+            # Shared entries carry their own TTL; keep the local copy short-lived
+            self._local_set(key, value, min(60, self.ttl_for(method)))
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, key: str, value, method: str):
+        ttl = self.ttl_for(method)
+        cache.set(key, value, ttl)
+        self._local_set(key, value, ttl)
+
+    def get_many(self, keys: List[str], method: str) -> Dict[str, object]:
+        """Look up many keys with one shared-cache round trip for the local misses"""
+        found = {}
+        for key in keys:
+            value = self._local_get(key)
+            if value is not None:
+                found[key] = value
+        self._count_many('local_hits', len(found))
+
+        missing = [key for key in keys if key not in found]
+        shared = cache.get_many(missing) if missing else {}
+        for key, value in shared.items():
+            self._local_set(key, value, min(60, self.ttl_for(method)))
+        found.update(shared)
+        self._count_many('shared_hits', len(shared))
+        self._count_many('misses', len(missing) - len(shared))
+        return found
+
+    def set_many(self, values: Dict[str, object], method: str):
+        ttl = self.ttl_for(method)
+        cache.set_many(values, ttl)
+        for key, value in values.items():
+            self._local_set(key, value, ttl)
+
+    def get_or_generate(self, method: str, model_name: str, prompt: str, generate: Callable,
+                        generation_config=None, context='', user_id=None):
+        key = self.make_key(method, model_name, prompt, generation_config, context, user_id)
+        value = self.get(key, method)
+        if value is None:
+            value = generate()
+            self.set(key, value, method)
+        return value
+
+    async def aget_or_generate(self, method: str, model_name: str, prompt: str, generate: Callable,
+                               generation_config=None, context='', user_id=None):
+        """Async variant; ``generate`` returns an awaitable"""
+        key = self.make_key(method, model_name, prompt, generation_config, context, user_id)
+        value = self.get(key, method)
+        if value is None:
+            value = await generate()
+            self.set(key, value, method)
+        return value
+
+    # Invalidation
+
+    def invalidate_user(self, user_id):
+        """Drop every cached response that was built from this user's data"""
+        FinancialDataVersion.bump(user_id)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats['local_hits'] + self.stats['shared_hits']) / total if total else 0.0
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> AIResponseCache:
+    """Return the process-wide response cache"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                ai_config = getattr(settings, 'AI_CONFIG', {})
+                _response_cache = AIResponseCache(
+                    max_local_entries=ai_config.get('response_cache_entries', 1024),
+                    ttls=ai_config.get('response_cache_ttls'),
+                )
+    return _response_cache
@@ -0,0 +1,541 @@
+"""
+Local expense categorization.
+
+Descriptions go through three stages, cheapest first:
+
+1. A keyword/regex matcher compiled from ``ExpenseCategory`` rows and the
+   built-in seed vocabulary below.
+2. A hashed n-gram naive Bayes classifier trained on categorization feedback
+   in ``AITrainingData`` and on user-confirmed transactions, keeping only
+   labels from the shared ``CATEGORY_SLUGS`` vocabulary.
+3. The model fallback, only when neither local stage reaches the category's
+   ``confidence_threshold``.
+
+The first two stages are pure Python over precompiled state and answer in
+well under a millisecond.
+"""
+import json
+import logging
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_SLUGS = [
+    'food_dining', 'groceries', 'transportation', 'fuel', 'entertainment',
+    'shopping', 'utilities', 'healthcare', 'education', 'travel',
+    'fitness', 'subscriptions', 'insurance', 'banking', 'investment', 'miscellaneous'
+]
+
+DEFAULT_CATEGORY = 'miscellaneous'
+DEFAULT_THRESHOLD = 0.7
+
+SEED_KEYWORDS = {
+    'food_dining': ['starbucks', 'coffee', 'cafe', 'restaurant', 'mcdonalds', 'burger', 'pizza',
+                    'domino', 'subway', 'kfc', 'chipotle', 'dunkin', 'doordash', 'uber eats',
+                    'grubhub', 'zomato', 'swiggy', 'diner', 'bistro', 'bakery', 'bar & grill'],
+    'groceries': ['walmart', 'kroger', 'safeway', 'whole foods', 'trader joe', 'aldi', 'costco',
+                  'grocery', 'supermarket', 'instacart', 'big basket', 'bigbasket', 'publix'],
+    'transportation': ['uber', 'lyft', 'taxi', 'metro', 'transit', 'parking', 'toll', 'train',
+                       'bus pass', 'ola'],
+    'fuel': ['shell', 'chevron', 'exxon', 'bp', 'texaco', 'gas station', 'petrol', 'fuel',
+             'diesel', 'mobil'],
+    'entertainment': ['cinema', 'movie', 'theatre', 'theater', 'concert', 'ticketmaster',
+                      'steam', 'playstation', 'xbox', 'bowling'],
+    'shopping': ['amazon', 'target', 'ebay', 'etsy', 'best buy', 'ikea', 'flipkart', 'myntra',
+                 'mall', 'clothing', 'zara', 'h&m'],
+    'utilities': ['electric', 'electricity', 'water bill', 'gas bill', 'internet', 'comcast',
+                  'verizon', 'at&t', 't-mobile', 'utility', 'broadband', 'phone bill'],
+    'healthcare': ['pharmacy', 'cvs', 'walgreens', 'hospital', 'clinic', 'doctor', 'dental',
+                   'dentist', 'medical', 'optometrist'],
+    'education': ['tuition', 'udemy', 'coursera', 'school', 'university', 'college', 'textbook'],
+    'travel': ['airline', 'airlines', 'airbnb', 'hotel', 'marriott', 'hilton', 'expedia',
+               'booking.com', 'delta', 'united air', 'flight'],
+    'fitness': ['gym', 'fitness', 'planet fitness', 'yoga', 'peloton', 'crossfit'],
+    'subscriptions': ['netflix', 'spotify', 'hulu', 'disney+', 'youtube premium', 'apple music',
+                      'icloud', 'prime video', 'subscription', 'patreon'],
+    'insurance': ['insurance', 'geico', 'allstate', 'progressive', 'state farm', 'premium'],
+    'banking': ['atm', 'bank fee', 'overdraft', 'interest charge', 'service charge', 'wire fee'],
+    'investment': ['vanguard', 'fidelity', 'robinhood', 'schwab', 'brokerage', 'mutual fund',
+                   'zerodha', 'etf'],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9&+']+")
+_NOISE_RE = re.compile(r"[#*]?\d{3,}|\b(?:pos|purchase|debit|card|ach|payment|txn|ref)\b")
+
+
+class Prediction(NamedTuple):
+    category: str
+    confidence: float
+    source: str  # 'keyword', 'classifier', 'model' or 'default'
+
+
+def normalize_description(description: str) -> str:
+    """Lowercase, drop card/reference noise and collapse whitespace"""
+    text = _NOISE_RE.sub(' ', (description or '').lower())
+    return ' '.join(text.split())
+
+
+def normalize_merchant(description: str) -> str:
+    """
+    Merchant key for de-duplication: the leading words of the description
+    once numbers, store ids and punctuation are gone, so "STARBUCKS #1234
+    SEATTLE" and "Starbucks 0045" collapse together.
+    """
+    words = [
+        word for word in re.sub(r"[^a-z0-9&' ]+", ' ', normalize_description(description)).split()
+        if not any(ch.isdigit() for ch in word)
+    ]
+    return ' '.join(words[:4])
+
+
+def label_for(name: str) -> str:
+    """Map a free-form category name onto the slug vocabulary"""
+    return slugify(name).replace('-', '_')
+
+
+def vocabulary_label(name: str) -> Optional[str]:
+    """
+    Slug of ``name`` when it belongs to ``CATEGORY_SLUGS``, else ``None``.
+
+    Training data comes from every user, so only the shared vocabulary may
+    become a label; a user's own category names never reach another user.
+    """
+    label = label_for(name)
+    return label if label in CATEGORY_SLUGS else None
+
+
+class KeywordMatcher:
+    """
+    Single compiled alternation over every keyword, plus per-category regexes.
+
+    When several keywords match, the longest wins, so "uber eats" beats "uber".
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]], patterns: Optional[Dict[str, Iterable[str]]] = None):
+        self.keyword_map = {}
+        for category, words in keywords.items():
+            for word in words:
+                word = word.strip().lower()
+                if word:
+                    self.keyword_map.setdefault(word, category)
+
+        alternation = '|'.join(
+            re.escape(word) for word in sorted(self.keyword_map, key=len, reverse=True)
+        )
+        self.keyword_re = re.compile(rf"(?<![a-z0-9])(?:{alternation})(?![a-z0-9])") if alternation else None
+
+        self.patterns = []
+        for category, regexes in (patterns or {}).items():
+            for pattern in regexes:
+                try:
+                    self.patterns.append((re.compile(pattern, re.IGNORECASE), category))
+                except re.error as e:
+                    logger.warning(f"Skipping invalid pattern {pattern!r} for {category}: {e}")
+
+    def match(self, text: str) -> Optional[Prediction]:
+        if self.keyword_re is not None:
+            hits = self.keyword_re.findall(text)
+            if hits:
+                return Prediction(self.keyword_map[max(hits, key=len)], 0.95, 'keyword')
+        for regex, category in self.patterns:
+            if regex.search(text):
+                return Prediction(category, 0.9, 'keyword')
+        return None
+
+
+class NaiveBayesClassifier:
+    """
+    Multinomial naive Bayes over hashed word unigrams/bigrams and character
+    trigrams. Hashing with CRC32 keeps the model a fixed size and stable
+    across processes.
+    """
+
+    def __init__(self, buckets: int = 1 << 18, alpha: float = 0.5):
+        self.buckets = buckets
+        self.alpha = alpha
+        self.feature_counts = defaultdict(Counter)
+        self.feature_totals = Counter()
+        self.class_counts = Counter()
+
+    def features(self, text: str) -> List[int]:
+        words = _TOKEN_RE.findall(text)
+        grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            grams += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        return [zlib.crc32(gram.encode('utf-8')) % self.buckets for gram in grams]
+
+    def fit(self, samples: Iterable[tuple]) -> 'NaiveBayesClassifier':
+        for text, label in samples:
+            features = self.features(text)
+            if not features:
+                continue
+            self.class_counts[label] += 1
+            self.feature_counts[label].update(features)
+            self.feature_totals[label] += len(features)
+        return self
+
+    @property
+    def is_trained(self) -> bool:
+        return bool(self.class_counts)
+
+    def predict(self, text: str) -> Optional[Prediction]:
+        features = self.features(text)
+        if not features or not self.is_trained:
+            return None
+
+        total_docs = sum(self.class_counts.values())
+        scores = {}
+        for label, docs in self.class_counts.items():
+            counts = self.feature_counts[label]
+            denominator = math.log(self.feature_totals[label] + self.alpha * self.buckets)
+            score = math.log(docs / total_docs)
+            for feature in features:
+                score += math.log(counts.get(feature, 0) + self.alpha) - denominator
+            scores[label] = score
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+        return Prediction(best, confidence, 'classifier')
+
+
+class CategorizationEngine:
+    """
+    Keyword matcher, local classifier and optional model fallback.
+
+    ``fallback`` takes a raw description and returns a category label; it is
+    only called when the local stages are not confident enough.
+    """
+
+    def __init__(self, matcher: KeywordMatcher, classifier: NaiveBayesClassifier,
+                 thresholds: Optional[Dict[str, float]] = None):
+        self.matcher = matcher
+        self.classifier = classifier
+        self.thresholds = thresholds or {}
+
+    def threshold_for(self, category: str) -> float:
+        return self.thresholds.get(category, DEFAULT_THRESHOLD)
+
+    def categorize_local(self, description: str) -> Optional[Prediction]:
+        """Best local prediction, or ``None`` when nothing matched at all"""
+        text = normalize_description(description)
+        return self.matcher.match(text) or self.classifier.predict(text)
+
+    def is_confident(self, prediction: Optional[Prediction]) -> bool:
+        return prediction is not None and prediction.confidence >= self.threshold_for(prediction.category)
+
+    def categorize(self, description: str, fallback: Optional[Callable[[str], str]] = None) -> Prediction:
+        prediction = self.categorize_local(description)
+        if self.is_confident(prediction):
+            return prediction
+        if fallback is not None:
+            return Prediction(fallback(description), 0.8, 'model')
+        return prediction or Prediction(DEFAULT_CATEGORY, 0.0, 'default')
+
+    def categorize_batch(self, descriptions: List[str],
+                         fallback: Optional[Callable[[str], str]] = None) -> List[Prediction]:
+        """
+        Categorize many descriptions, running each distinct normalized
+        description through the pipeline once.
+        """
+        by_text = {}
+        for description in descriptions:
+            text = normalize_description(description)
+            if text not in by_text:
+                by_text[text] = self.categorize(description, fallback)
+        return [by_text[normalize_description(description)] for description in descriptions]
+
+    # Construction
+
+    @classmethod
+    def from_database(cls, transaction_limit: int = 50000) -> 'CategorizationEngine':
+        """
+        Build from ``ExpenseCategory`` rules, categorization feedback and
+        user-confirmed transactions, on top of the seed vocabulary.
+        """
+        keywords = {category: list(words) for category, words in SEED_KEYWORDS.items()}
+        patterns = {}
+        thresholds = {}
+        samples = []
+
+        try:
+            from apps.ai.models import ExpenseCategory, AITrainingData
+
+            for rule in ExpenseCategory.objects.filter(is_active=True):
+                label = label_for(rule.name)
+                keywords.setdefault(label, []).extend(rule.keywords or [])
+                patterns[label] = rule.patterns or []
+                thresholds[label] = rule.confidence_threshold
+
+            samples += [
+                (normalize_description(text), vocabulary_label(label))
+                for text, label in AITrainingData.objects.filter(
+                    context_data__task='categorization'
+                ).exclude(user_feedback='not_helpful').values_list('input_text', 'ai_response')
+            ]
+        except (DatabaseError, LookupError, RuntimeError) as e:
+            logger.warning(f"Categorization rules unavailable, using seed vocabulary: {e}")
+
+        try:
+            from apps.core.models import Transaction
+
+            samples += [
+                (normalize_description(f"{merchant} {description}"), vocabulary_label(name))
+                for merchant, description, name in Transaction.objects.filter(
+                    category__isnull=False, ai_categorized=False, transaction_type='debit'
+                ).order_by('-transaction_date').values_list(
+                    'merchant_name', 'description', 'category__name'
+                )[:transaction_limit]
+            ]
+        except DatabaseError as e:
+            logger.warning(f"Transaction history unavailable for categorization training: {e}")
+
+        # Seed keywords double as training text so the classifier covers
+        # near-misses such as "starbuck" or "netflix.com"
+        samples += [(word, category) for category, words in SEED_KEYWORDS.items() for word in words]
+        samples = [(text, label) for text, label in samples if label is not None]
+
+        return cls(KeywordMatcher(keywords, patterns), NaiveBayesClassifier().fit(samples), thresholds)
+
+
+class BatchCategorizer:
+    """
+    Categorize thousands of descriptions with a handful of model calls.
+
+    Descriptions are collapsed to merchant keys, answered by the local engine
+    or earlier model answers where possible, and the rest are packed into
+    multi-item prompts that ask for a JSON object back. Prompts run
+    concurrently up to the shared client's concurrency limit.
+    """
+
+    PROMPT_SIZE = 100
+
+    def __init__(self, engine: Optional[CategorizationEngine] = None, client=None,
+                 response_cache=None, prompt_size: int = PROMPT_SIZE):
+        from .cache import get_response_cache
+        from .client import get_gemini_client
+
+        self.engine = engine or get_categorization_engine()
+        self.client = client or get_gemini_client()
+        self.response_cache = response_cache or get_response_cache()
+        self.prompt_size = prompt_size
+
+    def cache_key(self, merchant: str) -> str:
+        return self.response_cache.make_key('categorize_merchant', self.client.model_name, merchant)
+
+    def categorize(self, descriptions: List[str]) -> List[Prediction]:
+        """Predictions aligned with ``descriptions``"""
+        merchants = [normalize_merchant(description) or normalize_description(description)
+                     for description in descriptions]
+
+        # Local stages, once per distinct merchant
+        resolved = {}
+        local_best = {}
+        for merchant, description in zip(merchants, descriptions):
+            if merchant in resolved or merchant in local_best:
+                continue
+            prediction = self.engine.categorize_local(description)
+            if self.engine.is_confident(prediction):
+                resolved[merchant] = prediction
+            else:
+                local_best[merchant] = prediction
+
+        # Earlier model answers
+        pending = list(local_best)
+        keys = {merchant: self.cache_key(merchant) for merchant in pending}
+        cached = self.response_cache.get_many(list(keys.values()), 'categorize_merchant')
+        for merchant in pending:
+            if keys[merchant] in cached:
+                resolved[merchant] = Prediction(cached[keys[merchant]], 0.8, 'model')
+
+        # Packed model prompts for the remainder
+        pending = [merchant for merchant in pending if merchant not in resolved]
+        answers = self.categorize_with_model(pending) if pending else {}
+        self.response_cache.set_many(
+            {keys[merchant]: category for merchant, category in answers.items()}, 'categorize_merchant'
+        )
+        for merchant in pending:
+            if merchant in answers:
+                resolved[merchant] = Prediction(answers[merchant], 0.8, 'model')
+            else:
+                resolved[merchant] = local_best[merchant] or Prediction(DEFAULT_CATEGORY, 0.0, 'default')
+
+        return [resolved[merchant] for merchant in merchants]
+
+    def categorize_with_model(self, merchants: List[str]) -> Dict[str, str]:
+        batches = [merchants[i:i + self.prompt_size] for i in range(0, len(merchants), self.prompt_size)]
+        answers = {}
+        with ThreadPoolExecutor(max_workers=min(len(batches), self.client.max_concurrency)) as pool:
+            for batch_answers in pool.map(self.run_batch, batches):
+                answers.update(batch_answers)
+        return answers
+
+    def run_batch(self, merchants: List[str]) -> Dict[str, str]:
+        try:
+            response = self.client.generate(
+                self.build_prompt(merchants),
+                generation_config={
+                    "temperature": 0.2,
+                    "max_output_tokens": 16 * len(merchants) + 64,
+                    "response_mime_type": "application/json",
+                }
+            )
+        except Exception as e:
+            logger.error(f"Batch categorization prompt failed: {e}")
+            return {}
+        return self.parse_response(response, merchants)
+
+    @staticmethod
+    def build_prompt(merchants: List[str]) -> str:
+        items = '\n'.join(f'{i}: {merchant}' for i, merchant in enumerate(merchants, 1))
+        return f"""
+        Categorize each numbered expense merchant into one of these categories:
+        {', '.join(CATEGORY_SLUGS)}
+
+        Expenses:
+        {items}
+
+        Respond with only a JSON object mapping each number to its category, e.g. {{"1": "groceries"}}.
+        """
+
+    @staticmethod
+    def parse_response(text: str, merchants: List[str]) -> Dict[str, str]:
+        match = re.search(r"\{.*\}", text or '', re.DOTALL)
+        try:
+            data = json.loads(match.group(0)) if match else {}
+        except ValueError:
+            logger.warning("Batch categorization returned invalid JSON")
+            return {}
+        answers = {}
+        for number, category in data.items():
+            category = str(category).strip().lower()
+            if str(number).isdigit() and 1 <= int(number) <= len(merchants) and category in CATEGORY_SLUGS:
+                answers[merchants[int(number) - 1]] = category
+        return answers
+
+    # Writing results back
+
+    def apply_to_transactions(self, user, queryset, overwrite: bool = False, limit: Optional[int] = None) -> Dict:
+        """
+        Categorize the user's transactions in ``queryset`` (the newest
+        ``limit`` of them) and save the results with one ``bulk_update``.
+        Unless ``overwrite`` is set, categories the user chose themselves
+        are left alone. Predictions the user has no category for and that
+        are outside ``CATEGORY_SLUGS`` leave the transaction unassigned.
+        """
+        from apps.core.models import Transaction
+        from apps.core.services import ChangeFeed, rollup_month
+        from apps.core.signals import transactions_bulk_changed
+
+        queryset = queryset.filter(user=user)
+        if not overwrite:
+            queryset = queryset.filter(Q(category__isnull=True) | Q(ai_categorized=True))
+        queryset = queryset.order_by('-transaction_date').only(
+            'id', 'description', 'merchant_name', 'category_id', 'transaction_date',
+            'ai_categorized', 'confidence_score'
+        )
+        rows = list(queryset[:limit] if limit is not None else queryset)
+
+        predictions = self.categorize([f"{row.merchant_name} {row.description}".strip() for row in rows])
+        categories = self.resolve_categories(
+            user, {prediction.category for prediction in predictions if prediction.source != 'default'}
+        )
+
+        now = timezone.now()
+        changed = []
+        months = set()
+        category_ids = set()
+        for row, prediction in zip(rows, predictions):
+            category = categories.get(prediction.category)
+            if prediction.source == 'default' or category is None:
+                continue
+            confidence = round(prediction.confidence, 4)
+            if row.category_id == category.pk and row.ai_categorized and row.confidence_score == confidence:
+                continue
+            months.add(rollup_month(row.transaction_date))
+            category_ids.update({row.category_id, category.pk})
+            row.category = category
+            row.ai_categorized = True
+            row.confidence_score = confidence
+            row.updated_at = now
+            changed.append(row)
+
+        with transaction.atomic():
+            Transaction.objects.bulk_update(
+                changed, ['category', 'ai_categorized', 'confidence_score', 'updated_at'], batch_size=500
+            )
+            ChangeFeed.record(user.pk, 'Transaction', [row.pk for row in changed])
+        if changed:
+            transactions_bulk_changed.send(
+                sender=Transaction, user=user, months=months, category_ids=category_ids
+            )
+
+        return {
+            'processed': len(rows),
+            'updated': len(changed),
+            'sources': dict(Counter(prediction.source for prediction in predictions)),
+        }
+
+    @staticmethod
+    def resolve_categories(user, labels: Iterable[str]) -> Dict[str, object]:
+        """
+        Map category labels to the user's expense categories, creating
+        missing ones for labels in ``CATEGORY_SLUGS`` only
+        """
+        from apps.core.models import Category
+        from apps.core.services import ChangeFeed
+
+        def existing():
+            return {
+                label_for(category.name): category
+                for category in Category.objects.filter(user=user, category_type='expense')
+            }
+
+        categories = existing()
+        missing = [label for label in labels if label not in categories and label in CATEGORY_SLUGS]
+        if missing:
+            Category.objects.bulk_create(
+                [Category(user=user, name=label.replace('_', ' ').title(), category_type='expense',
+                          is_system=True) for label in missing],
+                ignore_conflicts=True
+            )
+            categories = existing()
+            ChangeFeed.record(user.pk, 'Category', [categories[label].pk for label in missing if label in categories])
+        return categories
+
+
+ENGINE_TTL = 60 * 60
+
+_engine = None
+_engine_built_at = 0.0
+_engine_lock = threading.Lock()
+
+
+def get_categorization_engine() -> CategorizationEngine:
+    """Process-wide engine, rebuilt hourly or after ``reset_categorization_engine``"""
+    global _engine, _engine_built_at
+    if _engine is None or time.monotonic() - _engine_built_at > ENGINE_TTL:
+        with _engine_lock:
+            if _engine is None or time.monotonic() - _engine_built_at > ENGINE_TTL:
+                _engine = CategorizationEngine.from_database()
+                _engine_built_at = time.monotonic()
+    return _engine
+
+
+def reset_categorization_engine():
+    global _engine
+    with _engine_lock:
+        _engine = None
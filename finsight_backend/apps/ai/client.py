@@ -0,0 +1,382 @@
+"""
+Process-wide Gemini client shared by REST views and WebSocket consumers.
+
+The client configures the SDK once, reuses one ``GenerativeModel`` per model
+name, bounds the number of in-flight requests and retries transient failures
+with jittered exponential backoff. It exposes both a blocking API for views
+and a native ``async`` API for consumers.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+
+
+class AIClientError(Exception):
+    """Raised when a model call fails after all retries."""
+
+
+def _retryable_errors():
+    errors = [TimeoutError, asyncio.TimeoutError, ConnectionError]
+    try:
+        from google.api_core import exceptions as google_exceptions
+        errors += [
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+        ]
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+RETRYABLE_ERRORS = _retryable_errors()
+
+
+class GeminiBackend:
+    """
+    Backend built on ``google.generativeai``.
+
+    ``genai.configure`` runs once per process and model objects are cached,
+    so the underlying gRPC channels are reused across requests.
+    """
+
+    def __init__(self, api_key: str):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = self._genai.GenerativeModel(model_name)
+                    self._models[model_name] = model
+        return model
+
+    def generate(self, model_name: str, prompt: str, generation_config=None,
+                 safety_settings=None, timeout: Optional[float] = None) -> str:
+        response = self.get_model(model_name).generate_content(
+            prompt,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+            request_options={'timeout': timeout} if timeout else None,
+        )
+        return response.text
+
+    async def agenerate(self, model_name: str, prompt: str, generation_config=None,
+                        safety_settings=None, timeout: Optional[float] = None) -> str:
+        response = await self.get_model(model_name).generate_content_async(
+            prompt,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+            request_options={'timeout': timeout} if timeout else None,
+        )
+        return response.text
+
+    def stream(self, model_name: str, prompt: str, generation_config=None,
+               safety_settings=None, timeout: Optional[float] = None) -> Iterator[str]:
+        response = self.get_model(model_name).generate_content(
+            prompt,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+            stream=True,
+            request_options={'timeout': timeout} if timeout else None,
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    async def astream(self, model_name: str, prompt: str, generation_config=None,
+                      safety_settings=None, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        response = await self.get_model(model_name).generate_content_async(
+            prompt,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+            stream=True,
+            request_options={'timeout': timeout} if timeout else None,
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackend:
+    """
+    Offline backend for tests, benchmarks and local development.
+
+    Returns a canned (or prompt-derived) response after ``latency`` seconds;
+    ``response`` may also be a callable taking the prompt.
+    Streaming splits the response into ``chunk_count`` chunks spread evenly
+    over the same total latency, like a model emitting tokens. The first
+    ``failures`` calls raise ``ConnectionError`` so retry paths can be
+    exercised.
+    """
+
+    def __init__(self, latency: float = 0.0, response=None, failures: int = 0,
+                 chunk_count: int = 8):
+        self.latency = latency
+        self.response = response
+        self.failures = failures
+        self.chunk_count = chunk_count
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.failures > 0:
+                self.failures -= 1
+                self.in_flight -= 1
+                raise ConnectionError('Simulated transient failure')
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def respond(self, prompt: str) -> str:
+        if callable(self.response):
+            return self.response(prompt)
+        if self.response is not None:
+            return self.response
+        return f"Echo: {prompt.strip()[:200]}"
+
+    def generate(self, model_name, prompt, generation_config=None, safety_settings=None, timeout=None):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            return self.respond(prompt)
+        finally:
+            self._exit()
+
+    async def agenerate(self, model_name, prompt, generation_config=None, safety_settings=None, timeout=None):
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+            return self.respond(prompt)
+        finally:
+            self._exit()
+
+    def chunks(self, prompt: str) -> List[str]:
+        text = self.respond(prompt)
+        size = max(1, -(-len(text) // self.chunk_count))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def stream(self, model_name, prompt, generation_config=None, safety_settings=None, timeout=None):
+        self._enter()
+        try:
+            chunks = self.chunks(prompt)
+            for chunk in chunks:
+                time.sleep(self.latency / len(chunks))
+                yield chunk
+        finally:
+            self._exit()
+
+    async def astream(self, model_name, prompt, generation_config=None, safety_settings=None, timeout=None):
+        self._enter()
+        try:
+            chunks = self.chunks(prompt)
+            for chunk in chunks:
+                await asyncio.sleep(self.latency / len(chunks))
+                yield chunk
+        finally:
+            self._exit()
+
+
+class GeminiClient:
+    """
+    Concurrency-limited, retrying front end to a model backend.
+
+    Blocking calls share a bounded semaphore; async calls use one
+    ``asyncio.Semaphore`` per event loop with the same limit.
+    """
+
+    def __init__(self, backend, model_name: str = DEFAULT_MODEL, max_concurrency: int = 8,
+                 timeout: float = 30.0, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0):
+        self.backend = backend
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sync_limiter = threading.BoundedSemaphore(max_concurrency)
+        self._async_limiters = weakref.WeakKeyDictionary()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _async_limiter(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        limiter = self._async_limiters.get(loop)
+        if limiter is None:
+            limiter = asyncio.Semaphore(self.max_concurrency)
+            self._async_limiters[loop] = limiter
+        return limiter
+
+    def generate(self, prompt: str, generation_config: Optional[Dict] = None,
+                 safety_settings=None, model_name: Optional[str] = None,
+                 timeout: Optional[float] = None) -> str:
+        """Blocking generation with bounded concurrency and retries"""
+        model_name = model_name or self.model_name
+        timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._sync_limiter:
+                    return self.backend.generate(
+                        model_name, prompt, generation_config, safety_settings, timeout
+                    )
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise AIClientError(f"Model call failed after {attempt + 1} attempts: {e}") from e
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Retrying model call in {delay:.2f}s after error: {e}")
+                time.sleep(delay)
+
+    async def agenerate(self, prompt: str, generation_config: Optional[Dict] = None,
+                        safety_settings=None, model_name: Optional[str] = None,
+                        timeout: Optional[float] = None) -> str:
+        """Native async generation with bounded concurrency and retries"""
+        model_name = model_name or self.model_name
+        timeout = timeout or self.timeout
+        limiter = self._async_limiter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with limiter:
+                    return await asyncio.wait_for(
+                        self.backend.agenerate(
+                            model_name, prompt, generation_config, safety_settings, timeout
+                        ),
+                        timeout,
+                    )
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise AIClientError(f"Model call failed after {attempt + 1} attempts: {e}") from e
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Retrying async model call in {delay:.2f}s after error: {e}")
+                await asyncio.sleep(delay)
+
+    def stream(self, prompt: str, generation_config: Optional[Dict] = None,
+               safety_settings=None, model_name: Optional[str] = None,
+               timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        Blocking generator of response chunks.
+
+        Failures before the first chunk are retried; once text has been
+        yielded a failure is raised, since the caller already consumed it.
+        """
+        model_name = model_name or self.model_name
+        timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                with self._sync_limiter:
+                    for chunk in self.backend.stream(
+                        model_name, prompt, generation_config, safety_settings, timeout
+                    ):
+                        started = True
+                        yield chunk
+                return
+            except RETRYABLE_ERRORS as e:
+                if started or attempt == self.max_retries:
+                    raise AIClientError(f"Model stream failed after {attempt + 1} attempts: {e}") from e
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Retrying model stream in {delay:.2f}s after error: {e}")
+                time.sleep(delay)
+
+    async def astream(self, prompt: str, generation_config: Optional[Dict] = None,
+                      safety_settings=None, model_name: Optional[str] = None,
+                      timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Async iterator of response chunks.
+
+        ``timeout`` bounds the wait for each chunk rather than the whole
+        response. Retries follow the same rule as ``stream``.
+        """
+        model_name = model_name or self.model_name
+        timeout = timeout or self.timeout
+        limiter = self._async_limiter()
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with limiter:
+                    chunks = self.backend.astream(
+                        model_name, prompt, generation_config, safety_settings, timeout
+                    ).__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield chunk
+            except RETRYABLE_ERRORS as e:
+                if started or attempt == self.max_retries:
+                    raise AIClientError(f"Model stream failed after {attempt + 1} attempts: {e}") from e
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Retrying async model stream in {delay:.2f}s after error: {e}")
+                await asyncio.sleep(delay)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def build_client_from_settings() -> GeminiClient:
+    ai_config = getattr(settings, 'AI_CONFIG', {})
+    if ai_config.get('backend', 'gemini') == 'fake':
+        backend = FakeBackend(
+            latency=ai_config.get('fake_latency', 0.0),
+            chunk_count=ai_config.get('fake_chunk_count', 8),
+        )
+    else:
+        api_key = getattr(settings, 'GEMINI_API_KEY', '') or os.environ.get('GEMINI_API_KEY', '')
+        backend = GeminiBackend(api_key)
+    return GeminiClient(
+        backend,
+        model_name=ai_config.get('model', DEFAULT_MODEL),
+        max_concurrency=ai_config.get('max_concurrency', 8),
+        timeout=ai_config.get('request_timeout', 30.0),
+        max_retries=ai_config.get('max_retries', 3),
+    )
+
+
+def get_gemini_client() -> GeminiClient:
+    """Return the process-wide client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_client_from_settings()
+                logger.info("Gemini AI client initialized")
+    return _client
+
+
+def set_gemini_client(client: Optional[GeminiClient]) -> Optional[GeminiClient]:
+    """Swap the process-wide client (tests, benchmarks); returns the previous one"""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    return previous
@@ -0,0 +1,130 @@
+# Generated by Django 5.0.7 on 2026-10-17 06:02
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('keywords', models.JSONField(blank=True, default=list)),
+                ('patterns', models.JSONField(blank=True, default=list)),
+                ('confidence_threshold', models.FloatField(default=0.7)),
+                ('is_active', models.BooleanField(default=True)),
+                ('usage_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'expense_categories',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AIConversation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('summary', models.TextField(blank=True)),
+                ('summary_through', models.DateTimeField(blank=True, null=True)),
+                ('summarized_message_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ai_conversations',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AIInsight',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('insight_type', models.CharField(choices=[('spending_pattern', 'Spending Pattern'), ('budget_alert', 'Budget Alert'), ('goal_progress', 'Goal Progress'), ('saving_opportunity', 'Saving Opportunity'), ('investment_tip', 'Investment Tip'), ('general_advice', 'General Advice')], max_length=30)),
+                ('title', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('urgent', 'Urgent')], default='medium', max_length=10)),
+                ('is_read', models.BooleanField(default=False)),
+                ('is_actionable', models.BooleanField(default=True)),
+                ('action_taken', models.BooleanField(default=False)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assistant_insights', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ai_assistant_insights',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AITrainingData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('input_text', models.TextField()),
+                ('ai_response', models.TextField()),
+                ('user_feedback', models.CharField(blank=True, choices=[('helpful', 'Helpful'), ('not_helpful', 'Not Helpful'), ('partially_helpful', 'Partially Helpful')], max_length=20, null=True)),
+                ('feedback_text', models.TextField(blank=True)),
+                ('context_data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_training_data', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ai_training_data',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AIUserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preferred_communication_style', models.CharField(choices=[('formal', 'Formal'), ('casual', 'Casual'), ('encouraging', 'Encouraging'), ('direct', 'Direct')], default='casual', max_length=20)),
+                ('financial_experience_level', models.CharField(choices=[('beginner', 'Beginner'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced'), ('expert', 'Expert')], default='beginner', max_length=20)),
+                ('interests', models.JSONField(blank=True, default=list)),
+                ('goals_focus', models.JSONField(blank=True, default=list)),
+                ('notification_preferences', models.JSONField(blank=True, default=dict)),
+                ('ai_interaction_count', models.PositiveIntegerField(default=0)),
+                ('last_interaction', models.DateTimeField(blank=True, null=True)),
+                ('personalization_data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ai_user_profiles',
+            },
+        ),
+        migrations.CreateModel(
+            name='AIMessage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('role', models.CharField(choices=[('user', 'User'), ('assistant', 'AI Assistant'), ('system', 'System')], max_length=20)),
+                ('content', models.TextField()),
+                ('message_type', models.CharField(choices=[('text', 'Text Message'), ('suggestion', 'Suggestion'), ('insight', 'Financial Insight'), ('alert', 'Alert')], default='text', max_length=20)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='ai.aiconversation')),
+            ],
+            options={
+                'db_table': 'ai_messages',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['conversation', 'created_at'], name='ai_messages_convers_15163f_idx')],
+            },
+        ),
+    ]
@@ -15,6 +15,11 @@ class AIConversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     
+    # Rolling summary of the turns that fell out of the verbatim history window
+    summary = models.TextField(blank=True)
+    summary_through = models.DateTimeField(null=True, blank=True)  # created_at of the last summarized message
+    summarized_message_count = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['-updated_at']
         db_table = 'ai_conversations'
@@ -57,6 +62,9 @@ class AIMessage(models.Model):
     class Meta:
         ordering = ['created_at']
         db_table = 'ai_messages'
+        indexes = [
+            models.Index(fields=['conversation', 'created_at']),
+        ]
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}"
@@ -83,7 +91,7 @@ class AIInsight(models.Model):
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_insights')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='assistant_insights')
     insight_type = models.CharField(max_length=30, choices=INSIGHT_TYPE_CHOICES)
     title = models.CharField(max_length=255)
     content = models.TextField()
@@ -97,7 +105,7 @@ class AIInsight(models.Model):
     
     class Meta:
         ordering = ['-created_at']
-        db_table = 'ai_insights'
+        db_table = 'ai_assistant_insights'  # core.AIInsight owns ai_insights
     
     def __str__(self):
         return f"{self.insight_type}: {self.title}"
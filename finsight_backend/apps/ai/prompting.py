@@ -0,0 +1,155 @@
+"""
+Prompt assembly for chat.
+
+Each request carries three pieces: the latest turns of the conversation
+verbatim, a rolling summary of everything older (stored on
+``AIConversation`` and extended once per window of turns, never rebuilt),
+and the user's cached financial context. The assembled parts are trimmed to
+a token budget measured with a cheap local estimator, so payload size stays
+flat however long a conversation runs.
+"""
+import logging
+from typing import Callable, List, NamedTuple, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_MESSAGES = 10
+DEFAULT_TOKEN_BUDGET = 6000
+
+# Space reserved for the instructions and question wrapped around the parts
+PROMPT_OVERHEAD_TOKENS = 250
+SUMMARY_MAX_TOKENS = 400
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count: about four characters per token for English text,
+    never fewer than the number of words.
+    """
+    if not text:
+        return 0
+    return max((len(text) + 3) // 4, len(text.split()))
+
+
+def truncate_to_tokens(text: str, budget: int, keep: str = 'head') -> str:
+    """Cut ``text`` to roughly ``budget`` tokens, keeping the head or the tail"""
+    if budget <= 0:
+        return ''
+    if estimate_tokens(text) <= budget:
+        return text
+    limit = budget * 4
+    return text[:limit].rstrip() + ' …' if keep == 'head' else '… ' + text[-limit:].lstrip()
+
+
+def format_turn(role: str, content: str) -> str:
+    speaker = 'User' if role == 'user' else 'Assistant'
+    return f"{speaker}: {content.strip()}"
+
+
+def extractive_summary(previous: str, turns: List[str], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Model-free summary: first sentence of each folded turn, newest kept"""
+    sentences = [turn.split('. ')[0][:200] for turn in turns]
+    combined = '\n'.join(part for part in [previous] + sentences if part)
+    return truncate_to_tokens(combined, max_tokens, keep='tail')
+
+
+class AssembledPrompt(NamedTuple):
+    context: str
+    history: str
+    tokens: int
+
+
+class PromptAssembler:
+    """
+    Windowed history plus financial context under a token budget.
+
+    ``summarize(previous_summary, turns)`` folds turns that left the window
+    into the stored summary; it runs at most once per ``history_messages``
+    new messages.
+    """
+
+    def __init__(self, conversation, history_messages: Optional[int] = None,
+                 token_budget: Optional[int] = None, summarize: Optional[Callable] = None):
+        ai_config = getattr(settings, 'AI_CONFIG', {})
+        self.conversation = conversation
+        self.history_messages = history_messages or ai_config.get('max_context_length', DEFAULT_HISTORY_MESSAGES)
+        self.token_budget = token_budget or ai_config.get('prompt_token_budget', DEFAULT_TOKEN_BUDGET)
+        self.summarize = summarize or extractive_summary
+
+    def recent_messages(self, exclude_id=None) -> List:
+        """
+        Messages newer than the summary, newest last. At most two windows are
+        loaded: one to send verbatim and one that is ready to fold.
+        """
+        messages = self.conversation.messages.filter(role__in=['user', 'assistant'])
+        if self.conversation.summary_through:
+            messages = messages.filter(created_at__gt=self.conversation.summary_through)
+        if exclude_id is not None:
+            messages = messages.exclude(id=exclude_id)
+        latest = list(
+            messages.order_by('-created_at').only('role', 'content', 'created_at')[:2 * self.history_messages]
+        )
+        latest.reverse()
+        return latest
+
+    def fold(self, messages: List) -> List:
+        """
+        Fold everything before the verbatim window into the summary once a
+        full window has accumulated; return the messages to send verbatim.
+        """
+        if len(messages) < 2 * self.history_messages:
+            return messages
+
+        folded, kept = messages[:-self.history_messages], messages[-self.history_messages:]
+        turns = [format_turn(message.role, message.content) for message in folded]
+        try:
+            summary = self.summarize(self.conversation.summary, turns)
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {e}")
+            summary = extractive_summary(self.conversation.summary, turns)
+
+        self.conversation.summary = truncate_to_tokens(summary, SUMMARY_MAX_TOKENS, keep='tail')
+        self.conversation.summary_through = folded[-1].created_at
+        self.conversation.summarized_message_count += len(folded)
+        self.conversation.save(update_fields=[
+            'summary', 'summary_through', 'summarized_message_count', 'updated_at'
+        ])
+        return kept
+
+    def assemble(self, user_message: str, financial_context: str, exclude_id=None) -> AssembledPrompt:
+        """
+        Build the context and history blocks for ``user_message``.
+
+        Budget order: the question is always kept, then the financial context
+        (up to half the budget), then the newest verbatim turns, then the
+        summary with whatever room is left.
+        """
+        messages = self.fold(self.recent_messages(exclude_id))
+
+        available = self.token_budget - PROMPT_OVERHEAD_TOKENS - estimate_tokens(user_message)
+        context = truncate_to_tokens(financial_context, max(available // 2, 0))
+        available -= estimate_tokens(context)
+
+        turns = []
+        for message in reversed(messages):
+            turn = format_turn(message.role, message.content)
+            cost = estimate_tokens(turn)
+            if cost > available:
+                break
+            turns.append(turn)
+            available -= cost
+        turns.reverse()
+
+        summary = truncate_to_tokens(self.conversation.summary, available, keep='tail')
+
+        sections = []
+        if summary:
+            sections.append(f"Summary of earlier conversation:\n{summary}")
+        if turns:
+            sections.append("Recent conversation:\n" + '\n'.join(turns))
+        history = '\n\n'.join(sections)
+
+        tokens = PROMPT_OVERHEAD_TOKENS + estimate_tokens(user_message) + estimate_tokens(context) + estimate_tokens(history)
+        return AssembledPrompt(context, history, tokens)
@@ -2,9 +2,10 @@
 AI app signals for FinSight Backend
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import AIConversation, AIMessage
+from .categorization import reset_categorization_engine
+from .models import AIConversation, AIMessage, ExpenseCategory
 
 @receiver(post_save, sender=AIMessage)
 def ai_message_created(sender, instance, created, **kwargs):
@@ -21,3 +22,12 @@ def ai_message_created(sender, instance, created, **kwargs):
         # - Triggering analytics
         # - Caching responses
         pass
+
+
+@receiver(post_save, sender=ExpenseCategory)
+@receiver(post_delete, sender=ExpenseCategory)
+def expense_category_changed(sender, instance, **kwargs):
+    """
+    Signal handler for categorization rule changes
+    """
+    reset_categorization_engine()
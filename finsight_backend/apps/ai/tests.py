@@ -0,0 +1,628 @@
+from django.test import SimpleTestCase, TestCase
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient
+from decimal import Decimal
+import asyncio
+import json
+import re
+import time
+from unittest import mock
+
+from apps.ai.cache import AIResponseCache, get_response_cache
+from apps.ai.categorization import (
+    CATEGORY_SLUGS, SEED_KEYWORDS, BatchCategorizer, CategorizationEngine, KeywordMatcher, NaiveBayesClassifier
+)
+from apps.ai.client import (
+    AIClientError, FakeBackend, GeminiClient, get_gemini_client, set_gemini_client
+)
+from apps.ai.models import AIConversation, AIMessage
+from apps.ai.prompting import PromptAssembler, estimate_tokens
+from apps.ai.services import FinancialContextBuilder, GeminiAIService
+from apps.ai.views_simple import GENERAL_CONTEXT
+from apps.core.models import User, Account, Category, Transaction, Budget, Goal
+from apps.core.services import FinancialDataVersion
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from datetime import timedelta
+
+
+class GeminiClientTests(SimpleTestCase):
+    """Shared client behaviour against the offline fake backend"""
+
+    def setUp(self):
+        self.backend = FakeBackend(latency=0.02, response='ok')
+        self.client = GeminiClient(self.backend, max_concurrency=4, timeout=1, backoff_base=0.001)
+        self.previous = set_gemini_client(self.client)
+        cache.clear()
+        get_response_cache().clear_local()
+
+    def tearDown(self):
+        set_gemini_client(self.previous)
+
+    def test_services_share_one_client(self):
+        self.assertIs(GeminiAIService().client, GeminiAIService().client)
+        self.assertIs(get_gemini_client(), self.client)
+
+    def test_retries_transient_failures(self):
+        self.backend.failures = 2
+        self.assertEqual(self.client.generate('hello'), 'ok')
+        self.assertEqual(self.backend.calls, 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.backend.failures = 10
+        with self.assertRaises(AIClientError):
+            self.client.generate('hello')
+        self.assertEqual(self.backend.calls, self.client.max_retries + 1)
+
+    def test_async_timeout_is_enforced(self):
+        self.backend.latency = 0.5
+        self.client.timeout = 0.05
+        self.client.max_retries = 0
+        with self.assertRaises(AIClientError):
+            asyncio.run(self.client.agenerate('slow'))
+
+    def test_async_concurrency_is_bounded(self):
+        async def burst():
+            return await asyncio.gather(*[self.client.agenerate(f'q{i}') for i in range(20)])
+
+        started = time.perf_counter()
+        results = asyncio.run(burst())
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(results, ['ok'] * 20)
+        self.assertEqual(self.backend.max_in_flight, 4)
+        # 20 calls of 20ms through 4 slots is 5 waves, not 20 sequential calls
+        self.assertLess(elapsed, 20 * self.backend.latency)
+
+    def test_async_financial_response(self):
+        response = asyncio.run(
+            GeminiAIService().agenerate_financial_response('Can I save more?', 'Income: $100')
+        )
+        self.assertEqual(response, 'ok')
+
+
+class StreamingTests(SimpleTestCase):
+    """Streaming delivers the first chunk long before the full response"""
+
+    def setUp(self):
+        self.backend = FakeBackend(latency=0.2, response='You can save $150 a month by trimming dining out.',
+                                   chunk_count=10)
+        self.client = GeminiClient(self.backend, timeout=1, backoff_base=0.001)
+        self.previous = set_gemini_client(self.client)
+        cache.clear()
+        get_response_cache().clear_local()
+
+    def tearDown(self):
+        set_gemini_client(self.previous)
+
+    def test_stream_reassembles_full_response(self):
+        self.assertEqual(''.join(self.client.stream('hi')), self.backend.response)
+        chunks = asyncio.run(self.collect(self.client.astream('hi')))
+        self.assertEqual(''.join(chunks), self.backend.response)
+        self.assertGreater(len(chunks), 1)
+
+    def test_retries_before_first_chunk(self):
+        self.backend.failures = 1
+        chunks = asyncio.run(self.collect(self.client.astream('hi')))
+        self.assertEqual(''.join(chunks), self.backend.response)
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_time_to_first_chunk_benchmark(self):
+        service = GeminiAIService()
+
+        started = time.perf_counter()
+        asyncio.run(service.agenerate_financial_response('Can I save more?', 'Income: $100'))
+        full_response = time.perf_counter() - started
+
+        async def first_chunk():
+            started = time.perf_counter()
+            stream = service.astream_financial_response('Can I save more?', 'Income: $100')
+            await stream.__anext__()
+            elapsed = time.perf_counter() - started
+            await stream.aclose()
+            return elapsed
+
+        time_to_first_chunk = asyncio.run(first_chunk())
+
+        # The first of 10 evenly paced chunks arrives after ~1/10 of the latency
+        self.assertLess(time_to_first_chunk, full_response / 3)
+
+    def test_failure_after_first_chunk_is_raised(self):
+        class BrokenBackend(FakeBackend):
+            async def astream(self, *args, **kwargs):
+                yield 'You can save '
+                raise ConnectionError('reset by peer')
+
+        set_gemini_client(GeminiClient(BrokenBackend(), timeout=1, backoff_base=0.001))
+        chunks = []
+
+        async def consume():
+            async for chunk in GeminiAIService().astream_financial_response('Can I save more?', 'Income: $100'):
+                chunks.append(chunk)
+
+        with self.assertRaises(AIClientError):
+            asyncio.run(consume())
+        self.assertEqual(chunks, ['You can save '])
+
+    def test_failure_before_first_chunk_yields_fallback(self):
+        self.backend.failures = 10
+        chunks = asyncio.run(self.collect(
+            GeminiAIService().astream_financial_response('Can I save more?', 'Income: $100')
+        ))
+        self.assertEqual(len(chunks), 1)
+        self.assertIn('trouble analyzing', chunks[0])
+
+    async def collect(self, stream):
+        return [chunk async for chunk in stream]
+
+
+class ResponseCacheTests(SimpleTestCase):
+    """Responses are cached under stable keys and retired per user"""
+
+    def setUp(self):
+        cache.clear()
+        self.backend = FakeBackend(response='Groceries')
+        self.previous = set_gemini_client(GeminiClient(self.backend))
+        self.response_cache = AIResponseCache(max_local_entries=2)
+        get_response_cache().clear_local()
+
+    def tearDown(self):
+        set_gemini_client(self.previous)
+
+    def generate(self, prompt, context='', user_id=None):
+        return self.response_cache.get_or_generate(
+            'generate_financial_response', 'model', prompt,
+            lambda: self.backend.generate('model', prompt),
+            context=context, user_id=user_id
+        )
+
+    def test_key_is_stable_and_normalized(self):
+        key = self.response_cache.make_key('categorize_expense', 'model', 'Coffee  at Starbucks')
+        self.assertEqual(key, self.response_cache.make_key('categorize_expense', 'model', 'coffee at starbucks'))
+        self.assertNotEqual(key, self.response_cache.make_key('categorize_expense', 'other', 'coffee at starbucks'))
+        self.assertNotEqual(key, self.response_cache.make_key(
+            'categorize_expense', 'model', 'coffee at starbucks', generation_config={'temperature': 0.3}
+        ))
+
+    def test_tiers_and_counters(self):
+        self.generate('hello')
+        self.generate('hello')
+        self.response_cache.clear_local()
+        self.generate('hello')
+
+        self.assertEqual(self.backend.calls, 1)
+        self.assertEqual(self.response_cache.stats, {'local_hits': 1, 'shared_hits': 1, 'misses': 1})
+
+    def test_local_tier_is_bounded(self):
+        for prompt in ('a', 'b', 'c'):
+            self.generate(prompt)
+        self.assertEqual(len(self.response_cache._local), 2)
+
+    def test_context_change_and_user_invalidation_miss(self):
+        self.generate('budget?', context='Spent $10', user_id=7)
+        self.generate('budget?', context='Spent $20', user_id=7)
+        self.assertEqual(self.backend.calls, 2)
+
+        self.response_cache.invalidate_user(7)
+        self.generate('budget?', context='Spent $20', user_id=7)
+        self.assertEqual(self.backend.calls, 3)
+
+    def test_service_caches_model_categorization(self):
+        service = GeminiAIService()
+        service.categorize_with_model('Coffee at Starbucks')
+        service.categorize_with_model('coffee at starbucks ')
+        self.assertEqual(self.backend.calls, 1)
+
+
+class CategorizationEngineTests(SimpleTestCase):
+    """Local stages answer common descriptions; the model only sees the rest"""
+
+    def setUp(self):
+        samples = [(word, category) for category, words in SEED_KEYWORDS.items() for word in words]
+        samples += [('shell oil 5523 houston', 'fuel'), ('shell oil station', 'fuel')] * 5
+        self.engine = CategorizationEngine(
+            KeywordMatcher(SEED_KEYWORDS, {'banking': [r'^fee\b']}),
+            NaiveBayesClassifier().fit(samples),
+            thresholds={'fuel': 0.5}
+        )
+        self.model_calls = []
+
+    def fallback(self, description):
+        self.model_calls.append(description)
+        return 'miscellaneous'
+
+    def test_keyword_stage(self):
+        prediction = self.engine.categorize('POS PURCHASE Starbucks #1234 Seattle', self.fallback)
+        self.assertEqual((prediction.category, prediction.source), ('food_dining', 'keyword'))
+        # Longest keyword wins
+        self.assertEqual(self.engine.categorize('UBER EATS order').category, 'food_dining')
+        self.assertEqual(self.engine.categorize('Uber trip').category, 'transportation')
+        self.assertEqual(self.engine.categorize('FEE monthly').category, 'banking')
+        self.assertEqual(self.model_calls, [])
+
+    def test_classifier_stage(self):
+        prediction = self.engine.categorize('Shel Oil 7781', self.fallback)
+        self.assertEqual((prediction.category, prediction.source), ('fuel', 'classifier'))
+        self.assertEqual(self.model_calls, [])
+
+    def test_model_fallback_below_threshold(self):
+        prediction = self.engine.categorize('Zqxv Holdings LLC', self.fallback)
+        self.assertEqual(prediction.source, 'model')
+        self.assertEqual(self.model_calls, ['Zqxv Holdings LLC'])
+
+    def test_batch_deduplicates(self):
+        predictions = self.engine.categorize_batch(
+            ['Zqxv Holdings 1001', 'ZQXV HOLDINGS 2002', 'Netflix.com'], self.fallback
+        )
+        self.assertEqual(len(self.model_calls), 1)
+        self.assertEqual(predictions[2].category, 'subscriptions')
+
+    def test_local_latency_is_sub_millisecond(self):
+        descriptions = ['Coffee at Starbucks', 'Shel Oil 7781', 'Trader Joes #552'] * 300
+        started = time.perf_counter()
+        for description in descriptions:
+            self.engine.categorize_local(description)
+        per_item = (time.perf_counter() - started) / len(descriptions)
+        self.assertLess(per_item, 0.001)
+
+
+class CategorizationTrainingTests(TestCase):
+    """The shared classifier only learns labels from the common vocabulary"""
+
+    def test_private_category_names_are_not_learned(self):
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='secret123')
+        account = Account.objects.create(user=owner, name='Checking', account_type='checking')
+        private = Category.objects.create(user=owner, name='Secret Project X', category_type='expense')
+        groceries = Category.objects.create(user=owner, name='Groceries', category_type='expense')
+        for category, description in ((private, 'Zorblax Labs'), (groceries, 'Fresh Mart')):
+            for _ in range(5):
+                Transaction.objects.create(
+                    user=owner, account=account, category=category, amount=Decimal('20.00'),
+                    transaction_type='debit', description=description, transaction_date=timezone.now()
+                )
+
+        engine = CategorizationEngine.from_database()
+        self.assertNotIn('secret_project_x', engine.classifier.class_counts)
+        self.assertTrue(set(engine.classifier.class_counts) <= set(CATEGORY_SLUGS))
+        self.assertEqual(engine.categorize_local('Fresh Mart').category, 'groceries')
+
+
+def json_categories(prompt):
+    """Fake model reply to a batch prompt: every numbered item is shopping"""
+    numbers = re.findall(r"^\s*(\d+): ", prompt, re.MULTILINE)
+    return json.dumps({number: 'shopping' for number in numbers})
+
+
+class BatchCategorizationTests(TestCase):
+    """Thousands of rows cost a few packed prompts and one bulk update"""
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear_local()
+        self.backend = FakeBackend(response=json_categories)
+        self.previous = set_gemini_client(GeminiClient(self.backend))
+        self.engine = CategorizationEngine(
+            KeywordMatcher(SEED_KEYWORDS), NaiveBayesClassifier(), thresholds={}
+        )
+        self.user = User.objects.create_user(
+            username='batch', email='batch@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+
+    def tearDown(self):
+        set_gemini_client(self.previous)
+
+    def descriptions(self, rows, merchants):
+        return [
+            f"{'STARBUCKS' if i % 2 else f'Vendor{chr(97 + i % merchants)} Corp'} #{1000 + i}"
+            for i in range(rows)
+        ]
+
+    def test_large_batch_packs_unknown_merchants(self):
+        descriptions = self.descriptions(10000, merchants=26)
+
+        started = time.perf_counter()
+        predictions = BatchCategorizer(engine=self.engine, prompt_size=10).categorize(descriptions)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(predictions), 10000)
+        self.assertEqual(predictions[1].category, 'food_dining')
+        self.assertEqual(predictions[0].category, 'shopping')
+        # Even rows cycle through 13 unknown merchants: two prompts of up to 10
+        self.assertEqual(self.backend.calls, 2)
+        self.assertLess(elapsed, 5)
+
+        # A second pass is answered from cached model results
+        BatchCategorizer(engine=self.engine, prompt_size=10).categorize(descriptions)
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_apply_updates_transactions(self):
+        groceries = Category.objects.create(user=self.user, name='Groceries', category_type='expense')
+        now = timezone.now()
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user, account=self.account, amount=Decimal('5.00'),
+                transaction_type='debit', description=description, transaction_date=now
+            )
+            for description in self.descriptions(200, merchants=3)
+        ])
+        manual = Transaction.objects.create(
+            user=self.user, account=self.account, category=groceries, amount=Decimal('9.00'),
+            transaction_type='debit', description='Starbucks beans', transaction_date=now
+        )
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/ai/categorize/batch/', {'uncategorized': True}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['processed'], 200)
+        self.assertEqual(response.data['updated'], 200)
+        self.assertEqual(
+            set(Transaction.objects.filter(ai_categorized=True).values_list('category__name', flat=True)),
+            {'Food Dining', 'Shopping'}
+        )
+        manual.refresh_from_db()
+        self.assertEqual(manual.category, groceries)
+        self.assertFalse(manual.ai_categorized)
+
+    def post(self, payload):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post('/api/ai/categorize/batch/', payload, format='json')
+
+    def debits(self, count):
+        now = timezone.now()
+        return Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user, account=self.account, amount=Decimal('5.00'), transaction_type='debit',
+                description=f'Starbucks #{i}', transaction_date=now - timedelta(minutes=i)
+            )
+            for i in range(count)
+        ])
+
+    def test_uncategorized_skips_categorized_rows_even_with_overwrite(self):
+        groceries = Category.objects.create(user=self.user, name='Groceries', category_type='expense')
+        self.debits(3)
+        manual = Transaction.objects.create(
+            user=self.user, account=self.account, category=groceries, amount=Decimal('9.00'),
+            transaction_type='debit', description='Starbucks beans', transaction_date=timezone.now()
+        )
+        response = self.post({'uncategorized': True, 'overwrite': True})
+        self.assertEqual(response.data['processed'], 3)
+        manual.refresh_from_db()
+        self.assertEqual(manual.category, groceries)
+
+    def test_transaction_batches_are_capped(self):
+        self.debits(8)
+        with mock.patch('apps.ai.views_simple.MAX_BATCH_ITEMS', 5):
+            response = self.post({'uncategorized': True})
+        self.assertEqual(response.data['processed'], 5)
+
+    def test_invalid_input_is_rejected(self):
+        self.assertEqual(self.post({'descriptions': 'Netflix.com'}).status_code, 400)
+        self.assertEqual(self.post({'transaction_ids': 'abc'}).status_code, 400)
+        self.assertEqual(self.post({'transaction_ids': ['not-a-uuid']}).status_code, 400)
+
+    def test_only_vocabulary_categories_are_created(self):
+        categories = BatchCategorizer.resolve_categories(self.user, {'secret_project_x', 'groceries'})
+        self.assertEqual(set(categories), {'groceries'})
+        self.assertEqual(
+            list(Category.objects.filter(user=self.user).values_list('name', flat=True)), ['Groceries']
+        )
+
+    def test_descriptions_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            '/api/ai/categorize/batch/', {'descriptions': ['Netflix.com', 'Netflix.com']}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['category'] for row in response.data['results']], ['subscriptions'] * 2)
+
+
+class FinancialContextTests(TestCase):
+    """Chat context is built in a few queries and reused until data changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='context', email='context@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.today = timezone.localdate()
+        for i in range(5):
+            category = Category.objects.create(user=self.user, name=f'Expense {i}', category_type='expense')
+            Transaction.objects.create(
+                user=self.user, account=self.account, category=category, amount=Decimal('15.00'),
+                transaction_type='debit', description=f'Purchase {i}', transaction_date=timezone.now()
+            )
+            Budget.objects.create(
+                user=self.user, category=category, name=f'Budget {i}', amount=Decimal('100.00'),
+                period='monthly', start_date=self.today - timedelta(days=1),
+                end_date=self.today + timedelta(days=30)
+            )
+            Goal.objects.create(
+                user=self.user, name=f'Goal {i}', goal_type='savings', target_amount=Decimal('400.00'),
+                current_amount=Decimal('100.00'), target_date=self.today + timedelta(days=90)
+            )
+
+    def test_context_is_built_once_per_data_version(self):
+        with CaptureQueriesContext(connection) as ctx:
+            context = FinancialContextBuilder.build_user_context(self.user)
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+        self.assertIn('Monthly spending so far: $75.00', context)
+        self.assertIn('Expense 0: $15.00 spent / $100.00 budget ($85.00 remaining)', context)
+        self.assertIn('Goal 0: $100.00 / $400.00 (25.0% complete)', context)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(FinancialContextBuilder.build_user_context(self.user), context)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        Goal.objects.filter(name='Goal 0').first().delete()
+        self.assertIn('Active goals: 4', FinancialContextBuilder.build_user_context(self.user))
+
+    def test_version_bump_invalidates_context(self):
+        context = FinancialContextBuilder.build_user_context(self.user)
+
+        # Queryset updates skip the model signals, so the cached context is kept
+        Goal.objects.filter(name='Goal 0').update(current_amount=Decimal('300.00'))
+        self.assertEqual(FinancialContextBuilder.build_user_context(self.user), context)
+
+        FinancialDataVersion.bump(self.user.pk)
+        self.assertIn('Goal 0: $300.00 / $400.00 (75.0% complete)', FinancialContextBuilder.build_user_context(self.user))
+
+
+class PromptAssemblerTests(TestCase):
+    """History is windowed, summarized once per window and kept within budget"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='prompting', email='prompting@example.com', password='secret123'
+        )
+        self.conversation = AIConversation.objects.create(user=self.user, title='Budgeting')
+        self.start = timezone.now()
+        self.count = 0
+
+    def add_messages(self, count, words=20):
+        for _ in range(count):
+            i = self.count
+            AIMessage.objects.create(
+                conversation=self.conversation,
+                role='user' if i % 2 == 0 else 'assistant',
+                content=f"Turn {i}. " + 'budget ' * words,
+                created_at=self.start + timedelta(seconds=i)
+            )
+            self.count += 1
+
+    def test_estimator(self):
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('abcd' * 10), 10)
+        self.assertEqual(estimate_tokens('a b c d e'), 5)
+
+    def test_older_turns_are_summarized_once_per_window(self):
+        calls = []
+
+        def summarize(previous, turns):
+            calls.append(len(turns))
+            return f"{previous} +{len(turns)}".strip()
+
+        self.add_messages(7)
+        assembler = PromptAssembler(self.conversation, history_messages=4, summarize=summarize)
+        prompt = assembler.assemble('And now?', 'Income: $100')
+        self.assertEqual(calls, [])
+        self.assertIn('Turn 6.', prompt.history)
+
+        self.add_messages(1)
+        prompt = assembler.assemble('And now?', 'Income: $100')
+        self.assertEqual(calls, [4])
+        self.assertIn('Summary of earlier conversation:\n+4', prompt.history)
+        self.assertNotIn('Turn 3.', prompt.history)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, '+4')
+        self.assertEqual(self.conversation.summarized_message_count, 4)
+        self.assertEqual(self.conversation.summary_through, self.start + timedelta(seconds=3))
+
+        # The next turns reuse the stored summary instead of re-summarizing
+        PromptAssembler(self.conversation, history_messages=4, summarize=summarize).assemble('And now?', 'Income: $100')
+        self.assertEqual(calls, [4])
+
+    def test_token_budget_keeps_newest_turns(self):
+        self.add_messages(20, words=200)
+        assembler = PromptAssembler(self.conversation, history_messages=10, token_budget=1500)
+        prompt = assembler.assemble('How am I doing?', 'Context line\n' * 400)
+
+        self.assertLessEqual(prompt.tokens, 1500)
+        self.assertIn('Turn 19.', prompt.history)
+        self.assertNotIn('Turn 10.', prompt.history)
+
+
+class ChatMessageTests(TestCase):
+    """The chat endpoint keeps signed-in conversations and sends their history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='chatter', email='chatter@example.com', password='secret123'
+        )
+        self.prompts = []
+        self.backend = FakeBackend(response=self.reply)
+        self.previous = set_gemini_client(GeminiClient(self.backend, timeout=1, backoff_base=0.001))
+        cache.clear()
+        get_response_cache().clear_local()
+
+    def tearDown(self):
+        set_gemini_client(self.previous)
+
+    def reply(self, prompt):
+        self.prompts.append(prompt)
+        return f"Reply {len(self.prompts)}."
+
+    def post(self, payload, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client.post('/api/ai/chat/', payload, format='json')
+
+    def test_conversation_history_is_sent(self):
+        first = self.post({'message': 'I spend too much on dining out.'}, self.user)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['ai_response'], 'Reply 1.')
+        conversation_id = first.data['conversation_id']
+
+        second = self.post({'message': 'How do I fix that?', 'conversation_id': conversation_id}, self.user)
+        self.assertEqual(second.data['conversation_id'], conversation_id)
+        self.assertIn('User: I spend too much on dining out.', self.prompts[1])
+        self.assertIn('Assistant: Reply 1.', self.prompts[1])
+        self.assertNotIn('User: How do I fix that?', self.prompts[1])
+
+        conversation = AIConversation.objects.get(id=conversation_id)
+        self.assertEqual(
+            list(conversation.messages.values_list('role', 'content')),
+            [('user', 'I spend too much on dining out.'), ('assistant', 'Reply 1.'),
+             ('user', 'How do I fix that?'), ('assistant', 'Reply 2.')]
+        )
+
+    def test_financial_context_is_sent(self):
+        account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        category = Category.objects.create(user=self.user, name='Dining', category_type='expense')
+        Transaction.objects.create(
+            user=self.user, account=account, category=category, amount=Decimal('42.00'),
+            transaction_type='debit', description='Bistro', transaction_date=timezone.now()
+        )
+
+        conversation_id = self.post({'message': 'How much have I spent?'}, self.user).data['conversation_id']
+        self.assertIn('Monthly spending so far: $42.00', self.prompts[0])
+        self.assertNotIn(GENERAL_CONTEXT, self.prompts[0])
+
+        # A new transaction bumps the data version, so the next message sees it
+        Transaction.objects.create(
+            user=self.user, account=account, category=category, amount=Decimal('8.00'),
+            transaction_type='debit', description='Coffee', transaction_date=timezone.now()
+        )
+        self.post({'message': 'And now?', 'conversation_id': conversation_id}, self.user)
+        self.assertIn('Monthly spending so far: $50.00', self.prompts[1])
+
+        self.post({'message': 'How much have I spent?'})
+        self.assertIn(GENERAL_CONTEXT, self.prompts[2])
+
+    def test_conversations_are_private(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='secret123')
+        conversation_id = self.post({'message': 'My rent is $900.'}, other).data['conversation_id']
+
+        response = self.post({'message': 'What is my rent?', 'conversation_id': conversation_id}, self.user)
+        self.assertNotEqual(response.data['conversation_id'], conversation_id)
+        self.assertNotIn('My rent is $900.', self.prompts[1])
+
+        response = self.post({'message': 'Hi', 'conversation_id': 'not-a-uuid'}, self.user)
+        self.assertEqual(response.status_code, 400)
+
+    def test_anonymous_messages_are_not_stored(self):
+        response = self.post({'message': 'Should I budget?'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ai_response'], 'Reply 1.')
+        self.assertNotIn('conversation_id', response.data)
+        self.assertFalse(AIConversation.objects.exists())
+
+        self.assertEqual(self.post({'message': '  '}).status_code, 400)
@@ -6,5 +6,6 @@ app_name = 'ai'
 urlpatterns = [
     path('chat/', views_simple.chat_message, name='chat_message'),
     path('categorize/', views_simple.categorize_expense, name='categorize_expense'),
+    path('categorize/batch/', views_simple.categorize_batch, name='categorize_batch'),
     path('test/', views_simple.test_ai_connection, name='test_ai_connection'),
 ]
@@ -10,6 +10,7 @@ import json
 import logging
 from apps.ai.services import GeminiAIService, FinancialContextBuilder
 from apps.ai.models import AIConversation, AIMessage, AIInsight
+from apps.ai.prompting import PromptAssembler
 from apps.transactions.models import Transaction
 import uuid
 
@@ -59,12 +60,20 @@ def chat_message(request):
             message_type='text'
         )
         
-        # Build financial context
-        financial_context = FinancialContextBuilder.build_user_context(request.user)
+        # Build financial context and windowed history within the token budget
+        ai_service = GeminiAIService()
+        prompt = PromptAssembler(
+            conversation, summarize=ai_service.summarize_conversation
+        ).assemble(
+            user_message,
+            FinancialContextBuilder.build_user_context(request.user),
+            exclude_id=user_msg.id
+        )
         
         # Generate AI response
-        ai_service = GeminiAIService()
-        ai_response = ai_service.generate_financial_response(user_message, financial_context)
+        ai_response = ai_service.generate_financial_response(
+            user_message, prompt.context, user=request.user, history=prompt.history
+        )
         
         # Save AI message
         ai_msg = AIMessage.objects.create(
@@ -156,12 +165,13 @@ def categorize_expense(request):
         
         # Use AI service to categorize
         ai_service = GeminiAIService()
-        category = ai_service.categorize_expense(description)
+        prediction = ai_service.predict_category(description)
         
         return Response({
             'description': description,
-            'category': category,
-            'confidence': 0.8  # Default confidence score
+            'category': prediction.category,
+            'confidence': round(prediction.confidence, 3),
+            'source': prediction.source
         })
         
     except Exception as e:
@@ -241,7 +251,7 @@ def financial_insights(request):
         
         # Generate insights using AI
         ai_service = GeminiAIService()
-        insights = ai_service.generate_insights(financial_data)
+        insights = ai_service.generate_insights(financial_data, user=request.user)
         
         # Save insights to database
         saved_insights = []
@@ -301,7 +311,9 @@ def quick_question(request):
         
         # Generate AI response
         ai_service = GeminiAIService()
-        response = ai_service.generate_financial_response(question, financial_context)
+        response = ai_service.generate_financial_response(
+            question, financial_context, user=request.user
+        )
         
         return Response({
             'question': question,
@@ -1,39 +1,88 @@
+from django.core.exceptions import ValidationError
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
 import json
 import logging
+from apps.ai.categorization import BatchCategorizer
+from apps.ai.models import AIConversation, AIMessage
+from apps.ai.prompting import PromptAssembler
+from apps.ai.services import FinancialContextBuilder
 from apps.ai.services_simple import GeminiAIService
+from apps.core.models import Transaction
 
 logger = logging.getLogger(__name__)
 
-@csrf_exempt
-@require_http_methods(["POST"])
+GENERAL_CONTEXT = "User is asking about personal finance through FinSight app."
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
 def chat_message(request):
-    """Handle chat messages with AI."""
+    """
+    Handle chat messages with AI.
+
+    Signed-in users chat inside a stored conversation (send
+    ``conversation_id`` to continue one); their cached financial context
+    and the conversation's summary and latest turns go with each message.
+    Anonymous callers get a one-off reply.
+    """
     try:
-        data = json.loads(request.body)
-        user_message = data.get('message', '').strip()
+        user_message = str(request.data.get('message', '')).strip()
         
         if not user_message:
-            return JsonResponse({'error': 'Message is required'}, status=400)
+            return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Generate AI response
         ai_service = GeminiAIService()
+        if not request.user.is_authenticated:
+            return Response({
+                'user_message': user_message,
+                'ai_response': ai_service.generate_financial_response(user_message, GENERAL_CONTEXT),
+                'timestamp': timezone.now().isoformat()
+            })
+        
+        # Continue the given conversation or start a new one
+        conversation = None
+        conversation_id = request.data.get('conversation_id')
+        if conversation_id:
+            try:
+                conversation = AIConversation.objects.filter(id=conversation_id, user=request.user).first()
+            except (ValidationError, ValueError):
+                return Response({'error': 'Invalid conversation_id'}, status=status.HTTP_400_BAD_REQUEST)
+        if conversation is None:
+            conversation = AIConversation.objects.create(user=request.user, title="New Chat Session")
+        
+        user_msg = AIMessage.objects.create(
+            conversation=conversation, role='user', content=user_message, message_type='text'
+        )
+        
+        # Windowed history and financial context within the token budget
+        prompt = PromptAssembler(conversation).assemble(
+            user_message, FinancialContextBuilder.build_user_context(request.user), exclude_id=user_msg.id
+        )
         ai_response = ai_service.generate_financial_response(
-            user_message, 
-            "User is asking about personal finance through FinSight app."
+            user_message, prompt.context, user=request.user, history=prompt.history
         )
         
-        return JsonResponse({
+        ai_msg = AIMessage.objects.create(
+            conversation=conversation, role='assistant', content=ai_response, message_type='text'
+        )
+        
+        return Response({
+            'conversation_id': str(conversation.id),
             'user_message': user_message,
             'ai_response': ai_response,
-            'timestamp': '2025-01-02T12:00:00Z'
+            'timestamp': ai_msg.created_at.isoformat()
         })
         
     except Exception as e:
         logger.error(f"Error in chat_message: {e}")
-        return JsonResponse({'error': 'Failed to process message'}, status=500)
+        return Response({'error': 'Failed to process message'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @csrf_exempt  
 @require_http_methods(["POST"])
@@ -47,18 +96,94 @@ def categorize_expense(request):
             return JsonResponse({'error': 'Description is required'}, status=400)
         
         ai_service = GeminiAIService()
-        category = ai_service.categorize_expense(description)
+        prediction = ai_service.predict_category(description)
         
         return JsonResponse({
             'description': description,
-            'category': category,
-            'confidence': 0.8
+            'category': prediction.category,
+            'confidence': round(prediction.confidence, 3),
+            'source': prediction.source
         })
         
     except Exception as e:
         logger.error(f"Error in categorize_expense: {e}")
         return JsonResponse({'error': 'Failed to categorize expense'}, status=500)
 
+MAX_BATCH_ITEMS = 20000
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def categorize_batch(request):
+    """
+    Categorize many expenses in one call.
+
+    Send ``descriptions`` to get predictions back, or ``transaction_ids`` /
+    ``uncategorized: true`` to categorize and save the user's transactions
+    (``overwrite: true`` also replaces categories the user picked).
+    """
+    try:
+        data = request.data
+        descriptions = data.get('descriptions')
+        transaction_ids = data.get('transaction_ids')
+        
+        if descriptions is None and transaction_ids is None and not data.get('uncategorized'):
+            return Response(
+                {'error': 'Provide descriptions, transaction_ids or uncategorized'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        for name, value in (('descriptions', descriptions), ('transaction_ids', transaction_ids)):
+            if value is not None and not isinstance(value, list):
+                return Response(
+                    {'error': f'{name} must be a list'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        if len(descriptions or transaction_ids or []) > MAX_BATCH_ITEMS:
+            return Response(
+                {'error': f'At most {MAX_BATCH_ITEMS} items per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        categorizer = BatchCategorizer()
+        
+        if descriptions is not None:
+            descriptions = [str(description) for description in descriptions]
+            predictions = categorizer.categorize(descriptions)
+            return Response({
+                'results': [
+                    {
+                        'description': description,
+                        'category': prediction.category,
+                        'confidence': round(prediction.confidence, 3),
+                        'source': prediction.source
+                    }
+                    for description, prediction in zip(descriptions, predictions)
+                ]
+            })
+        
+        queryset = Transaction.objects.filter(transaction_type='debit')
+        if transaction_ids is not None:
+            try:
+                queryset = queryset.filter(id__in=transaction_ids)
+            except (ValidationError, ValueError):
+                return Response(
+                    {'error': 'transaction_ids must be transaction UUIDs'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        if data.get('uncategorized'):
+            queryset = queryset.filter(category__isnull=True)
+        summary = categorizer.apply_to_transactions(
+            request.user, queryset, overwrite=bool(data.get('overwrite')), limit=MAX_BATCH_ITEMS
+        )
+        return Response(summary)
+        
+    except Exception as e:
+        logger.error(f"Error in categorize_batch: {e}")
+        return Response(
+            {'error': 'Failed to categorize expenses'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @require_http_methods(["GET"])
 def test_ai_connection(request):
     """Test endpoint to verify AI service is working."""
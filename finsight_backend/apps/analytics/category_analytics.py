@@ -0,0 +1,230 @@
+# Analytics Categories - Per-category monthly analytics
+"""
+Materialize ``CategoryAnalytics`` rows, one per (user, category, month) with
+spending in it.
+
+A month is computed for all users with a few grouped queries:
+
+- debit totals, counts and the latest ``updated_at`` per (user, category)
+  for the month and the one before it,
+- the month's share of every budget that overlaps it,
+- the most frequent merchant, the peak weekday and the peak hour of each
+  category, each ranked inside the database with a ``ROW_NUMBER()`` window
+  partitioned by (user, category).
+
+Rows are upserted in bulk on (user, category, month).
+
+Runs are incremental. The first grouped query is compared with the stored
+rows. A category is recomputed only when its totals, its previous month's
+total or its budget no longer match, or when one of its transactions was
+written after its row. Late or edited transactions in a past month
+therefore refresh only the categories they touch. Rows whose category
+has no spending left in the month are removed.
+"""
+from datetime import time, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Max, Sum, Window
+from django.db.models.functions import ExtractHour, ExtractWeekDay, RowNumber, TruncMonth
+
+from apps.core.models import Budget, Transaction
+from apps.core.services import month_window, rollup_month
+
+from .models import CategoryAnalytics
+
+# Categories whose detail queries share one IN list
+CHUNK_SIZE = 500
+
+# ExtractWeekDay numbers days from 1 = Sunday
+WEEKDAYS = ('Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+UPDATE_FIELDS = [
+    'total_spent', 'transaction_count', 'average_transaction_amount', 'previous_month_spent',
+    'percentage_change', 'budgeted_amount', 'budget_variance', 'most_frequent_merchant',
+    'merchant_frequency_count', 'peak_spending_day', 'peak_spending_time', 'trend_data', 'updated_at',
+]
+
+
+def ranked_first(queryset, group, order):
+    """
+    The top row of ``queryset`` (already grouped by user, category and
+    ``group``) within each (user, category), ranked by ``order``
+    """
+    return queryset.annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=[F('user_id'), F('category_id')],
+            order_by=[order, F(group).asc()],
+        )
+    ).filter(rank=1)
+
+
+class CategoryAnalyticsMaterializer:
+    """Compute and store category analytics for one month"""
+
+    def __init__(self, month, full=False, users=None):
+        self.month = rollup_month(month)
+        self.previous = self.month - relativedelta(months=1)
+        self.start, self.end = month_window(self.month)
+        self.full = full
+        self.users = users
+
+    def debits(self, start, end):
+        transactions = Transaction.objects.filter(
+            transaction_type='debit', category__isnull=False, transaction_date__gte=start, transaction_date__lt=end
+        )
+        if self.users is not None:
+            transactions = transactions.filter(user__in=self.users)
+        return transactions.order_by()
+
+    def run(self):
+        """Bring the month's rows up to date; return what changed"""
+        totals = self.totals()
+        budgets = self.budgets()
+        current = {key: value for key, value in totals.items() if key[2] == self.month}
+        previous = {key[:2]: value for key, value in totals.items() if key[2] == self.previous}
+
+        stored = CategoryAnalytics.objects.filter(analysis_month=self.month)
+        if self.users is not None:
+            stored = stored.filter(user__in=self.users)
+        stored = {
+            (user_id, category_id): row
+            for user_id, category_id, *row in stored.values_list(
+                'user_id', 'category_id', 'total_spent', 'transaction_count', 'previous_month_spent',
+                'budgeted_amount', 'updated_at',
+            )
+        }
+
+        rows = {}
+        for (user_id, category_id, _), (spent, count, changed_at) in current.items():
+            key = (user_id, category_id)
+            prior = previous.get(key, (ZERO, 0, None))
+            budgeted = budgets.get(key)
+            existing = stored.get(key)
+            if existing is not None and not self.full:
+                total, stored_count, stored_previous, stored_budget, updated_at = existing
+                if (total, stored_count, stored_previous, stored_budget) == (spent, count, prior[0], budgeted) \
+                        and changed_at <= updated_at:
+                    continue
+            rows[key] = self.summary(spent, count, prior, budgeted)
+
+        removed = [key for key in stored if (key[0], key[1], self.month) not in current]
+        self.details(rows)
+        self.write(rows, removed)
+        return {'categories': len(current), 'updated': len(rows), 'removed': len(removed)}
+
+    def totals(self):
+        """``{(user, category, month): (spent, count, last_written)}`` for this month and the previous one"""
+        start = month_window(self.previous)[0]
+        grouped = self.debits(start, self.end).annotate(bucket=TruncMonth('transaction_date')).values_list(
+            'user_id', 'category_id', 'bucket'
+        ).annotate(spent=Sum('amount'), count=Count('id'), changed_at=Max('updated_at'))
+        return {
+            (user_id, category_id, rollup_month(bucket)): (spent, count, changed_at)
+            for user_id, category_id, bucket, spent, count, changed_at in grouped
+        }
+
+    def budgets(self):
+        """``{(user, category): amount}`` with each overlapping budget prorated to the month's days"""
+        last_day = self.end_date()
+        budgets = Budget.objects.filter(
+            is_active=True, start_date__lte=last_day, end_date__gte=self.month
+        )
+        if self.users is not None:
+            budgets = budgets.filter(user__in=self.users)
+        amounts = {}
+        for user_id, category_id, amount, start_date, end_date in budgets.values_list(
+            'user_id', 'category_id', 'amount', 'start_date', 'end_date'
+        ):
+            overlap = (min(end_date, last_day) - max(start_date, self.month)).days + 1
+            length = (end_date - start_date).days + 1
+            share = amount * overlap / length
+            key = (user_id, category_id)
+            amounts[key] = amounts.get(key, ZERO) + share
+        return {key: amount.quantize(CENT) for key, amount in amounts.items()}
+
+    def end_date(self):
+        return self.month + relativedelta(months=1) - timedelta(days=1)
+
+    @staticmethod
+    def summary(spent, count, prior, budgeted):
+        previous_spent, previous_count, _ = prior
+        change = ZERO
+        if previous_spent:
+            change = ((spent - previous_spent) / previous_spent * 100).quantize(CENT)
+        return {
+            'total_spent': spent,
+            'transaction_count': count,
+            'average_transaction_amount': (spent / count).quantize(CENT),
+            'previous_month_spent': previous_spent,
+            'percentage_change': change,
+            'budgeted_amount': budgeted,
+            'budget_variance': None if budgeted is None else spent - budgeted,
+            'most_frequent_merchant': '',
+            'merchant_frequency_count': 0,
+            'peak_spending_day': '',
+            'peak_spending_time': None,
+            'trend_data': {'previous_month_count': previous_count},
+        }
+
+    def details(self, rows):
+        """Fill merchant and timing fields of ``rows`` with ranked queries, a chunk of categories at a time"""
+        categories = [category_id for _, category_id in rows]
+        for offset in range(0, len(categories), CHUNK_SIZE):
+            # Category ids are unique across users, so they alone pick the rows
+            transactions = self.debits(self.start, self.end).filter(
+                category_id__in=categories[offset:offset + CHUNK_SIZE]
+            )
+
+            merchants = ranked_first(
+                transactions.exclude(merchant_name='').values('user_id', 'category_id', 'merchant_name')
+                .annotate(visits=Count('id')),
+                'merchant_name', Count('id').desc(),
+            ).values_list('user_id', 'category_id', 'merchant_name', 'visits')
+            for user_id, category_id, merchant, visits in merchants:
+                row = rows[(user_id, category_id)]
+                row['most_frequent_merchant'] = merchant
+                row['merchant_frequency_count'] = visits
+
+            weekdays = ranked_first(
+                transactions.annotate(weekday=ExtractWeekDay('transaction_date'))
+                .values('user_id', 'category_id', 'weekday').annotate(spent=Sum('amount')),
+                'weekday', Sum('amount').desc(),
+            ).values_list('user_id', 'category_id', 'weekday', 'spent')
+            for user_id, category_id, weekday, spent in weekdays:
+                row = rows[(user_id, category_id)]
+                row['peak_spending_day'] = WEEKDAYS[weekday - 1]
+                row['trend_data']['peak_day_spent'] = str(spent)
+
+            hours = ranked_first(
+                transactions.annotate(hour=ExtractHour('transaction_date'))
+                .values('user_id', 'category_id', 'hour').annotate(spent=Sum('amount')),
+                'hour', Sum('amount').desc(),
+            ).values_list('user_id', 'category_id', 'hour', 'spent')
+            for user_id, category_id, hour, spent in hours:
+                row = rows[(user_id, category_id)]
+                row['peak_spending_time'] = time(hour)
+                row['trend_data']['peak_hour_spent'] = str(spent)
+
+    def write(self, rows, removed):
+        """Upsert ``rows`` and delete the rows of ``removed`` categories"""
+        with db_transaction.atomic():
+            if removed:
+                CategoryAnalytics.objects.filter(
+                    analysis_month=self.month, category_id__in=[category_id for _, category_id in removed]
+                ).delete()
+            CategoryAnalytics.objects.bulk_create(
+                [
+                    CategoryAnalytics(user_id=user_id, category_id=category_id, analysis_month=self.month, **values)
+                    for (user_id, category_id), values in rows.items()
+                ],
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['user', 'category', 'analysis_month'],
+                update_fields=UPDATE_FIELDS,
+            )
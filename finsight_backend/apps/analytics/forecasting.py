@@ -0,0 +1,367 @@
+# Analytics Forecasting - Cash-flow forecasting engine
+"""
+Forecast a user's income, expenses, net cash flow and per-category spending.
+
+The daily history is read with one grouped query (day x category x type)
+and laid out as a matrix with one row per series:
+
+- row 0 income (credits), row 1 expenses (debits), row 2 net flow,
+- one row per category with the debits booked to it.
+
+Two models are fitted to every row at once with NumPy:
+
+- seasonal naive: each weekday repeats its last value,
+- exponential smoothing of the level on weekday-adjusted values, with the
+  smoothing factor picked per series from a small grid.
+
+Each series uses the model with the lower one-step error, and the error
+spread gives the prediction intervals of the 30/60/90-day totals.
+
+The fitted state is cached per user. A request on the same day with the
+same data version returns the cached forecast; a later day rolls the state
+forward over the new days only. When the user's data version changes, one
+aggregate over the fitted days (count, sum and latest ``updated_at``) is
+compared with the one recorded at fit time: writes that only touch days
+after the fitted ones (today's transactions, most commonly) keep the
+state, anything else refits from scratch.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.core.models import Category, Transaction
+from apps.core.services import FinancialDataVersion
+
+HORIZONS = (30, 60, 90)
+
+# Days of history the models are fitted on
+HISTORY_DAYS = 365
+
+# Smoothing factors tried for every series
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5])
+
+# Two-sided 90% normal interval
+INTERVAL_Z = 1.645
+
+# Longest gap rolled forward incrementally before refitting instead
+MAX_ROLL_DAYS = 60
+
+STATE_TTL = 7 * 24 * 3600
+
+INCOME, EXPENSES, NET = 0, 1, 2
+TOTAL_SERIES = 3
+
+
+def weekdays(first, count):
+    """Weekday (0 = Monday) of ``count`` consecutive day ordinals from ``first``"""
+    return (np.arange(first, first + count) - 1) % 7
+
+
+def fit(values, first):
+    """
+    Fit both models to ``values`` (series x days) whose first column is
+    day ordinal ``first``; return the state as a dict of arrays.
+    """
+    series, days = values.shape
+    week = weekdays(first, days)
+    onehot = np.eye(7)[week]
+    seen = np.maximum(onehot.sum(axis=0), 1)
+    profile = values @ onehot / seen
+    profile -= profile.mean(axis=1, keepdims=True)
+    adjusted = values - profile[:, week]
+
+    # Exponential smoothing for every (series, alpha) pair at once
+    level = np.repeat(adjusted[:, :1], len(ALPHAS), axis=1)
+    sse = np.zeros_like(level)
+    for t in range(1, days):
+        error = adjusted[:, t, None] - level
+        sse += error ** 2
+        level += ALPHAS * error
+    best = sse.argmin(axis=1)
+    rows = np.arange(series)
+
+    # Seasonal naive needs a full week before its first prediction
+    if days > 7:
+        naive_sse = ((values[:, 7:] - values[:, :-7]) ** 2).sum(axis=1) * (days - 1) / (days - 7)
+    else:
+        naive_sse = np.full(series, np.inf)
+    last_week = np.zeros((series, 7))
+    tail = min(days, 7)
+    last_week[:, week[-tail:]] = values[:, -tail:]
+
+    return {
+        'through': first + days - 1,
+        'observed': days - 1,
+        'profile': profile,
+        'alpha': ALPHAS[best],
+        'level': level[rows, best],
+        'sse': sse[rows, best],
+        'last_week': last_week,
+        'naive_sse': naive_sse,
+    }
+
+
+def roll(state, values):
+    """Advance ``state`` over the following days in ``values`` (series x days)"""
+    week = weekdays(state['through'] + 1, values.shape[1])
+    for t, weekday in enumerate(week):
+        observed = values[:, t]
+        error = observed - state['profile'][:, weekday] - state['level']
+        state['sse'] += error ** 2
+        state['level'] += state['alpha'] * error
+        state['naive_sse'] += (observed - state['last_week'][:, weekday]) ** 2
+        state['last_week'][:, weekday] = observed
+    state['through'] += values.shape[1]
+    state['observed'] += values.shape[1]
+    return state
+
+
+def predict(state, first, days):
+    """
+    Daily forecasts from day ordinal ``first`` for ``days`` days and the
+    standard deviation of each horizon total, for every series.
+    """
+    ahead = np.arange(first - state['through'], first - state['through'] + days)
+    week = weekdays(first, days)
+    smoothing = state['level'][:, None] + state['profile'][:, week]
+    naive = state['last_week'][:, week]
+    observed = max(state['observed'], 1)
+    use_naive = state['naive_sse'] < state['sse']
+    sigma = np.sqrt(np.where(use_naive, state['naive_sse'], state['sse']) / observed)
+    path = np.where(use_naive[:, None], naive, smoothing)
+
+    # Variance of a horizon total: smoothing errors carry over into every
+    # later day; a seasonal naive day k weeks ahead has k days of error
+    smoothing_var = np.cumsum((1 + state['alpha'][:, None] * (ahead[None, :] - 1)) ** 2, axis=1)
+    naive_var = np.cumsum(np.ceil(ahead / 7))[None, :]
+    spread = sigma[:, None] * np.sqrt(np.where(use_naive[:, None], naive_var, smoothing_var))
+    return path, spread, use_naive
+
+
+class CashFlowForecaster:
+    """Forecast one user's cash flow with a cached, incrementally updated fit"""
+
+    def __init__(self, user, today=None):
+        self.user = user
+        self.today = today or timezone.localdate()
+
+    @staticmethod
+    def state_key(user_id):
+        return f"cash_flow_forecast:{user_id}"
+
+    def moment(self, day):
+        return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+    def transactions(self, start, end):
+        return Transaction.objects.filter(
+            user=self.user,
+            transaction_date__gte=self.moment(start),
+            transaction_date__lt=self.moment(end),
+        )
+
+    def daily_totals(self, start, end):
+        """
+        ``(day, category_id, type, total, count, last_written)`` for days in
+        ``[start, end)``, one query
+        """
+        return list(
+            self.transactions(start, end).annotate(
+                day=TruncDate('transaction_date')
+            ).values_list(
+                'day', 'category_id', 'transaction_type'
+            ).annotate(
+                total=Sum('amount'), count=Count('id'), last_written=Max('updated_at')
+            ).order_by()
+        )
+
+    @staticmethod
+    def fingerprint(rows, previous=(0, 0, None)):
+        """``(count, total, last_written)`` of the fitted days, extended by ``rows``"""
+        count, total, last_written = previous
+        for *_, amount, rows_count, written in rows:
+            count += rows_count
+            total += amount
+            last_written = written if last_written is None else max(last_written, written)
+        return count, total, last_written
+
+    def history_unchanged(self, cached):
+        """True when no write touched the fitted days since the state was stored"""
+        start = datetime.fromordinal(cached['since']).date()
+        end = datetime.fromordinal(cached['model']['through'] + 1).date()
+        stored = self.transactions(start, end).aggregate(
+            count=Count('id'), total=Sum('amount'), last_written=Max('updated_at')
+        )
+        return (stored['count'], stored['total'] or 0, stored['last_written']) == cached['fingerprint']
+
+    @staticmethod
+    def matrix(rows, first, days, category_rows):
+        """Lay grouped rows out as a (series x days) matrix starting at ``first``"""
+        values = np.zeros((TOTAL_SERIES + len(category_rows), days))
+        series, columns, amounts = [], [], []
+        for day, category_id, transaction_type, total, *_ in rows:
+            column = day.toordinal() - first
+            amount = float(total)
+            if transaction_type == 'credit':
+                series += [INCOME, NET]
+                amounts += [amount, amount]
+                columns += [column, column]
+            elif transaction_type == 'debit':
+                series += [EXPENSES, NET]
+                amounts += [amount, -amount]
+                columns += [column, column]
+                if category_id in category_rows:
+                    series.append(category_rows[category_id])
+                    amounts.append(amount)
+                    columns.append(column)
+        np.add.at(values, (np.array(series, dtype=int), np.array(columns, dtype=int)), amounts)
+        return values
+
+    def refit(self, version):
+        """Fit the models on the full history window"""
+        yesterday = self.today - timedelta(days=1)
+        since = self.today - timedelta(days=HISTORY_DAYS)
+        rows = self.daily_totals(since, self.today)
+        categories = list(Category.objects.filter(user=self.user).values('id', 'name', 'icon', 'color'))
+        spent = {category_id for _, category_id, transaction_type, *_ in rows if transaction_type == 'debit'}
+        categories = [category for category in categories if category['id'] in spent]
+        category_rows = {category['id']: TOTAL_SERIES + i for i, category in enumerate(categories)}
+
+        first = min((row[0] for row in rows), default=yesterday).toordinal()
+        days = yesterday.toordinal() - first + 1
+        state = fit(self.matrix(rows, first, days, category_rows), first) if days > 0 else None
+        return {
+            'version': version,
+            'categories': categories,
+            'category_rows': category_rows,
+            'history_days': max(days, 0),
+            'model': state,
+            'since': since.toordinal(),
+            'fingerprint': self.fingerprint(rows),
+        }
+
+    def update(self, cached):
+        """
+        Roll the cached fit forward to yesterday; None when the new days
+        spend in a category the fit has no series for
+        """
+        state = cached['model']
+        start = datetime.fromordinal(state['through'] + 1).date()
+        rows = self.daily_totals(start, self.today)
+        if any(
+            transaction_type == 'debit' and category_id is not None and category_id not in cached['category_rows']
+            for _, category_id, transaction_type, *_ in rows
+        ):
+            return None
+        days = self.today.toordinal() - state['through'] - 1
+        roll(state, self.matrix(rows, state['through'] + 1, days, cached['category_rows']))
+        cached['history_days'] += days
+        cached['fingerprint'] = self.fingerprint(rows, cached['fingerprint'])
+        return cached
+
+    def state(self):
+        """Current fitted state, kept, rolled forward or refitted as needed"""
+        version = FinancialDataVersion.current(self.user.pk)
+        cached = cache.get(self.state_key(self.user.pk))
+        if cached is not None and 'fingerprint' not in cached:
+            cached = None  # Stored before fingerprints were kept
+        changed = False
+        if cached is not None and cached['model'] is not None and cached['version'] != version:
+            if self.history_unchanged(cached):
+                # Only days after the fit were written; they are rolled in when they pass
+                cached['version'] = version
+                changed = True
+            else:
+                cached = None
+        if cached is None or cached['model'] is None or cached['version'] != version:
+            return self.refit(version), True
+
+        gap = self.today.toordinal() - 1 - cached['model']['through']
+        if gap == 0:
+            return cached, changed
+        if 0 < gap <= MAX_ROLL_DAYS:
+            cached = self.update(cached) or self.refit(version)
+        else:
+            cached = self.refit(version)
+        cached.pop('result', None)
+        return cached, True
+
+    def forecast(self):
+        """30/60/90-day forecasts with intervals; cached until the day or the data changes"""
+        cached, changed = self.state()
+        result = cached.get('result')
+        if result is None or result['generated_for'] != self.today.isoformat():
+            result = self.summarize(cached)
+            cached['result'] = result
+            changed = True
+        if changed:
+            cache.set(self.state_key(self.user.pk), cached, STATE_TTL)
+        return result
+
+    def summarize(self, cached):
+        result = {
+            'generated_for': self.today.isoformat(),
+            'history_days': cached['history_days'],
+            'horizons': [],
+            'months': [],
+            'categories': [],
+        }
+        state = cached['model']
+        if state is None:
+            return result
+
+        path, spread, use_naive = predict(state, self.today.toordinal(), max(HORIZONS))
+        totals = np.cumsum(path, axis=1)
+
+        def interval(row, days):
+            expected = totals[row, days - 1]
+            margin = INTERVAL_Z * spread[row, days - 1]
+            band = np.array([expected, expected - margin, expected + margin])
+            if row != NET:
+                band = np.maximum(band, 0)
+            return dict(zip(('expected', 'lower', 'upper'), (round(float(value), 2) for value in band)))
+
+        for days in HORIZONS:
+            result['horizons'].append({
+                'days': days,
+                'income': interval(INCOME, days),
+                'expenses': interval(EXPENSES, days),
+                'net': interval(NET, days),
+            })
+
+        # Consecutive 30-day windows for month-by-month projections
+        windows = np.add.reduceat(path[:NET], np.arange(0, max(HORIZONS), 30), axis=1)
+        for month in range(windows.shape[1]):
+            result['months'].append({
+                'month': month + 1,
+                'income': round(max(float(windows[INCOME, month]), 0.0), 2),
+                'expenses': round(max(float(windows[EXPENSES, month]), 0.0), 2),
+            })
+
+        for category in cached['categories']:
+            row = cached['category_rows'][category['id']]
+            result['categories'].append({
+                'category_id': str(category['id']),
+                'category': category['name'],
+                'icon': category['icon'],
+                'color': category['color'],
+                'model': 'seasonal_naive' if use_naive[row] else 'exponential_smoothing',
+                'horizons': {str(days): interval(row, days) for days in HORIZONS},
+            })
+        result['categories'].sort(key=lambda item: item['horizons']['30']['expected'], reverse=True)
+        return result
+
+
+def forecast_confidence(band):
+    """High/Medium/Low label from the width of an interval relative to its value"""
+    if band['expected'] <= 0:
+        return 'Low'
+    width = (band['upper'] - band['lower']) / band['expected']
+    if width <= 0.5:
+        return 'High'
+    if width <= 1.0:
+        return 'Medium'
+    return 'Low'
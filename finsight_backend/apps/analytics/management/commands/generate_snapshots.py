@@ -0,0 +1,35 @@
+# Management Command - Write daily to yearly financial snapshots
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+
+from apps.core.models import User
+from apps.analytics.snapshots import SnapshotGenerator, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Generate financial snapshots of every period type, resuming after the last daily snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only snapshot this user email')
+        parser.add_argument('--until', help='Last day to snapshot (YYYY-MM-DD) instead of yesterday')
+        parser.add_argument('--full', action='store_true', help='Rebuild the whole history instead of resuming')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users per batch')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        until = None
+        if options['until']:
+            try:
+                until = datetime.strptime(options['until'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Date must be given as YYYY-MM-DD')
+
+        report = SnapshotGenerator(until=until, full=options['full'], batch_size=options['batch_size']).run(users)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {report['snapshots']} snapshots for {report['users']} users in {report['batches']} batches"
+        ))
@@ -0,0 +1,43 @@
+# Management Command - Materialize per-category monthly analytics
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.utils import timezone
+
+from apps.core.models import User
+from apps.analytics.category_analytics import CategoryAnalyticsMaterializer
+
+
+class Command(BaseCommand):
+    help = 'Update category analytics for recent months, recomputing only categories whose data changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Only this month (YYYY-MM)')
+        parser.add_argument('--months', type=int, default=3, help='Months to update, ending with the current one')
+        parser.add_argument('--user', help='Only update this user email')
+        parser.add_argument('--full', action='store_true', help='Recompute every category, changed or not')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['user']:
+            users = User.objects.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        if options['month']:
+            try:
+                months = [datetime.strptime(options['month'], '%Y-%m').date()]
+            except ValueError:
+                raise CommandError('Month must be given as YYYY-MM')
+        else:
+            current = timezone.localdate().replace(day=1)
+            # Oldest first so each month compares against an updated previous one
+            months = [current - relativedelta(months=offset) for offset in range(options['months'] - 1, -1, -1)]
+
+        for month in months:
+            report = CategoryAnalyticsMaterializer(month, full=options['full'], users=users).run()
+            self.stdout.write(self.style.SUCCESS(
+                f"{month:%Y-%m}: updated {report['updated']} of {report['categories']} categories, "
+                f"removed {report['removed']}"
+            ))
@@ -0,0 +1,27 @@
+# Management Command - Mine spending patterns for users whose data changed
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import User
+from apps.analytics.patterns import SpendingPatternMiner, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recompute spending patterns for users whose financial data changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only mine this user email')
+        parser.add_argument('--force', action='store_true', help='Mine every user, changed or not')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users per batch')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        report = SpendingPatternMiner(force=options['force']).run(users, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {report['patterns']} patterns for {report['mined']} of {report['users']} users "
+            f"in {report['batches']} batches"
+        ))
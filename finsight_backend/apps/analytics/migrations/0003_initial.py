@@ -11,7 +11,7 @@ class Migration(migrations.Migration):
 
     dependencies = [
         migrations.swappable_dependency(settings.AUTH_USER_MODEL),
-        ('transactions', '0001_initial'),
+        ('core', '0001_initial'),
         ('analytics', '0002_initial'),
     ]
 
@@ -19,7 +19,7 @@ class Migration(migrations.Migration):
         migrations.AddField(
             model_name='categoryanalytics',
             name='category',
-            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics', to='transactions.category'),
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics', to='core.category'),
         ),
         migrations.AddField(
             model_name='categoryanalytics',
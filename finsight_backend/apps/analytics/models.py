@@ -395,7 +395,7 @@ class CategoryAnalytics(models.Model):
     )
     
     category = models.ForeignKey(
-        'transactions.Category',
+        'core.Category',
         on_delete=models.CASCADE,
         related_name='analytics'
     )
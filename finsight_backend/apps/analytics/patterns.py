@@ -0,0 +1,437 @@
+# Analytics Patterns - Spending pattern mining
+"""
+Compute every ``SpendingPattern`` type for a user in one pass.
+
+Users are mined in batches. One query reads the debits of the batch over
+the analysis window (the ``ANALYSIS_MONTHS`` complete months before this
+one), ordered by user. Each user's rows are loaded once into NumPy
+columns:
+
+- ``days``: the local day of each debit,
+- ``amounts``,
+- ``categories``: category codes, with uncategorized spending as a code of
+  its own,
+- ``merchants``: codes of the normalized merchant key, ``-1`` when there is
+  no usable merchant text.
+
+All six patterns come from these columns with ``bincount``/``add.at``
+group-bys and histograms:
+
+- ``category_trend``: monthly spend per category over the last
+  ``TREND_MONTHS`` months, with a least-squares slope for each one,
+- ``monthly_pattern``: monthly totals and the spread of spending over the
+  days of the month,
+- ``seasonal_pattern``: average spend for each calendar month,
+- ``day_of_week``: average spend for each weekday,
+- ``merchant_frequency``: visits, totals and recency per merchant,
+- ``amount_distribution``: a histogram of amounts, percentiles and outliers.
+
+Every pattern stores the user's data version and the window it covers. A
+run only mines users whose data version changed or whose window moved
+on to a new month since their patterns were written.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import groupby
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.db import transaction as db_transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.core.detection import merchant_key
+from apps.core.models import Transaction, User
+from apps.core.services import FinancialDataVersion
+
+from .models import SpendingPattern
+
+BATCH_SIZE = 200
+STREAM_CHUNK_SIZE = 2000
+
+# Complete months analysed
+ANALYSIS_MONTHS = 24
+
+# Months the category trend lines are fitted on
+TREND_MONTHS = 6
+
+# Monthly change (share of the average) below which a category is stable
+STABLE_CHANGE = 0.05
+
+CATEGORY_LIMIT = 10
+MERCHANT_LIMIT = 10
+
+# Upper edges of the amount histogram buckets; the last one is open
+AMOUNT_EDGES = (10, 25, 50, 100, 250, 500, 1000)
+
+# Volume of data at which each pattern reaches full confidence
+FULL_SUPPORT = {
+    'category_trend': TREND_MONTHS,
+    'monthly_pattern': 6,
+    'seasonal_pattern': 24,
+    'day_of_week': 12,
+    'merchant_frequency': 30,
+    'amount_distribution': 50,
+}
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MONTH_NAMES = (
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December',
+)
+
+
+def support(volume, full):
+    """Share of full support reached by ``volume``"""
+    return float(min(max(volume, 0) / full, 1.0))
+
+
+def money(value):
+    return round(float(value), 2)
+
+
+def load_columns(rows):
+    """Column arrays for one user's ``(user, day, amount, category, name, merchant, description)`` rows"""
+    days, amounts, categories, merchants = [], [], [], []
+    category_codes, category_names = {}, []
+    merchant_codes, merchant_names = {}, []
+    for _, day, amount, category_id, category_name, merchant_name, description in rows:
+        days.append(day)
+        amounts.append(float(amount))
+        code = category_codes.get(category_id)
+        if code is None:
+            code = category_codes[category_id] = len(category_names)
+            category_names.append((category_id, category_name or 'Uncategorized'))
+        categories.append(code)
+        key = merchant_key(merchant_name, description)
+        code = merchant_codes.get(key, -1) if key else -1
+        if key and code < 0:
+            code = merchant_codes[key] = len(merchant_names)
+            merchant_names.append(merchant_name or key.title())
+        merchants.append(code)
+    return {
+        'days': np.array(days, dtype='datetime64[D]'),
+        'amounts': np.array(amounts),
+        'categories': np.array(categories, dtype=int),
+        'category_names': category_names,
+        'merchants': np.array(merchants, dtype=int),
+        'merchant_names': merchant_names,
+    }
+
+
+class SpendingPatternMiner:
+    """Mine and persist spending patterns, a batch of users at a time"""
+
+    def __init__(self, today=None, force=False):
+        today = today or timezone.localdate()
+        self.end = today.replace(day=1) - timedelta(days=1)
+        self.start = self.end.replace(day=1) - relativedelta(months=ANALYSIS_MONTHS - 1)
+        self.force = force
+
+    def run(self, users=None, batch_size=BATCH_SIZE):
+        """Mine every active user (or ``users``) whose patterns are stale; return totals"""
+        if users is None:
+            users = User.objects.filter(is_active=True)
+        user_ids = [user.pk for user in users.only('pk')] if hasattr(users, 'only') else [user.pk for user in users]
+        report = {'users': 0, 'mined': 0, 'patterns': 0, 'batches': 0}
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            versions = self.stale(batch)
+            if versions:
+                report['patterns'] += self.process(versions)
+            report['users'] += len(batch)
+            report['mined'] += len(versions)
+            report['batches'] += 1
+        return report
+
+    def stale(self, user_ids):
+        """``{user_id: data_version}`` for the users whose patterns need mining"""
+        versions = {user_id: FinancialDataVersion.current(user_id) for user_id in user_ids}
+        if self.force:
+            return versions
+        stored = defaultdict(set)
+        for user_id, version, end in SpendingPattern.objects.filter(user_id__in=user_ids).values_list(
+            'user_id', 'pattern_data__data_version', 'analysis_end_date'
+        ):
+            stored[user_id].add((version, end))
+        return {
+            user_id: version for user_id, version in versions.items()
+            if stored.get(user_id) != {(version, self.end)}
+        }
+
+    def stream(self, user_ids):
+        """``(user_id, rows)`` for users of the batch with debits in the window, one ordered query"""
+        zone = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(self.start, time.min), zone)
+        end = timezone.make_aware(datetime.combine(self.end + timedelta(days=1), time.min), zone)
+        rows = Transaction.objects.filter(
+            user_id__in=user_ids, transaction_type='debit', transaction_date__gte=start, transaction_date__lt=end
+        ).annotate(
+            day=TruncDate('transaction_date')
+        ).order_by('user_id', 'transaction_date').values_list(
+            'user_id', 'day', 'amount', 'category_id', 'category__name', 'merchant_name', 'description'
+        ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+        return groupby(rows, key=lambda row: row[0])
+
+    def process(self, versions):
+        """Replace the patterns of the stale users of one batch; return how many were written"""
+        objects = []
+        for user_id, rows in self.stream(list(versions)):
+            data = load_columns(rows)
+            for pattern_type, (pattern_data, insights, confidence) in self.mine(data).items():
+                pattern_data['data_version'] = versions[user_id]
+                pattern_data['transaction_count'] = len(data['amounts'])
+                objects.append(SpendingPattern(
+                    user_id=user_id,
+                    pattern_type=pattern_type,
+                    analysis_start_date=self.start,
+                    analysis_end_date=self.end,
+                    pattern_data=pattern_data,
+                    insights=insights,
+                    confidence_score=Decimal(str(round(100 * confidence, 2))),
+                ))
+        with db_transaction.atomic():
+            SpendingPattern.objects.filter(user_id__in=list(versions)).delete()
+            SpendingPattern.objects.bulk_create(objects, batch_size=500)
+        return len(objects)
+
+    def mine(self, data):
+        """``{pattern_type: (pattern_data, insights, confidence)}`` for one user's columns"""
+        days = data['days']
+        months = days.astype('datetime64[M]')
+        first_month = np.datetime64(self.start, 'M')
+        data['month'] = (months - first_month).astype(int)
+        data['day_of_month'] = (days - months).astype(int)
+        data['weekday'] = (days.astype(int) + 3) % 7  # 1970-01-01 was a Thursday
+        data['month_of_year'] = (months.astype(int)) % 12
+
+        # Averages run from the month of the first debit, not the window start
+        data['first_month'] = int(data['month'].min())
+        data['span'] = ANALYSIS_MONTHS - data['first_month']
+        return {
+            'category_trend': self.category_trend(data),
+            'monthly_pattern': self.monthly_pattern(data),
+            'seasonal_pattern': self.seasonal_pattern(data),
+            'day_of_week': self.day_of_week(data),
+            'merchant_frequency': self.merchant_frequency(data),
+            'amount_distribution': self.amount_distribution(data),
+        }
+
+    def month_label(self, index):
+        return (self.start + relativedelta(months=index)).strftime('%Y-%m')
+
+    def category_trend(self, data):
+        recent = min(TREND_MONTHS, data['span'])
+        column = data['month'] - (ANALYSIS_MONTHS - recent)
+        keep = column >= 0
+        totals = np.zeros((len(data['category_names']), recent))
+        np.add.at(totals, (data['categories'][keep], column[keep]), data['amounts'][keep])
+
+        # Least-squares line through every category's monthly totals at once
+        x = np.arange(recent) - (recent - 1) / 2
+        sxx = (x ** 2).sum()
+        average = totals.mean(axis=1)
+        slope = totals @ x / sxx if sxx else np.zeros(len(totals))
+        syy = ((totals - average[:, None]) ** 2).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fit = np.where(syy > 0, slope ** 2 * sxx / syy, 0.0)
+            change = np.where(average > 0, slope / average, 0.0)
+
+        spend = totals.sum(axis=1)
+        order = [i for i in np.argsort(-spend, kind='stable') if spend[i] > 0][:CATEGORY_LIMIT]
+        categories = []
+        for i in order:
+            category_id, name = data['category_names'][i]
+            direction = 'stable'
+            if abs(change[i]) >= STABLE_CHANGE:
+                direction = 'rising' if change[i] > 0 else 'falling'
+            categories.append({
+                'category_id': str(category_id) if category_id else None,
+                'category': name,
+                'monthly_totals': [money(value) for value in totals[i]],
+                'average': money(average[i]),
+                'slope': money(slope[i]),
+                'monthly_change_pct': round(float(change[i]) * 100, 1),
+                'direction': direction,
+                'fit': round(float(fit[i]), 3),
+            })
+
+        insights = [
+            f"{item['category']} spending is {item['direction']} by about "
+            f"{abs(item['monthly_change_pct']):.0f}% a month"
+            for item in sorted(categories, key=lambda item: -abs(item['monthly_change_pct']))
+            if item['direction'] != 'stable'
+        ][:3]
+        weight = spend.sum()
+        fitted = float((fit * spend).sum() / weight) if weight else 0.0
+        confidence = support(recent, FULL_SUPPORT['category_trend']) * (0.5 + 0.5 * fitted)
+        pattern = {
+            'months': [self.month_label(ANALYSIS_MONTHS - recent + i) for i in range(recent)],
+            'categories': categories,
+        }
+        return pattern, insights, confidence
+
+    def monthly_pattern(self, data):
+        span, first = data['span'], data['first_month']
+        totals = np.bincount(data['month'] - first, weights=data['amounts'], minlength=span)
+        by_day = np.bincount(data['day_of_month'], weights=data['amounts'], minlength=31)
+        share = by_day / by_day.sum()
+        thirds = {
+            'early': round(float(share[:10].sum()), 3),
+            'middle': round(float(share[10:20].sum()), 3),
+            'late': round(float(share[20:].sum()), 3),
+        }
+        average = totals.mean()
+        variability = float(totals.std() / average) if average else 0.0
+
+        heaviest = max(thirds, key=thirds.get)
+        insights = [f"Average monthly spending is ${average:,.2f}"]
+        if thirds[heaviest] > 0.4:
+            insights.append(f"{thirds[heaviest]:.0%} of spending falls in the {heaviest} part of the month")
+        if variability > 0.3:
+            insights.append('Monthly spending varies a lot from month to month')
+
+        pattern = {
+            'average_monthly': money(average),
+            'variability': round(variability, 3),
+            'monthly_totals': [
+                {'month': self.month_label(first + i), 'total': money(total)} for i, total in enumerate(totals)
+            ],
+            'day_of_month': [money(value / span) for value in by_day],
+            'thirds': thirds,
+            'peak_day': int(by_day.argmax()) + 1,
+        }
+        return pattern, insights, support(span, FULL_SUPPORT['monthly_pattern'])
+
+    def seasonal_pattern(self, data):
+        first = data['first_month']
+        totals = np.bincount(data['month_of_year'], weights=data['amounts'], minlength=12)
+        # How many times each calendar month occurs in the observed span
+        observed = (np.datetime64(self.start, 'M') + np.arange(first, ANALYSIS_MONTHS)).astype(int) % 12
+        occurrences = np.bincount(observed, minlength=12)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = np.where(occurrences > 0, totals / occurrences, np.nan)
+        baseline = np.nanmean(average)
+        index = average / baseline if baseline else np.full(12, np.nan)
+
+        months = [
+            {
+                'month': MONTH_NAMES[i],
+                'average': None if np.isnan(average[i]) else money(average[i]),
+                'index': None if np.isnan(index[i]) else round(float(index[i]), 3),
+                'observations': int(occurrences[i]),
+            }
+            for i in range(12)
+        ]
+        ranked = np.argsort(np.nan_to_num(index, nan=1.0))
+        peak, low = int(ranked[-1]), int(ranked[0])
+        insights = []
+        if not np.isnan(index[peak]) and index[peak] > 1.15:
+            insights.append(f"Spending peaks in {MONTH_NAMES[peak]} at {index[peak]:.0%} of a typical month")
+        if not np.isnan(index[low]) and index[low] < 0.85:
+            insights.append(f"{MONTH_NAMES[low]} is usually the lightest month")
+
+        pattern = {'months': months, 'peak_month': MONTH_NAMES[peak], 'low_month': MONTH_NAMES[low]}
+        return pattern, insights, support(data['span'], FULL_SUPPORT['seasonal_pattern'])
+
+    def day_of_week(self, data):
+        totals = np.bincount(data['weekday'], weights=data['amounts'], minlength=7)
+        counts = np.bincount(data['weekday'], minlength=7)
+        # Each weekday's occurrences from the first observed month to the window end
+        first = np.datetime64(self.start, 'M') + data['first_month']
+        calendar = np.arange(first.astype('datetime64[D]'), np.datetime64(self.end) + 1)
+        occurrences = np.bincount((calendar.astype(int) + 3) % 7, minlength=7)
+        average = totals / np.maximum(occurrences, 1)
+        weekend = float(totals[5:].sum() / totals.sum()) if totals.sum() else 0.0
+
+        busiest = int(average.argmax())
+        insights = [f"{WEEKDAYS[busiest]} is the heaviest spending day"]
+        # Two of seven days would hold 29% of spending if it were even
+        if weekend > 0.4:
+            insights.append(f"{weekend:.0%} of spending happens at the weekend")
+
+        pattern = {
+            'days': [
+                {
+                    'day': WEEKDAYS[i],
+                    'average': money(average[i]),
+                    'total': money(totals[i]),
+                    'transactions': int(counts[i]),
+                }
+                for i in range(7)
+            ],
+            'weekend_share': round(weekend, 3),
+            'busiest_day': WEEKDAYS[busiest],
+        }
+        return pattern, insights, support(len(calendar) / 7, FULL_SUPPORT['day_of_week'])
+
+    def merchant_frequency(self, data):
+        known = data['merchants'] >= 0
+        codes = data['merchants'][known]
+        count = len(data['merchant_names'])
+        visits = np.bincount(codes, minlength=count)
+        totals = np.bincount(codes, weights=data['amounts'][known], minlength=count)
+        last = np.zeros(count, dtype=int)
+        np.maximum.at(last, codes, data['days'][known].astype(int))
+
+        order = np.lexsort((-totals, -visits))[:MERCHANT_LIMIT]
+        merchants = [
+            {
+                'merchant': data['merchant_names'][i],
+                'visits': int(visits[i]),
+                'total': money(totals[i]),
+                'average': money(totals[i] / visits[i]),
+                'visits_per_month': round(float(visits[i]) / data['span'], 2),
+                'last_seen': str(np.datetime64(int(last[i]), 'D')),
+            }
+            for i in order
+        ]
+        spend = data['amounts'].sum()
+        top_share = float(totals[order].sum() / spend) if spend else 0.0
+        insights = []
+        if merchants:
+            top = merchants[0]
+            insights.append(f"{top['merchant']} is the most frequent merchant with {top['visits']} purchases")
+        if top_share > 0.5:
+            insights.append(f"The top {len(merchants)} merchants take {top_share:.0%} of spending")
+
+        pattern = {
+            'merchants': merchants,
+            'distinct_merchants': count,
+            'top_share': round(top_share, 3),
+        }
+        coverage = float(known.mean()) if len(known) else 0.0
+        return pattern, insights, support(len(codes), FULL_SUPPORT['merchant_frequency']) * coverage
+
+    def amount_distribution(self, data):
+        amounts = data['amounts']
+        edges = np.array((0,) + AMOUNT_EDGES + (np.inf,), dtype=float)
+        counts, _ = np.histogram(amounts, bins=edges)
+        totals, _ = np.histogram(amounts, bins=edges, weights=amounts)
+        p25, p50, p75, p90 = np.percentile(amounts, [25, 50, 75, 90])
+        threshold = p75 + 1.5 * (p75 - p25)
+        outliers = amounts > threshold
+
+        buckets = []
+        for i, (count, total) in enumerate(zip(counts, totals)):
+            label = f"{edges[i]:.0f}-{edges[i + 1]:.0f}" if np.isfinite(edges[i + 1]) else f"{edges[i]:.0f}+"
+            buckets.append({'range': label, 'count': int(count), 'total': money(total)})
+
+        outlier_share = float(amounts[outliers].sum() / amounts.sum()) if amounts.sum() else 0.0
+        insights = [f"Half of purchases are under ${p50:,.2f}"]
+        if outliers.any():
+            insights.append(
+                f"{int(outliers.sum())} purchases over ${threshold:,.2f} make up {outlier_share:.0%} of spending"
+            )
+
+        pattern = {
+            'buckets': buckets,
+            'mean': money(amounts.mean()),
+            'std': money(amounts.std()),
+            'percentiles': {'25': money(p25), '50': money(p50), '75': money(p75), '90': money(p90)},
+            'outlier_threshold': money(threshold),
+            'outliers': int(outliers.sum()),
+            'outlier_share': round(outlier_share, 3),
+        }
+        return pattern, insights, support(len(amounts), FULL_SUPPORT['amount_distribution'])
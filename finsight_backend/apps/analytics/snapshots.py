@@ -0,0 +1,349 @@
+# Analytics Snapshots - Financial snapshots for every period type
+"""
+Write ``FinancialSnapshot`` rows for days, weeks, months, quarters and years.
+
+Users are processed in batches. For each batch, one streaming query reads
+the new transactions ordered by (user, date) and folds them into daily
+flows. Daily balances are worked out backwards from today's account
+balances: each day's balance is the current balance less the flows booked
+after it. Coarser periods are then summed from finer ones and never from
+raw rows:
+
+    daily -> weekly
+    daily -> monthly -> quarterly -> yearly
+
+Weeks do not nest in months, so weekly and monthly both come from days.
+Flow figures (income, expenses, budget spend) are summed. Level figures
+(balances, goal progress, health score) are taken from the period's last
+day.
+
+Runs are incremental. Each user resumes after their last daily snapshot.
+A period that is still running is written as incomplete and rewritten by
+later runs. Rows are upserted on (user, type, date), so reruns are
+idempotent. ``full`` rebuilds a user's history, for example after old
+transactions were edited.
+"""
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from apps.core.models import Account, Budget, FinancialHealthScore, Goal, Transaction, User
+
+from .models import FinancialSnapshot
+
+BATCH_SIZE = 500
+STREAM_CHUNK_SIZE = 2000
+
+# Each coarser period type and the finer one it is summed from
+DERIVED_FROM = OrderedDict([
+    ('weekly', 'daily'),
+    ('monthly', 'daily'),
+    ('quarterly', 'monthly'),
+    ('yearly', 'quarterly'),
+])
+
+FLOW_FIELDS = ('total_income', 'total_expenses', 'net_income', 'total_budget_spent')
+LEVEL_FIELDS = (
+    'total_assets', 'total_liabilities', 'net_worth', 'total_savings', 'total_investments',
+    'total_goal_progress', 'financial_health_score',
+)
+VALUE_FIELDS = FLOW_FIELDS + LEVEL_FIELDS + ('total_budget_allocated',)
+
+LIABILITY_TYPES = ('credit', 'loan')
+ZERO = Decimal('0.00')
+
+
+def period_start(period_type, day):
+    """First day of the ``period_type`` period containing ``day``"""
+    if period_type == 'daily':
+        return day
+    if period_type == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if period_type == 'monthly':
+        return day.replace(day=1)
+    if period_type == 'quarterly':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day.replace(month=1, day=1)
+
+
+def period_end(period_type, start):
+    """Last day of the ``period_type`` period starting on ``start``"""
+    if period_type == 'daily':
+        return start
+    if period_type == 'weekly':
+        return start + timedelta(days=6)
+    months = {'monthly': 1, 'quarterly': 3, 'yearly': 12}[period_type]
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1) - timedelta(days=1)
+
+
+class SnapshotGenerator:
+    """Generate financial snapshots of every period type, a batch of users at a time"""
+
+    def __init__(self, until=None, full=False, batch_size=BATCH_SIZE):
+        # Only finished days are snapshotted
+        self.until = until or timezone.localdate() - timedelta(days=1)
+        self.full = full
+        self.batch_size = batch_size
+
+    def run(self, users=None):
+        """Snapshot every active user (or ``users``); return totals"""
+        if users is None:
+            users = User.objects.filter(is_active=True)
+        user_ids = [user.pk for user in users.only('pk')] if hasattr(users, 'only') else [user.pk for user in users]
+        report = {'users': 0, 'snapshots': 0, 'batches': 0}
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            report['snapshots'] += self.process(batch)
+            report['users'] += len(batch)
+            report['batches'] += 1
+        return report
+
+    def process(self, user_ids):
+        """Write the snapshots of one batch; return how many were written"""
+        resume = self.resume_days(user_ids)
+        accounts = self.accounts(user_ids)
+        budgets = self.budgets(user_ids)
+        goals = dict(
+            Goal.objects.filter(user_id__in=user_ids, is_active=True).values_list('user_id')
+            .annotate(total=Sum('current_amount')).order_by()
+        )
+        scores = defaultdict(lambda: ([], []))
+        for user_id, calculated_at, score in FinancialHealthScore.objects.filter(
+            user_id__in=user_ids
+        ).order_by('user_id', 'calculated_at').values_list('user_id', 'calculated_at', 'overall_score'):
+            days, values = scores[user_id]
+            days.append(timezone.localtime(calculated_at).date())
+            values.append(score)
+
+        daily = {}
+        for user_id, rows in self.stream(user_ids, resume):
+            first = resume.get(user_id)
+            flows = self.daily_flows(rows, accounts, budgets.get(user_id, ()))
+            if first is None:
+                if not flows:
+                    continue
+                first = min(flows)
+            if first > self.until:
+                continue
+            daily[user_id] = self.daily_rows(
+                user_id, first, flows, accounts, budgets.get(user_id, ()), goals.get(user_id) or ZERO,
+                scores.get(user_id, ([], [])),
+            )
+
+        snapshots = {'daily': daily}
+        stored = self.stored(daily, resume)
+        for period_type, source in DERIVED_FROM.items():
+            snapshots[period_type] = {
+                user_id: self.derive(
+                    period_type, stored[user_id].get(source, {}), snapshots[source][user_id],
+                    budgets.get(user_id, ()),
+                )
+                for user_id in daily
+            }
+        return self.write(snapshots)
+
+    def resume_days(self, user_ids):
+        """Day after each user's last daily snapshot; users never snapshotted are absent"""
+        if self.full:
+            return {}
+        last = FinancialSnapshot.objects.filter(user_id__in=user_ids, snapshot_type='daily').values_list(
+            'user_id'
+        ).annotate(last=Max('snapshot_date')).order_by()
+        return {user_id: day + timedelta(days=1) for user_id, day in last}
+
+    def accounts(self, user_ids):
+        """``{account_id: (user_id, account_type, balance)}`` for active accounts"""
+        return {
+            pk: (user_id, account_type, balance)
+            for pk, user_id, account_type, balance in Account.objects.filter(
+                user_id__in=user_ids, is_active=True
+            ).values_list('id', 'user_id', 'account_type', 'balance')
+        }
+
+    def budgets(self, user_ids):
+        budgets = defaultdict(list)
+        for user_id, category_id, amount, start_date, end_date in Budget.objects.filter(
+            user_id__in=user_ids, is_active=True
+        ).values_list('user_id', 'category_id', 'amount', 'start_date', 'end_date'):
+            budgets[user_id].append((category_id, amount, start_date, end_date))
+        return budgets
+
+    def stream(self, user_ids, resume):
+        """
+        ``(user_id, rows)`` for every user of the batch, with the user's
+        transactions from their resume day on (all of them for new users),
+        read in one ordered query and handed out a user at a time
+        """
+        resumed = [user_id for user_id in user_ids if user_id in resume]
+        fresh = [user_id for user_id in user_ids if user_id not in resume]
+        criteria = Q(user_id__in=fresh)
+        if resumed:
+            since = min(resume[user_id] for user_id in resumed)
+            since = timezone.make_aware(datetime.combine(since, time.min), timezone.get_current_timezone())
+            criteria |= Q(user_id__in=resumed, transaction_date__gte=since)
+        rows = Transaction.objects.filter(criteria).order_by('user_id', 'transaction_date').values_list(
+            'user_id', 'transaction_date', 'transaction_type', 'amount', 'category_id', 'account_id'
+        ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+        pending = set(user_ids)
+        for user_id, group in groupby(rows, key=lambda row: row[0]):
+            pending.discard(user_id)
+            yield user_id, group
+        for user_id in user_ids:
+            if user_id in pending:
+                yield user_id, ()
+
+    def daily_flows(self, rows, accounts, budgets):
+        """Per-day income, expenses, budgeted spend and balance changes by account type"""
+        flows = {}
+        for _, transaction_date, transaction_type, amount, category_id, account_id in rows:
+            day = timezone.localtime(transaction_date).date()
+            flow = flows.get(day)
+            if flow is None:
+                flow = flows[day] = {'income': ZERO, 'expenses': ZERO, 'budgeted': ZERO, 'count': 0,
+                                     'balances': defaultdict(Decimal)}
+            flow['count'] += 1
+            if transaction_type == 'credit':
+                flow['income'] += amount
+            elif transaction_type == 'debit':
+                flow['expenses'] += amount
+                if any(category_id == budget[0] and budget[2] <= day <= budget[3] for budget in budgets):
+                    flow['budgeted'] += amount
+            account = accounts.get(account_id)
+            if account is not None and transaction_type in ('credit', 'debit'):
+                owed = account[1] in LIABILITY_TYPES
+                # Debits grow what is owed on cards and loans and shrink assets
+                sign = 1 if (transaction_type == 'debit') == owed else -1
+                flow['balances'][account[1]] += sign * amount
+        return flows
+
+    def daily_rows(self, user_id, first, flows, accounts, budgets, goal_progress, scores):
+        """Daily snapshot values from ``first`` through ``until``, keyed by day"""
+        current = defaultdict(Decimal)
+        for owner, account_type, balance in accounts.values():
+            if owner == user_id:
+                current[account_type] += abs(balance) if account_type in LIABILITY_TYPES else balance
+
+        # Walk back from today: a day's balance is today's less what came after it
+        after = defaultdict(Decimal)
+        for day, flow in flows.items():
+            if day > self.until:
+                for account_type, change in flow['balances'].items():
+                    after[account_type] += change
+
+        score_days, score_values = scores
+        rows = {}
+        day = self.until
+        while day >= first:
+            flow = flows.get(day)
+            balances = {account_type: current[account_type] - after[account_type] for account_type in current}
+            assets = sum((value for account_type, value in balances.items()
+                          if account_type not in LIABILITY_TYPES), ZERO)
+            liabilities = sum((value for account_type, value in balances.items()
+                               if account_type in LIABILITY_TYPES), ZERO)
+            position = bisect_right(score_days, day)
+            income = flow['income'] if flow else ZERO
+            expenses = flow['expenses'] if flow else ZERO
+            rows[day] = {
+                'total_income': income,
+                'total_expenses': expenses,
+                'net_income': income - expenses,
+                'total_budget_spent': flow['budgeted'] if flow else ZERO,
+                'total_budget_allocated': self.allocated(budgets, day, day),
+                'total_assets': assets,
+                'total_liabilities': liabilities,
+                'net_worth': assets - liabilities,
+                'total_savings': balances.get('savings', ZERO),
+                'total_investments': balances.get('investment', ZERO),
+                'total_goal_progress': goal_progress,
+                'financial_health_score': score_values[position - 1] if position else 0,
+                'snapshot_data': {'transaction_count': flow['count'] if flow else 0, 'complete': True},
+            }
+            if flow:
+                for account_type, change in flow['balances'].items():
+                    after[account_type] += change
+            day -= timedelta(days=1)
+        return OrderedDict(sorted(rows.items()))
+
+    @staticmethod
+    def allocated(budgets, start, end):
+        """Amount of the budgets running at any point in ``[start, end]``"""
+        return sum((amount for _, amount, begin, finish in budgets if begin <= end and finish >= start), ZERO)
+
+    def stored(self, daily, resume):
+        """
+        Stored finer rows that share a period with the new days, so partly
+        rewritten periods can be summed again: ``{user: {type: {day: values}}}``
+        """
+        stored = defaultdict(lambda: defaultdict(dict))
+        resumed = [user_id for user_id in daily if user_id in resume]
+        if not resumed:
+            return stored
+        first = min(resume[user_id] for user_id in resumed)
+        bounds = {
+            'daily': min(period_start('weekly', first), period_start('monthly', first)),
+            'monthly': period_start('quarterly', first),
+            'quarterly': period_start('yearly', first),
+        }
+        criteria = Q()
+        for period_type, since in bounds.items():
+            criteria |= Q(snapshot_type=period_type, snapshot_date__gte=since)
+        rows = FinancialSnapshot.objects.filter(criteria, user_id__in=resumed).values(
+            'user_id', 'snapshot_type', 'snapshot_date', 'snapshot_data', *VALUE_FIELDS
+        )
+        for row in rows:
+            user_id, period_type, day = row.pop('user_id'), row.pop('snapshot_type'), row.pop('snapshot_date')
+            if period_type != 'daily' or day < resume[user_id]:
+                stored[user_id][period_type][day] = row
+        return stored
+
+    def derive(self, period_type, stored, new, budgets):
+        """
+        Rows of the ``period_type`` periods that contain ``new`` finer rows,
+        summed from the stored and new finer rows of each period
+        """
+        source = dict(stored)
+        source.update(new)
+        touched = {period_start(period_type, day) for day in new}
+        grouped = defaultdict(list)
+        for day in sorted(source):
+            start = period_start(period_type, day)
+            if start in touched:
+                grouped[start].append(source[day])
+
+        rows = OrderedDict()
+        for start in sorted(grouped):
+            parts = grouped[start]
+            end = period_end(period_type, start)
+            row = {field: sum((part[field] for part in parts), ZERO) for field in FLOW_FIELDS}
+            row.update({field: parts[-1][field] for field in LEVEL_FIELDS})
+            row['total_budget_allocated'] = self.allocated(budgets, start, min(end, self.until))
+            row['snapshot_data'] = {
+                'transaction_count': sum(part['snapshot_data'].get('transaction_count', 0) for part in parts),
+                'complete': end <= self.until and all(part['snapshot_data'].get('complete') for part in parts),
+            }
+            rows[start] = row
+        return rows
+
+    def write(self, snapshots):
+        """Upsert every generated row; return the count"""
+        objects = [
+            FinancialSnapshot(user_id=user_id, snapshot_type=period_type, snapshot_date=day, **values)
+            for period_type, by_user in snapshots.items()
+            for user_id, rows in by_user.items()
+            for day, values in rows.items()
+        ]
+        FinancialSnapshot.objects.bulk_create(
+            objects,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['user', 'snapshot_type', 'snapshot_date'],
+            update_fields=list(VALUE_FIELDS) + ['snapshot_data', 'updated_at'],
+        )
+        return len(objects)
@@ -1,3 +1,454 @@
 from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+import numpy as np
+
+from apps.core.models import User, Account, Budget, Category, Goal, Transaction
+from apps.core.services import FinancialDataVersion
+from .forecasting import CashFlowForecaster, fit, predict
+from .category_analytics import CategoryAnalyticsMaterializer
+from .models import CategoryAnalytics, FinancialSnapshot, SpendingPattern
+from .patterns import SpendingPatternMiner
+from .snapshots import SnapshotGenerator
+
+
+class CashFlowForecastTests(TestCase):
+    """Forecasts come from one grouped query and a cached, rolled-forward fit"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='forecast', email='forecast@example.com', password='secret123')
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.coffee = Category.objects.create(user=self.user, name='Coffee', category_type='expense')
+        self.salary = Category.objects.create(user=self.user, name='Salary', category_type='income')
+        self.today = timezone.localdate()
+        for days_ago in range(1, 121):
+            self.add(self.coffee, 'debit', '5.00', days_ago)
+        for days_ago in range(15, 121, 30):
+            self.add(self.salary, 'credit', '3000.00', days_ago)
+
+    def add(self, category, transaction_type, amount, days_ago):
+        day = self.today - timedelta(days=days_ago)
+        return Transaction.objects.create(
+            user=self.user, account=self.account, category=category, amount=Decimal(amount),
+            transaction_type=transaction_type, description=category.name,
+            transaction_date=timezone.make_aware(datetime.combine(day, time(12)))
+        )
+
+    def test_weekly_season_is_repeated(self):
+        # Spending only on one weekday is fitted exactly by the weekday profile
+        first = datetime(2026, 1, 5).date().toordinal()
+        values = np.zeros((1, 56))
+        values[0, 5::7] = 70.0
+        state = fit(values, first)
+        path, spread, use_naive = predict(state, first + 56, 28)
+        self.assertAlmostEqual(path[0].sum(), 280.0)
+        self.assertAlmostEqual(path[0, 5], 70.0)
+        self.assertAlmostEqual(spread[0, -1], 0.0)
+
+    def test_forecast_and_cache(self):
+        with CaptureQueriesContext(connection) as ctx:
+            forecast = CashFlowForecaster(self.user, today=self.today).forecast()
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+        month = forecast['horizons'][0]
+        self.assertEqual(month['days'], 30)
+        self.assertAlmostEqual(month['expenses']['expected'], 150.0, delta=1)
+        self.assertLessEqual(month['income']['lower'], month['income']['expected'])
+        self.assertGreaterEqual(month['income']['upper'], month['income']['expected'])
+        self.assertAlmostEqual(month['income']['expected'], 3000.0, delta=600)
+        self.assertEqual([category['category'] for category in forecast['categories']], ['Coffee'])
+        self.assertEqual(len(forecast['months']), 3)
+
+        # Same day, same data: served from the cache
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(CashFlowForecaster(self.user, today=self.today).forecast(), forecast)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # A new day with unchanged data reads only that day
+        with CaptureQueriesContext(connection) as ctx:
+            later = CashFlowForecaster(self.user, today=self.today + timedelta(days=1)).forecast()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(later['history_days'], forecast['history_days'] + 1)
+
+        # A write to a fitted day refits after one aggregate query
+        self.add(self.coffee, 'debit', '500.00', 1)
+        with CaptureQueriesContext(connection) as ctx:
+            refit = CashFlowForecaster(self.user, today=self.today).forecast()
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertGreater(refit['horizons'][0]['expenses']['upper'], month['expenses']['upper'])
+
+    def test_new_days_keep_the_fit(self):
+        forecast = CashFlowForecaster(self.user, today=self.today).forecast()
+
+        # Today's transaction is after the fitted days: the fit and forecast are kept
+        self.add(self.coffee, 'debit', '400.00', 0)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(CashFlowForecaster(self.user, today=self.today).forecast(), forecast)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # Tomorrow it is rolled in from the one query for the new day
+        with CaptureQueriesContext(connection) as ctx:
+            later = CashFlowForecaster(self.user, today=self.today + timedelta(days=1)).forecast()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(later['history_days'], forecast['history_days'] + 1)
+        self.assertGreater(later['horizons'][0]['expenses']['upper'], forecast['horizons'][0]['expenses']['upper'])
+
+        # Edits and deletions inside the fitted days refit
+        Transaction.objects.filter(user=self.user, amount=Decimal('400.00')).delete()
+        with CaptureQueriesContext(connection) as ctx:
+            refit = CashFlowForecaster(self.user, today=self.today + timedelta(days=1)).forecast()
+        self.assertEqual(len(ctx.captured_queries), 3)
+        cache.delete(CashFlowForecaster.state_key(self.user.pk))
+        self.assertEqual(CashFlowForecaster(self.user, today=self.today + timedelta(days=1)).forecast(), refit)
+
+    def test_new_category_refits(self):
+        CashFlowForecaster(self.user, today=self.today).forecast()
+        books = Category.objects.create(user=self.user, name='Books', category_type='expense')
+        self.add(books, 'debit', '20.00', 0)
+        later = CashFlowForecaster(self.user, today=self.today + timedelta(days=1)).forecast()
+        self.assertEqual(sorted(category['category'] for category in later['categories']), ['Books', 'Coffee'])
+
+    def test_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/analytics/spending-forecast/')
+        self.assertEqual(response.status_code, 200)
+        coffee = [item for item in response.data['predictions'] if item['category'] == 'Coffee']
+        self.assertEqual(coffee[0]['type'], 'forecast')
+        self.assertEqual([horizon['days'] for horizon in response.data['cash_flow']], [30, 60, 90])
+
+        # No random noise: the health forecast is repeatable
+        first = client.get('/api/analytics/financial-health-forecast/').data
+        self.assertEqual(len(first['predictions']), 3)
+        self.assertEqual(client.get('/api/analytics/financial-health-forecast/').data, first)
+
+
+class SnapshotGeneratorTests(TestCase):
+    """Daily rows replay balances backwards; coarser periods are summed from finer ones"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='snapshots', email='snapshots@example.com', password='secret123')
+        self.checking = Account.objects.create(
+            user=self.user, name='Checking', account_type='checking', balance=Decimal('1000.00')
+        )
+        self.card = Account.objects.create(
+            user=self.user, name='Card', account_type='credit', balance=Decimal('-200.00')
+        )
+        self.groceries = Category.objects.create(user=self.user, name='Groceries', category_type='expense')
+        Goal.objects.create(
+            user=self.user, name='Holiday', goal_type='savings', target_amount=Decimal('1000.00'),
+            current_amount=Decimal('300.00'), target_date=date(2027, 1, 1)
+        )
+        self.add(self.checking, 'credit', '500.00', date(2026, 4, 15))
+        self.add(self.checking, 'debit', '100.00', date(2026, 5, 10))
+        self.add(self.checking, 'debit', '50.00', date(2026, 6, 20))
+        self.add(self.card, 'debit', '80.00', date(2026, 6, 25))
+
+    def add(self, account, transaction_type, amount, day):
+        return Transaction.objects.create(
+            user=self.user, account=account, category=self.groceries, amount=Decimal(amount),
+            transaction_type=transaction_type, description='Groceries',
+            transaction_date=timezone.make_aware(datetime.combine(day, time(12)))
+        )
+
+    def snapshot(self, snapshot_type, day):
+        return FinancialSnapshot.objects.get(user=self.user, snapshot_type=snapshot_type, snapshot_date=day)
+
+    def generate(self, until, **kwargs):
+        return SnapshotGenerator(until=until, **kwargs).run(User.objects.filter(pk=self.user.pk))
+
+    def test_daily(self):
+        self.generate(date(2026, 6, 30))
+        daily = FinancialSnapshot.objects.filter(user=self.user, snapshot_type='daily')
+        self.assertEqual(daily.count(), 77)
+        self.assertEqual(daily.order_by('snapshot_date').first().snapshot_date, date(2026, 4, 15))
+
+        first = self.snapshot('daily', date(2026, 4, 15))
+        self.assertEqual(first.total_income, Decimal('500.00'))
+        self.assertEqual(first.total_assets, Decimal('1150.00'))
+        self.assertEqual(first.total_liabilities, Decimal('120.00'))
+        self.assertEqual(first.total_goal_progress, Decimal('300.00'))
+
+        last = self.snapshot('daily', date(2026, 6, 30))
+        self.assertEqual(last.total_assets, Decimal('1000.00'))
+        self.assertEqual(last.total_liabilities, Decimal('200.00'))
+        self.assertEqual(last.net_worth, Decimal('800.00'))
+        self.assertEqual(self.snapshot('daily', date(2026, 6, 25)).total_expenses, Decimal('80.00'))
+
+    def test_weekly(self):
+        self.generate(date(2026, 6, 30))
+        week = self.snapshot('weekly', date(2026, 5, 4))
+        self.assertEqual(week.total_expenses, Decimal('100.00'))
+        self.assertEqual(week.total_assets, Decimal('1050.00'))
+        self.assertTrue(week.snapshot_data['complete'])
+        self.assertFalse(self.snapshot('weekly', date(2026, 6, 29)).snapshot_data['complete'])
+
+    def test_monthly(self):
+        self.generate(date(2026, 6, 30))
+        self.assertEqual(self.snapshot('monthly', date(2026, 4, 1)).total_income, Decimal('500.00'))
+        june = self.snapshot('monthly', date(2026, 6, 1))
+        self.assertEqual(june.total_expenses, Decimal('130.00'))
+        self.assertEqual(june.net_income, Decimal('-130.00'))
+        self.assertEqual(june.snapshot_data['transaction_count'], 2)
+        self.assertTrue(june.snapshot_data['complete'])
+
+    def test_quarterly(self):
+        self.generate(date(2026, 6, 30))
+        quarter = self.snapshot('quarterly', date(2026, 4, 1))
+        self.assertEqual(quarter.total_income, Decimal('500.00'))
+        self.assertEqual(quarter.total_expenses, Decimal('230.00'))
+        self.assertEqual(quarter.net_worth, Decimal('800.00'))
+        self.assertTrue(quarter.snapshot_data['complete'])
+
+    def test_yearly(self):
+        self.generate(date(2026, 6, 30))
+        year = self.snapshot('yearly', date(2026, 1, 1))
+        self.assertEqual(year.total_expenses, Decimal('230.00'))
+        self.assertEqual(year.snapshot_data['transaction_count'], 4)
+        self.assertFalse(year.snapshot_data['complete'])
+
+    def test_incremental_run_extends_open_periods(self):
+        self.generate(date(2026, 6, 30))
+        written = FinancialSnapshot.objects.filter(user=self.user).count()
+        self.assertEqual(self.generate(date(2026, 6, 30))['snapshots'], 0)
+        self.assertEqual(FinancialSnapshot.objects.filter(user=self.user).count(), written)
+
+        self.add(self.checking, 'debit', '30.00', date(2026, 7, 2))
+        Account.objects.filter(pk=self.checking.pk).update(balance=Decimal('970.00'))
+        self.generate(date(2026, 7, 5))
+
+        self.assertEqual(self.snapshot('daily', date(2026, 7, 5)).total_assets, Decimal('970.00'))
+        week = self.snapshot('weekly', date(2026, 6, 29))
+        self.assertEqual(week.total_expenses, Decimal('30.00'))
+        self.assertTrue(week.snapshot_data['complete'])
+        self.assertEqual(self.snapshot('quarterly', date(2026, 7, 1)).total_expenses, Decimal('30.00'))
+        self.assertEqual(self.snapshot('yearly', date(2026, 1, 1)).total_expenses, Decimal('260.00'))
+        # Finished periods are left alone
+        self.assertEqual(self.snapshot('quarterly', date(2026, 4, 1)).total_expenses, Decimal('230.00'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_snapshots', '--user', 'snapshots@example.com', '--until', '2026-06-30', stdout=out)
+        self.assertIn('snapshots for 1 users', out.getvalue())
+        self.assertTrue(FinancialSnapshot.objects.filter(user=self.user, snapshot_type='yearly').exists())
+
+
+class SpendingPatternMinerTests(TestCase):
+    """Every pattern type comes from one pass over the user's debits"""
+
+    TODAY = date(2026, 10, 17)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='patterns', email='patterns@example.com', password='secret123')
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.dining = Category.objects.create(user=self.user, name='Dining', category_type='expense')
+        self.rent = Category.objects.create(user=self.user, name='Rent', category_type='expense')
+
+    def add(self, day, amount, category=None, merchant='', description='Purchase'):
+        return Transaction.objects.create(
+            user=self.user, account=self.account, category=category or self.dining, amount=Decimal(amount),
+            transaction_type='debit', description=description, merchant_name=merchant,
+            transaction_date=timezone.make_aware(datetime.combine(day, time(12)))
+        )
+
+    def mine(self):
+        report = SpendingPatternMiner(today=self.TODAY).run(User.objects.filter(pk=self.user.pk))
+        patterns = {pattern.pattern_type: pattern for pattern in SpendingPattern.objects.filter(user=self.user)}
+        return report, patterns
+
+    def test_category_trend(self):
+        for offset, amount in enumerate(['40', '50', '60', '70', '80', '90']):
+            self.add(date(2026, 4 + offset, 5), amount)
+            self.add(date(2026, 4 + offset, 1), '1200', category=self.rent)
+        pattern = self.mine()[1]['category_trend']
+        trends = {item['category']: item for item in pattern.pattern_data['categories']}
+        self.assertEqual(trends['Dining']['direction'], 'rising')
+        self.assertEqual(trends['Dining']['slope'], 10.0)
+        self.assertEqual(trends['Rent']['direction'], 'stable')
+        self.assertEqual(len(pattern.pattern_data['months']), 6)
+        self.assertIn('Dining', pattern.insights[0])
+
+    def test_monthly_pattern(self):
+        for month in range(4, 10):
+            self.add(date(2026, month, 2), '100')
+            self.add(date(2026, month, 25), '10')
+        pattern = self.mine()[1]['monthly_pattern']
+        self.assertEqual(pattern.pattern_data['average_monthly'], 110.0)
+        self.assertEqual(pattern.pattern_data['peak_day'], 2)
+        self.assertAlmostEqual(pattern.pattern_data['thirds']['early'], 0.909, places=3)
+        self.assertEqual(len(pattern.pattern_data['monthly_totals']), 6)
+        self.assertEqual(pattern.confidence_score, Decimal('100.00'))
+
+    def test_seasonal_pattern(self):
+        for year, month in [(2024 + (9 + i) // 12, (9 + i) % 12 + 1) for i in range(24)]:
+            self.add(date(year, month, 15), '400' if month == 12 else '100')
+        pattern = self.mine()[1]['seasonal_pattern']
+        months = {item['month']: item for item in pattern.pattern_data['months']}
+        self.assertEqual(pattern.pattern_data['peak_month'], 'December')
+        self.assertEqual(months['December']['observations'], 2)
+        self.assertEqual(months['March']['average'], 100.0)
+        self.assertEqual(pattern.confidence_score, Decimal('100.00'))
+
+    def test_day_of_week(self):
+        day = date(2026, 7, 4)
+        while day <= date(2026, 9, 26):
+            self.add(day, '25')
+            day += timedelta(days=7)
+        pattern = self.mine()[1]['day_of_week']
+        days = {item['day']: item for item in pattern.pattern_data['days']}
+        self.assertEqual(pattern.pattern_data['busiest_day'], 'Saturday')
+        self.assertEqual(pattern.pattern_data['weekend_share'], 1.0)
+        self.assertEqual(days['Saturday']['transactions'], 13)
+        self.assertEqual(days['Monday']['total'], 0.0)
+
+    def test_merchant_frequency(self):
+        for day in range(1, 6):
+            self.add(date(2026, 9, day), '4.50', merchant='Cafe Luna')
+        self.add(date(2026, 9, 10), '30', merchant='Book Barn')
+        self.add(date(2026, 9, 12), '30', merchant='Book Barn')
+        self.add(date(2026, 9, 14), '10', description='')
+        pattern = self.mine()[1]['merchant_frequency']
+        merchants = pattern.pattern_data['merchants']
+        self.assertEqual([item['merchant'] for item in merchants], ['Cafe Luna', 'Book Barn'])
+        self.assertEqual(merchants[0]['visits'], 5)
+        self.assertEqual(merchants[0]['last_seen'], '2026-09-05')
+        self.assertEqual(merchants[1]['total'], 60.0)
+        self.assertEqual(pattern.pattern_data['distinct_merchants'], 2)
+
+    def test_amount_distribution(self):
+        for day in range(1, 21):
+            self.add(date(2026, 9, day), '20')
+        self.add(date(2026, 9, 21), '2000')
+        pattern = self.mine()[1]['amount_distribution']
+        buckets = {item['range']: item['count'] for item in pattern.pattern_data['buckets']}
+        self.assertEqual(buckets['10-25'], 20)
+        self.assertEqual(buckets['1000+'], 1)
+        self.assertEqual(pattern.pattern_data['percentiles']['50'], 20.0)
+        self.assertEqual(pattern.pattern_data['outliers'], 1)
+
+    def test_recomputes_only_on_version_change(self):
+        self.add(date(2026, 9, 1), '20')
+        report, patterns = self.mine()
+        self.assertEqual((report['mined'], report['patterns']), (1, 6))
+        self.assertEqual(len(patterns), 6)
+        version = FinancialDataVersion.current(self.user.pk)
+        self.assertEqual(patterns['day_of_week'].pattern_data['data_version'], version)
+
+        self.assertEqual(self.mine()[0]['mined'], 0)
+
+        FinancialDataVersion.bump(self.user.pk)
+        report, patterns = self.mine()
+        self.assertEqual(report['mined'], 1)
+        self.assertEqual(SpendingPattern.objects.filter(user=self.user).count(), 6)
+
+    def test_command(self):
+        self.add(timezone.localdate().replace(day=1) - timedelta(days=3), '20')
+        out = StringIO()
+        call_command('mine_spending_patterns', '--user', 'patterns@example.com', stdout=out)
+        self.assertIn('Wrote 6 patterns for 1 of 1 users', out.getvalue())
+
+
+class CategoryAnalyticsMaterializerTests(TestCase):
+    """A month is built with grouped queries and refreshed only where the data changed"""
+
+    MONTH = date(2026, 8, 1)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='categories', email='categories@example.com', password='secret123')
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.food = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        self.fun = Category.objects.create(user=self.user, name='Fun', category_type='expense')
+        Budget.objects.create(
+            user=self.user, category=self.food, name='Food', amount=Decimal('310.00'), period='monthly',
+            start_date=date(2026, 8, 1), end_date=date(2026, 8, 31)
+        )
+        self.add(self.food, '10.00', datetime(2026, 8, 3, 9), 'Deli')      # Monday
+        self.add(self.food, '20.00', datetime(2026, 8, 10, 9), 'Deli')     # Monday
+        self.add(self.food, '50.00', datetime(2026, 8, 8, 19), 'Bistro')   # Saturday
+        self.add(self.food, '40.00', datetime(2026, 7, 8, 19), 'Bistro')
+        self.cinema = self.add(self.fun, '30.00', datetime(2026, 8, 15, 21), 'Cinema')
+
+    def add(self, category, amount, moment, merchant):
+        return Transaction.objects.create(
+            user=self.user, account=self.account, category=category, amount=Decimal(amount),
+            transaction_type='debit', description=merchant, merchant_name=merchant,
+            transaction_date=timezone.make_aware(moment)
+        )
+
+    def materialize(self, month=None, **kwargs):
+        return CategoryAnalyticsMaterializer(month or self.MONTH, **kwargs).run()
+
+    def row(self, category, month=None):
+        return CategoryAnalytics.objects.get(user=self.user, category=category, analysis_month=month or self.MONTH)
+
+    def test_fresh_build(self):
+        self.assertEqual(self.materialize(), {'categories': 2, 'updated': 2, 'removed': 0})
+        food = self.row(self.food)
+        self.assertEqual(food.total_spent, Decimal('80.00'))
+        self.assertEqual(food.transaction_count, 3)
+        self.assertEqual(food.average_transaction_amount, Decimal('26.67'))
+        self.assertEqual(food.previous_month_spent, Decimal('40.00'))
+        self.assertEqual(food.percentage_change, Decimal('100.00'))
+        self.assertEqual(food.budgeted_amount, Decimal('310.00'))
+        self.assertEqual(food.budget_variance, Decimal('-230.00'))
+        self.assertEqual((food.most_frequent_merchant, food.merchant_frequency_count), ('Deli', 2))
+        self.assertEqual(food.peak_spending_day, 'Saturday')
+        self.assertEqual(food.peak_spending_time, time(19))
+
+        fun = self.row(self.fun)
+        self.assertIsNone(fun.budgeted_amount)
+        self.assertEqual(fun.percentage_change, Decimal('0.00'))
+        self.assertEqual(fun.most_frequent_merchant, 'Cinema')
+
+    def test_unchanged_month_is_skipped(self):
+        self.materialize()
+        self.assertEqual(self.materialize(), {'categories': 2, 'updated': 0, 'removed': 0})
+        self.assertEqual(self.materialize(full=True)['updated'], 2)
+
+    def test_new_transaction_refreshes_only_its_category(self):
+        self.materialize()
+        fun_written = self.row(self.fun).updated_at
+
+        # A late charge arrives for the past month
+        self.add(self.food, '60.00', datetime(2026, 8, 3, 9), 'Deli')
+        self.assertEqual(self.materialize(), {'categories': 2, 'updated': 1, 'removed': 0})
+        food = self.row(self.food)
+        self.assertEqual(food.total_spent, Decimal('140.00'))
+        self.assertEqual(food.peak_spending_day, 'Monday')
+        self.assertEqual(food.merchant_frequency_count, 3)
+        self.assertEqual(self.row(self.fun).updated_at, fun_written)
+
+    def test_previous_month_change_refreshes_comparison(self):
+        self.materialize()
+        self.add(self.food, '40.00', datetime(2026, 7, 20, 12), 'Bistro')
+        self.assertEqual(self.materialize()['updated'], 1)
+        food = self.row(self.food)
+        self.assertEqual(food.previous_month_spent, Decimal('80.00'))
+        self.assertEqual(food.percentage_change, Decimal('0.00'))
+
+    def test_deletions(self):
+        self.materialize()
+        Transaction.objects.filter(category=self.food, merchant_name='Bistro', transaction_date__month=8).delete()
+        self.cinema.delete()
+
+        self.assertEqual(self.materialize(), {'categories': 1, 'updated': 1, 'removed': 1})
+        food = self.row(self.food)
+        self.assertEqual(food.total_spent, Decimal('30.00'))
+        self.assertEqual(food.peak_spending_day, 'Monday')
+        self.assertFalse(CategoryAnalytics.objects.filter(category=self.fun).exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('materialize_category_analytics', '--month', '2026-08', '--user', 'categories@example.com', stdout=out)
+        self.assertIn('2026-08: updated 2 of 2 categories', out.getvalue())
+        self.assertEqual(CategoryAnalytics.objects.filter(user=self.user).count(), 2)
@@ -8,10 +8,13 @@ from django.utils import timezone
 from datetime import datetime, timedelta, date
 from decimal import Decimal
 import json
-import random
 from math import exp, log
 
-from apps.core.models import User, Transaction, Budget, Goal, Account, Category
+from apps.core.models import User, Transaction, Budget, Goal, Account, Category, RecurringTransaction
+from apps.core.scoring import HealthScoreEngine
+from apps.core.services import TransactionRollupService, rollup_month
+
+from .forecasting import CashFlowForecaster, forecast_confidence
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -23,36 +26,35 @@ def financial_health_forecast(request):
         # Get current financial health score
         current_score = calculate_financial_health_score(user)
         
-        # Get historical data for trend analysis
-        last_3_months = []
-        for i in range(3):
-            month_date = timezone.now() - timedelta(days=30 * (i + 1))
-            month_score = calculate_historical_score(user, month_date)
-            last_3_months.append(month_score)
-        
-        # Calculate trend
-        trend = calculate_trend(last_3_months)
+        # Month-end scores of the last three months, precomputed by the backfill
+        engine = HealthScoreEngine()
+        history = engine.history(user, months=3)
+        trend = calculate_trend([current_score] + [point['score'] for point in reversed(history)])
+        
+        # Score each of the next three 30-day windows of the cash-flow
+        # forecast against today's balances and budgets
+        forecast = CashFlowForecaster(user).forecast()
+        windows = forecast['months']
+        projected = engine.project(
+            user, [window['income'] for window in windows], [window['expenses'] for window in windows]
+        )
         
-        # Predict future scores with some variation
         predictions = []
-        base_score = current_score
-        
-        for month in range(1, 4):
-            # Apply trend with some randomness for realism
-            predicted_score = base_score + (trend * month) + random.randint(-2, 3)
-            predicted_score = max(0, min(100, predicted_score))
+        for window, predicted_score in zip(windows, projected):
             predictions.append({
-                'month': f'Month {month}',
-                'score': int(predicted_score),
-                'improvement': predicted_score - current_score
+                'month': f"Month {window['month']}",
+                'score': predicted_score,
+                'improvement': predicted_score - current_score,
+                'income': window['income'],
+                'expenses': window['expenses']
             })
-            base_score = predicted_score
         
         # Generate expected improvements
         improvements = generate_improvement_predictions(user, current_score)
         
         return Response({
             'current_score': current_score,
+            'history': history,
             'predictions': predictions,
             'improvements': improvements,
             'trend': 'improving' if trend > 0 else 'declining' if trend < 0 else 'stable'
@@ -71,68 +73,45 @@ def spending_forecast(request):
     user = request.user
     
     try:
-        # Get spending patterns from last 6 months
-        six_months_ago = timezone.now() - timedelta(days=180)
-        
-        # Analyze spending by category
-        category_patterns = {}
-        categories = Category.objects.filter(user=user, category_type='expense')
-        
-        for category in categories:
-            transactions = Transaction.objects.filter(
-                user=user,
-                category=category,
-                transaction_date__gte=six_months_ago
-            )
-            
-            if transactions.exists():
-                avg_amount = transactions.aggregate(avg=Avg('amount'))['avg'] or Decimal('0')
-                frequency = transactions.count() / 6  # per month
-                
-                category_patterns[category.name] = {
-                    'avg_amount': float(avg_amount),
-                    'frequency': frequency,
-                    'icon': category.icon,
-                    'color': category.color
-                }
+        forecast = CashFlowForecaster(user).forecast()
         
         # Generate predictions
         predictions = []
         
-        # Subscription-like expenses (high frequency, consistent amount)
-        subscription_categories = ['Bills & Utilities', 'Internet', 'Phone']
-        for cat_name, pattern in category_patterns.items():
-            if cat_name in subscription_categories or pattern['frequency'] > 3:
-                predictions.append({
-                    'category': cat_name,
-                    'amount': round(pattern['avg_amount'], 2),
-                    'date': 'Next 7 days',
-                    'confidence': 'High',
-                    'type': 'recurring'
-                })
-        
-        # Regular expenses (medium frequency)
-        regular_categories = ['Food & Dining', 'Transportation', 'Shopping']
-        for cat_name, pattern in category_patterns.items():
-            if cat_name in regular_categories or (1 <= pattern['frequency'] <= 3):
-                predictions.append({
-                    'category': cat_name,
-                    'amount': round(pattern['avg_amount'] * pattern['frequency'], 2),
-                    'date': 'This month',
-                    'confidence': 'Medium',
-                    'type': 'regular'
-                })
+        # Recurring charges: templates the user set up or that were detected
+        # in their history, due within the next 30 days
+        today = timezone.localdate()
+        upcoming = RecurringTransaction.objects.filter(
+            user=user,
+            transaction_type='debit',
+            next_due_date__gte=today,
+            next_due_date__lte=today + timedelta(days=30)
+        ).filter(
+            Q(is_active=True) | Q(source='detected')
+        ).values('name', 'category__name', 'amount', 'next_due_date', 'confidence_score')
+        for template in upcoming:
+            predictions.append({
+                'category': template['category__name'] or template['name'],
+                'merchant': template['name'],
+                'amount': round(float(template['amount']), 2),
+                'date': template['next_due_date'].isoformat(),
+                'confidence': 'High' if template['confidence_score'] >= 0.8 else 'Medium',
+                'type': 'recurring'
+            })
         
-        # Occasional expenses (low frequency, variable amount)
-        occasional_categories = ['Healthcare', 'Maintenance', 'Entertainment']
-        for cat_name, pattern in category_patterns.items():
-            if cat_name in occasional_categories or pattern['frequency'] < 1:
+        # Category spending expected over the next 30 days
+        for item in forecast['categories']:
+            band = item['horizons']['30']
+            if band['expected'] > 0:
                 predictions.append({
-                    'category': cat_name,
-                    'amount': round(pattern['avg_amount'], 2),
-                    'date': 'Next month',
-                    'confidence': 'Low',
-                    'type': 'occasional'
+                    'category': item['category'],
+                    'icon': item['icon'],
+                    'color': item['color'],
+                    'amount': band['expected'],
+                    'range': [band['lower'], band['upper']],
+                    'date': 'Next 30 days',
+                    'confidence': forecast_confidence(band),
+                    'type': 'forecast'
                 })
         
         # Sort by confidence and amount
@@ -143,7 +122,10 @@ def spending_forecast(request):
         
         return Response({
             'predictions': predictions[:8],  # Limit to top 8
-            'total_predicted': sum(p['amount'] for p in predictions),
+            # Recurring charges are part of the category history, so the
+            # total comes from the expense forecast rather than the list
+            'total_predicted': forecast['horizons'][0]['expenses']['expected'] if forecast['horizons'] else 0,
+            'cash_flow': forecast['horizons'],
             'last_updated': timezone.now().isoformat()
         })
         
@@ -306,78 +288,7 @@ def generate_forecast(request):
 # Helper functions
 def calculate_financial_health_score(user):
     """Calculate current financial health score"""
-    score = 50  # Base score
-    
-    try:
-        current_month = timezone.now().month
-        current_year = timezone.now().year
-        
-        # Monthly income and expenses
-        monthly_income = Transaction.objects.filter(
-            user=user,
-            category__category_type='income',
-            transaction_date__month=current_month,
-            transaction_date__year=current_year
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        monthly_expenses = Transaction.objects.filter(
-            user=user,
-            category__category_type='expense',
-            transaction_date__month=current_month,
-            transaction_date__year=current_year
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        # Savings rate bonus
-        if monthly_income > 0:
-            savings_rate = ((monthly_income - monthly_expenses) / monthly_income) * 100
-            if savings_rate >= 20:
-                score += 20
-            elif savings_rate >= 10:
-                score += 15
-            elif savings_rate >= 5:
-                score += 10
-            elif savings_rate >= 0:
-                score += 5
-        
-        # Account diversity
-        account_count = Account.objects.filter(user=user, is_active=True).count()
-        if account_count >= 3:
-            score += 15
-        elif account_count >= 2:
-            score += 10
-        elif account_count >= 1:
-            score += 5
-        
-        # Budget adherence
-        active_budgets = Budget.objects.filter(
-            user=user,
-            is_active=True,
-            end_date__gte=timezone.now().date()
-        ).count()
-        if active_budgets >= 3:
-            score += 15
-        elif active_budgets >= 1:
-            score += 10
-        
-        # Goal progress
-        active_goals = Goal.objects.filter(user=user, is_active=True).count()
-        if active_goals >= 2:
-            score += 10
-        elif active_goals >= 1:
-            score += 5
-        
-        return max(0, min(100, score))
-        
-    except Exception:
-        return 50
-
-def calculate_historical_score(user, date):
-    """Calculate historical score for a specific date"""
-    # Simplified calculation for demo
-    base_score = calculate_financial_health_score(user)
-    # Add some variance based on date
-    variance = (date.day % 10) - 5
-    return max(0, min(100, base_score + variance))
+    return HealthScoreEngine().current(user).overall_score
 
 def calculate_trend(scores):
     """Calculate trend from historical scores"""
@@ -391,23 +302,10 @@ def generate_improvement_predictions(user, current_score):
     """Generate specific improvement predictions"""
     improvements = []
     
-    # Get current metrics
-    current_month = timezone.now().month
-    current_year = timezone.now().year
-    
-    monthly_income = Transaction.objects.filter(
-        user=user,
-        category__category_type='income',
-        transaction_date__month=current_month,
-        transaction_date__year=current_year
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-    
-    monthly_expenses = Transaction.objects.filter(
-        user=user,
-        category__category_type='expense',
-        transaction_date__month=current_month,
-        transaction_date__year=current_year
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    # Get current metrics from the rollup table
+    monthly_income, monthly_expenses = TransactionRollupService.month_totals(
+        user, rollup_month(timezone.now())
+    )
     
     # Calculate savings rate
     if monthly_income > 0:
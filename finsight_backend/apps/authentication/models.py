@@ -129,28 +129,9 @@ class User(AbstractUser):
     
     def update_financial_health_score(self):
         """Calculate and update the user's financial health score"""
-        # This would contain complex logic to calculate the score
-        # For now, we'll implement a basic placeholder
-        score = 50  # Base score
+        from apps.core.scoring import HealthScoreEngine
         
-        # Add points for completed profile
-        if self.onboarding_completed:
-            score += 10
-        
-        # Add points for verified contact info
-        if self.email_verified:
-            score += 5
-        if self.phone_verified:
-            score += 5
-        
-        # Additional scoring logic would go here based on:
-        # - Transaction history
-        # - Budget adherence
-        # - Goal progress
-        # - Debt-to-income ratio
-        # - Emergency fund status
-        
-        self.financial_health_score = min(score, 100)
+        self.financial_health_score = HealthScoreEngine().current(self).overall_score
         self.save(update_fields=['financial_health_score'])
         
         return self.financial_health_score
@@ -6,6 +6,7 @@ from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
 from apps.ai.services import GeminiAIService, FinancialContextBuilder
 from apps.ai.models import AIConversation, AIMessage
+from apps.ai.prompting import AssembledPrompt, PromptAssembler
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -110,7 +111,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 return
             
             # Save user message
-            await self.save_message(
+            user_msg = await self.save_message(
                 role='user',
                 content=user_message,
                 message_type='text'
@@ -127,11 +128,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Show typing indicator
             await self.send_typing_indicator(True)
             
-            # Build financial context
+            # Build financial context and windowed history within the token budget
             financial_context = await self.build_financial_context()
-            
+            prompt = await self.assemble_prompt(user_message, financial_context, user_msg.id)
+
+            # Clients that opt in receive the reply chunk by chunk
+            if data.get('stream'):
+                await self.stream_ai_response(user_message, prompt)
+                return
+
             # Generate AI response
-            ai_response = await self.generate_ai_response(user_message, financial_context)
+            ai_response = await self.generate_ai_response(user_message, prompt.context, prompt.history)
             
             # Hide typing indicator
             await self.send_typing_indicator(False)
@@ -151,23 +158,70 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send_typing_indicator(False)
             await self.send_error("Sorry, I couldn't process your message right now.")
     
-    async def generate_ai_response(self, user_message: str, financial_context: str) -> str:
+    async def generate_ai_response(self, user_message: str, financial_context: str, history: str = "") -> str:
         """
         Generate AI response using Gemini service.
         """
         try:
-            # Run AI service in thread pool to avoid blocking
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                self.ai_service.generate_financial_response,
+            # Await the shared async client directly; no executor thread needed
+            return await self.ai_service.agenerate_financial_response(
                 user_message,
-                financial_context
+                financial_context,
+                user=self.user,
+                history=history
             )
-            return response
         except Exception as e:
             logger.error(f"Error generating AI response: {e}")
             return "I'm having trouble processing your request right now. Please try again in a moment."
-    
+
+    async def stream_ai_response(self, user_message: str, prompt: AssembledPrompt):
+        """
+        Forward response chunks as they arrive, then save the assembled message.
+        
+        If the stream breaks part way, the client gets an error for the
+        message id instead of ``ai_message_complete`` and nothing is saved.
+        """
+        message_id = str(uuid.uuid4())
+        chunks = []
+
+        try:
+            async for chunk in self.ai_service.astream_financial_response(
+                user_message, prompt.context, history=prompt.history
+            ):
+                if not chunks:
+                    await self.send_typing_indicator(False)
+                chunks.append(chunk)
+                await self.send(text_data=json.dumps({
+                    'type': 'ai_message_chunk',
+                    'message_id': message_id,
+                    'index': len(chunks) - 1,
+                    'chunk': chunk,
+                    'timestamp': self.get_timestamp()
+                }))
+        except Exception as e:
+            logger.error(f"Error streaming AI response: {e}")
+            if not chunks:
+                await self.send_typing_indicator(False)
+            await self.send_error("The reply was interrupted. Please try again.", message_id=message_id)
+            return
+
+        if not chunks:
+            await self.send_typing_indicator(False)
+
+        ai_response = ''.join(chunks).strip()
+        await self.save_message(
+            role='assistant',
+            content=ai_response,
+            message_type='text'
+        )
+
+        await self.send(text_data=json.dumps({
+            'type': 'ai_message_complete',
+            'message_id': message_id,
+            'chunk_count': len(chunks),
+            'timestamp': self.get_timestamp()
+        }))
+
     async def send_ai_message(self, message: str):
         """
         Send AI message to WebSocket client.
@@ -179,15 +233,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'message_id': str(uuid.uuid4())
         }))
     
-    async def send_error(self, error_message: str):
+    async def send_error(self, error_message: str, message_id: str = None):
         """
-        Send error message to client.
+        Send error message to client, tied to a streamed message if given.
         """
-        await self.send(text_data=json.dumps({
+        payload = {
             'type': 'error',
             'message': error_message,
             'timestamp': self.get_timestamp()
-        }))
+        }
+        if message_id:
+            payload['message_id'] = message_id
+        await self.send(text_data=json.dumps(payload))
     
     async def send_typing_indicator(self, is_typing: bool):
         """
@@ -249,6 +306,20 @@ class ChatConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error building financial context: {e}")
             return "Financial data is currently unavailable."
     
+    @database_sync_to_async
+    def assemble_prompt(self, user_message: str, financial_context: str, exclude_id) -> AssembledPrompt:
+        """
+        Add conversation history to the context, folding old turns into the summary.
+        """
+        try:
+            return PromptAssembler(
+                self.conversation,
+                summarize=self.ai_service.summarize_conversation
+            ).assemble(user_message, financial_context, exclude_id=exclude_id)
+        except Exception as e:
+            logger.error(f"Error assembling prompt: {e}")
+            return AssembledPrompt(financial_context, "", 0)
+    
     async def handle_feedback(self, data):
         """
         Handle user feedback on AI responses.
@@ -0,0 +1,158 @@
+# Core Bulk Edits - Set-based transaction update and delete
+"""
+Update or delete many of a user's transactions at once.
+
+A selection is an explicit id list, a filter (text, date and amount ranges,
+categories, accounts, type), or both. Each operation runs in one database
+transaction: a single ``UPDATE ... WHERE`` over the selection, or a
+``QuerySet.delete()`` with the per-row receivers suspended. Before the write, the affected ids, months and categories
+are read (and locked where the backend supports it), so the change feed,
+the monthly rollups and the cached budget spend can be brought up to date
+afterwards with one ``transactions_bulk_changed`` signal instead of
+per-row receivers.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Account, Category, Transaction
+from .services import ChangeFeed, rollup_month
+from .signals import suspend_row_signals, transactions_bulk_changed
+
+# Fields a bulk update may set
+UPDATABLE_FIELDS = (
+    'category', 'account', 'transaction_type', 'description', 'merchant_name', 'notes',
+    'is_hidden', 'is_pending', 'is_recurring',
+)
+
+
+class BulkEditError(ValueError):
+    """The selection or the changes are not valid"""
+
+
+class TransactionBulkEditor:
+    """Set-based edits over a selection of one user's transactions"""
+
+    def __init__(self, user, ids=(), text=None, date_from=None, date_to=None, amount_min=None,
+                 amount_max=None, categories=(), uncategorized=False, accounts=(), transaction_type=None):
+        self.user = user
+        self.ids = list(ids)
+        self.text = (text or '').strip()
+        self.date_from = date_from
+        self.date_to = date_to
+        self.amount_min = amount_min
+        self.amount_max = amount_max
+        self.categories = list(categories)
+        self.uncategorized = uncategorized
+        self.accounts = list(accounts)
+        self.transaction_type = transaction_type
+
+    def selection(self):
+        criteria = Q()
+        if self.ids:
+            criteria &= Q(pk__in=self.ids)
+        if self.text:
+            criteria &= Q(merchant_name__icontains=self.text) | Q(description__icontains=self.text)
+        if self.date_from is not None:
+            criteria &= Q(transaction_date__gte=self.date_from)
+        if self.date_to is not None:
+            criteria &= Q(transaction_date__lte=self.date_to)
+        if self.amount_min is not None:
+            criteria &= Q(amount__gte=self.amount_min)
+        if self.amount_max is not None:
+            criteria &= Q(amount__lte=self.amount_max)
+        if self.categories or self.uncategorized:
+            category = Q(category__in=self.categories) if self.categories else Q(pk__in=[])
+            criteria &= (category | Q(category__isnull=True)) if self.uncategorized else category
+        if self.accounts:
+            criteria &= Q(account__in=self.accounts)
+        if self.transaction_type:
+            criteria &= Q(transaction_type=self.transaction_type)
+        if not criteria:
+            raise BulkEditError('Select transactions by ids or at least one filter')
+        return Transaction.objects.filter(criteria, user=self.user)
+
+    def affected(self, selection):
+        """Lock the selected rows; return their ids, months and categories"""
+        ids, months, category_ids = [], set(), set()
+        month_of = {}
+        rows = selection.select_for_update().values_list('id', 'transaction_date', 'category_id')
+        for pk, transaction_date, category_id in rows:
+            ids.append(pk)
+            if transaction_date not in month_of:
+                month_of[transaction_date] = rollup_month(transaction_date)
+                months.add(month_of[transaction_date])
+            category_ids.add(category_id)
+        return ids, months, category_ids
+
+    def clean_changes(self, changes):
+        """Model values for ``changes``; references must be the user's own"""
+        if not changes:
+            raise BulkEditError('No changes given')
+        unknown = set(changes) - set(UPDATABLE_FIELDS)
+        if unknown:
+            raise BulkEditError(f"Cannot bulk update: {', '.join(sorted(unknown))}")
+
+        values = {}
+        for name, value in changes.items():
+            if name == 'category':
+                if value is None:
+                    values['category'] = None
+                else:
+                    values['category'] = self.owned(Category, value, name)
+                # A category picked by the user replaces any prediction
+                values.update(ai_categorized=False, confidence_score=1.0)
+            elif name == 'account':
+                values['account'] = self.owned(Account, value, name)
+            else:
+                field = Transaction._meta.get_field(name)
+                try:
+                    values[name] = field.clean(value, None)
+                except ValidationError as e:
+                    raise BulkEditError(f"{name}: {' '.join(e.messages)}")
+        return values
+
+    def owned(self, model, pk, name):
+        try:
+            obj = model.objects.filter(user=self.user, pk=pk).first()
+        except (ValueError, ValidationError):
+            obj = None
+        if obj is None:
+            raise BulkEditError(f'{name} not found')
+        return obj
+
+    def update(self, changes):
+        """Apply ``changes`` to every selected transaction with one UPDATE"""
+        values = self.clean_changes(changes)
+        selection = self.selection()
+        with db_transaction.atomic():
+            ids, months, category_ids = self.affected(selection)
+            updated = selection.update(updated_at=timezone.now(), **values) if ids else 0
+            ChangeFeed.record(self.user.pk, 'Transaction', ids)
+        if 'category' in values:
+            category_ids.add(values['category'].pk if values['category'] else None)
+        self.announce(months, category_ids)
+        return {'matched': len(ids), 'updated': updated}
+
+    def delete(self):
+        """Delete every selected transaction with one DELETE"""
+        selection = self.selection()
+        with db_transaction.atomic():
+            ids, months, category_ids = self.affected(selection)
+            deleted = 0
+            if ids:
+                # Relations pointing at the rows get their on_delete handling;
+                # the per-row receivers give way to the feed record and the
+                # one bulk signal below
+                with suspend_row_signals():
+                    deleted = selection.delete()[1].get(Transaction._meta.label, 0)
+            ChangeFeed.record(self.user.pk, 'Transaction', ids, action='delete')
+        self.announce(months, category_ids)
+        return {'matched': len(ids), 'deleted': deleted}
+
+    def announce(self, months, category_ids):
+        if months:
+            transactions_bulk_changed.send(
+                sender=Transaction, user=self.user, months=months, category_ids=category_ids
+            )
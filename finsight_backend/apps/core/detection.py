@@ -0,0 +1,294 @@
+# Core Detection - Recurring charge detection
+"""
+Find subscriptions and other periodic charges in a user's transactions.
+
+Debits are grouped by a normalized merchant key and analysed together as
+NumPy arrays, one pass for all merchants:
+
+- the mean gap between a merchant's charges picks the nearest schedule
+  (weekly, monthly, quarterly, yearly),
+- the spread of the gaps around it and of the amounts around their mean,
+  plus the number of charges, give a confidence,
+- a merchant not seen for two periods is treated as cancelled.
+
+Merchants that look periodic are stored as detected ``RecurringTransaction``
+rows and their transactions are flagged ``is_recurring``. Detected rows
+start inactive so the scheduler never generates from them; a user who
+confirms one turns it on.
+
+Runs are incremental. The newest ``created_at`` seen is kept in the cache,
+and a later run exits after one query when nothing was added, or rewrites
+only the merchants that received new transactions.
+"""
+import re
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import RecurringTransaction, Transaction
+from .services import ChangeFeed, FinancialDataVersion
+
+# Fields a detection run writes on templates the user has not confirmed
+DETECTED_FIELDS = [
+    'account_id', 'category_id', 'name', 'amount', 'description', 'merchant_name', 'frequency',
+    'start_date', 'next_due_date', 'confidence_score', 'occurrence_count', 'last_occurrence', 'updated_at',
+]
+# Confirmed templates belong to the user and the scheduler; only the stats are refreshed
+DETECTION_STATS_FIELDS = ['confidence_score', 'occurrence_count', 'last_occurrence', 'updated_at']
+
+# Schedule -> mean days between charges
+PERIODS = OrderedDict([
+    ('weekly', 7.0),
+    ('monthly', 30.44),
+    ('quarterly', 91.31),
+    ('yearly', 365.25),
+])
+
+MIN_OCCURRENCES = 3
+MIN_CONFIDENCE = 0.6
+
+# How far the mean gap may drift from its schedule, as a share of it
+PERIOD_TOLERANCE = 0.15
+
+# Gap spread (share of the period) and amount spread (share of the mean)
+# at which regularity and stability reach zero
+MAX_GAP_SPREAD = 0.2
+MAX_AMOUNT_SPREAD = 0.25
+
+# Charges needed for full support
+FULL_SUPPORT = 6
+
+# Only this much history is analysed
+LOOKBACK_DAYS = 4 * 366
+
+NOISE_WORDS = {
+    'pos', 'purchase', 'debit', 'card', 'ach', 'payment', 'recurring', 'autopay', 'online', 'www',
+    'com', 'net', 'inc', 'llc', 'ltd', 'co', 'the',
+}
+
+
+def merchant_key(merchant_name, description):
+    """Letters-only words of the merchant (or description) without billing noise"""
+    text = (merchant_name or description or '').lower()
+    words = [word for word in re.findall(r'[a-z]+', text) if len(word) > 1 and word not in NOISE_WORDS]
+    return ' '.join(words[:3])[:100]
+
+
+def analyse(codes, days, amounts, today):
+    """
+    Per-group recurrence statistics. ``codes`` (group numbers from 0),
+    ``days`` (day ordinals) and ``amounts`` must be sorted by group, then
+    day. Returns a dict of arrays indexed by group.
+    """
+    groups = int(codes.max()) + 1
+    counts = np.bincount(codes, minlength=groups)
+    last = np.cumsum(counts) - 1
+
+    # Gaps between consecutive charges of the same group
+    same = codes[1:] == codes[:-1]
+    gap_codes = codes[1:][same]
+    gaps = np.diff(days)[same].astype(float)
+    gap_counts = np.bincount(gap_codes, minlength=groups)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_gap = np.bincount(gap_codes, weights=gaps, minlength=groups) / gap_counts
+        gap_spread = np.sqrt(np.maximum(
+            np.bincount(gap_codes, weights=gaps ** 2, minlength=groups) / gap_counts - mean_gap ** 2, 0
+        ))
+        mean_amount = np.bincount(codes, weights=amounts, minlength=groups) / counts
+        amount_spread = np.sqrt(np.maximum(
+            np.bincount(codes, weights=amounts ** 2, minlength=groups) / counts - mean_amount ** 2, 0
+        ))
+
+        periods = np.array(list(PERIODS.values()))
+        drift = np.abs(mean_gap[:, None] - periods[None, :]) / periods[None, :]
+        schedule = np.nan_to_num(drift, nan=np.inf).argmin(axis=1)
+        period = periods[schedule]
+        drift = drift[np.arange(groups), schedule]
+
+        regularity = np.clip(1 - gap_spread / (period * MAX_GAP_SPREAD), 0, 1)
+        stability = np.clip(1 - amount_spread / np.abs(mean_amount) / MAX_AMOUNT_SPREAD, 0, 1)
+    support = np.clip((counts - 1) / (FULL_SUPPORT - 1), 0, 1)
+    confidence = np.nan_to_num(0.45 * regularity + 0.35 * stability + 0.2 * support)
+
+    current = today - days[last] <= 2 * period
+    periodic = (
+        (counts >= MIN_OCCURRENCES) & (drift <= PERIOD_TOLERANCE)
+        & (confidence >= MIN_CONFIDENCE) & current
+    )
+    return {
+        'count': counts,
+        'last': last,
+        'schedule': schedule,
+        'confidence': confidence,
+        'periodic': periodic,
+    }
+
+
+class RecurringChargeDetector:
+    """Detect one user's periodic charges"""
+
+    COLUMNS = (
+        'id', 'merchant_name', 'description', 'transaction_date', 'amount', 'account_id',
+        'category_id', 'is_recurring', 'created_at',
+    )
+
+    def __init__(self, user, today=None):
+        self.user = user
+        self.today = today or timezone.localdate()
+
+    @staticmethod
+    def state_key(user_id):
+        return f"recurring_detection:{user_id}"
+
+    def debits(self):
+        since = timezone.now() - timedelta(days=LOOKBACK_DAYS)
+        return Transaction.objects.filter(
+            user=self.user, transaction_type='debit', transaction_date__gte=since
+        )
+
+    def run(self, full=False):
+        """Analyse the user's debits and store what looks periodic; return a report"""
+        watermark = None if full else cache.get(self.state_key(self.user.pk))
+        report = {'analyzed': 0, 'merchants': 0, 'detected': 0, 'created': 0, 'updated': 0, 'removed': 0, 'flagged': 0}
+        if watermark is not None:
+            fresh = self.debits().filter(created_at__gt=watermark).values_list('merchant_name', 'description')
+            changed = {merchant_key(*row) for row in fresh}
+            if not changed:
+                return report
+        else:
+            changed = None
+
+        rows = list(self.debits().order_by().values_list(*self.COLUMNS))
+        report['analyzed'] = len(rows)
+        if rows:
+            keys, detected = self.detect(rows)
+            report['merchants'] = len(keys)
+            report['detected'] = len(detected)
+            report.update(self.store(detected, changed))
+            cache.set(self.state_key(self.user.pk), max(row[-1] for row in rows), None)
+        return report
+
+    def detect(self, rows):
+        """Group ``rows`` by merchant and return ``(keys, {key: summary})`` for periodic ones"""
+        keys = {}
+        local_days = {}
+        codes, days, amounts = [], [], []
+        normalized = {}
+        for row in rows:
+            names = (row[1], row[2])
+            if names not in normalized:
+                normalized[names] = merchant_key(*names)
+            key = normalized[names]
+            if not key:
+                codes.append(-1)
+            else:
+                codes.append(keys.setdefault(key, len(keys)))
+            moment = row[3]
+            if moment not in local_days:
+                local_days[moment] = timezone.localtime(moment).date().toordinal()
+            days.append(local_days[moment])
+            amounts.append(float(row[4]))
+        if not keys:
+            return keys, {}
+
+        codes = np.array(codes)
+        keep = codes >= 0
+        order = np.lexsort((np.array(days)[keep], codes[keep]))
+        index = np.flatnonzero(keep)[order]
+        stats = analyse(codes[index], np.array(days)[index], np.array(amounts)[index], self.today.toordinal())
+
+        names = list(keys)
+        schedules = list(PERIODS)
+        detected = {}
+        for group in np.flatnonzero(stats['periodic']):
+            count = int(stats['count'][group])
+            end = int(stats['last'][group])
+            members = [rows[i] for i in index[end - count + 1:end + 1]]
+            detected[names[group]] = {
+                'frequency': schedules[stats['schedule'][group]],
+                'confidence': round(float(stats['confidence'][group]), 4),
+                'rows': members,
+            }
+        return keys, detected
+
+    def store(self, detected, changed=None):
+        """
+        Upsert detected templates and flag their transactions. With
+        ``changed`` only those merchants are rewritten; otherwise every
+        detected template of the user is. Confirmed (active) templates keep
+        the user's edits and schedule and only get fresh detection stats.
+        """
+        if changed is not None:
+            detected = {key: summary for key, summary in detected.items() if key in changed}
+        existing = RecurringTransaction.objects.filter(user=self.user, source='detected')
+        if changed is not None:
+            existing = existing.filter(merchant_key__in=changed)
+        existing = {template.merchant_key: template for template in existing}
+
+        now = timezone.now()
+        created, updated, refreshed, flagged = [], [], [], []
+        for key, summary in detected.items():
+            members = summary['rows']
+            first, latest = members[0], members[-1]
+            last_day = timezone.localtime(latest[3]).date()
+            values = {
+                'account_id': latest[5],
+                'category_id': latest[6],
+                'name': (latest[1] or latest[2])[:255],
+                'amount': latest[4],
+                'description': latest[2],
+                'merchant_name': latest[1],
+                'frequency': summary['frequency'],
+                'start_date': timezone.localtime(first[3]).date(),
+                'next_due_date': last_day + self.step(summary['frequency']),
+                'confidence_score': summary['confidence'],
+                'occurrence_count': len(members),
+                'last_occurrence': last_day,
+                'updated_at': now,
+            }
+            template = existing.pop(key, None)
+            if template is None:
+                created.append(RecurringTransaction(
+                    user=self.user, transaction_type='debit', source='detected', merchant_key=key,
+                    is_active=False, **values
+                ))
+            else:
+                fields = DETECTION_STATS_FIELDS if template.is_active else DETECTED_FIELDS
+                for name in fields:
+                    setattr(template, name, values[name])
+                (refreshed if template.is_active else updated).append(template)
+            flagged += [row[0] for row in members if not row[7]]
+
+        # Inactive detections that no longer hold are dropped; confirmed ones stay
+        stale = [template.pk for template in existing.values() if not template.is_active]
+        with db_transaction.atomic():
+            RecurringTransaction.objects.bulk_create(created, batch_size=500)
+            if updated:
+                RecurringTransaction.objects.bulk_update(updated, DETECTED_FIELDS, batch_size=500)
+            if refreshed:
+                RecurringTransaction.objects.bulk_update(refreshed, DETECTION_STATS_FIELDS, batch_size=500)
+            RecurringTransaction.objects.filter(pk__in=stale).delete()
+            if flagged:
+                Transaction.objects.filter(pk__in=flagged).update(is_recurring=True, updated_at=now)
+                ChangeFeed.record(self.user.pk, 'Transaction', flagged)
+        if flagged:
+            FinancialDataVersion.bump(self.user.pk)
+        return {
+            'created': len(created), 'updated': len(updated) + len(refreshed), 'removed': len(stale),
+            'flagged': len(flagged),
+        }
+
+    @staticmethod
+    def step(frequency):
+        return {
+            'weekly': relativedelta(weeks=1),
+            'monthly': relativedelta(months=1),
+            'quarterly': relativedelta(months=3),
+            'yearly': relativedelta(years=1),
+        }[frequency]
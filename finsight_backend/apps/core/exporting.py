@@ -0,0 +1,260 @@
+# Core Export - Streaming transaction export
+"""
+Export a user's transactions as CSV, JSON Lines or Parquet.
+
+Rows are read with ``QuerySet.iterator`` (a server-side cursor on
+PostgreSQL) as plain value tuples, so memory depends on the chunk size, not
+on the user's history. CSV and JSON Lines are produced as generators for a
+``StreamingHttpResponse``: the header goes out before the first query and
+rows follow in small blocks.
+
+Parquet is written by a background job, one record batch per chunk, to a
+temporary file that is then saved to media storage with ``pyarrow``. Job
+progress is kept in the cache under the job id, like imports; a job that
+fails is logged and left with ``status: failed`` and the error.
+"""
+import csv
+import io
+import json
+import logging
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import timezone as dt_timezone
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from .models import Transaction
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2000
+STREAM_BLOCK_ROWS = 500
+PROGRESS_TTL = 60 * 60
+
+# Output column -> queryset lookup
+EXPORT_COLUMNS = OrderedDict([
+    ('id', 'id'),
+    ('date', 'transaction_date'),
+    ('amount', 'amount'),
+    ('type', 'transaction_type'),
+    ('description', 'description'),
+    ('merchant', 'merchant_name'),
+    ('category', 'category__name'),
+    ('account', 'account__name'),
+    ('notes', 'notes'),
+    ('location', 'location'),
+    ('external_id', 'external_id'),
+    ('pending', 'is_pending'),
+])
+
+STREAM_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+JOB_FORMATS = ('parquet',)
+
+
+class ExportFormatError(ValueError):
+    """The export cannot be produced in the requested format"""
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def text_value(value):
+    """A cell as text: ISO dates, plain decimals, empty for None"""
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class TransactionExporter:
+    """Export one user's transactions, optionally filtered"""
+
+    def __init__(self, user, date_from=None, date_to=None, accounts=(), categories=(),
+                 job_id=None, chunk_size=CHUNK_SIZE):
+        self.user = user
+        self.date_from = date_from
+        self.date_to = date_to
+        self.accounts = list(accounts)
+        self.categories = list(categories)
+        self.job_id = job_id or str(uuid.uuid4())
+        self.chunk_size = chunk_size
+        self.progress = {
+            'job_id': self.job_id,
+            'status': 'queued',
+            'format': None,
+            'exported': 0,
+            'file': None,
+        }
+
+    def queryset(self):
+        queryset = Transaction.objects.filter(user=self.user)
+        if self.date_from is not None:
+            queryset = queryset.filter(transaction_date__gte=self.date_from)
+        if self.date_to is not None:
+            queryset = queryset.filter(transaction_date__lte=self.date_to)
+        if self.accounts:
+            queryset = queryset.filter(account__in=self.accounts)
+        if self.categories:
+            queryset = queryset.filter(category__in=self.categories)
+        return queryset.order_by('transaction_date', 'id').values_list(*EXPORT_COLUMNS.values())
+
+    def rows(self):
+        return self.queryset().iterator(chunk_size=self.chunk_size)
+
+    # Streaming formats
+
+    def stream(self, file_format):
+        if file_format not in STREAM_FORMATS:
+            raise ExportFormatError(f"Cannot stream '{file_format}'; use csv or jsonl")
+        return self.csv_chunks() if file_format == 'csv' else self.jsonl_chunks()
+
+    def csv_chunks(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS.keys())
+        yield buffer.getvalue()
+
+        buffer.seek(0)
+        buffer.truncate()
+        pending = 0
+        for row in self.rows():
+            writer.writerow([text_value(value) for value in row])
+            pending += 1
+            if pending >= STREAM_BLOCK_ROWS:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue()
+
+    def jsonl_chunks(self):
+        names = list(EXPORT_COLUMNS)
+        lines = []
+        for row in self.rows():
+            record = {
+                name: value if value is None or isinstance(value, (bool, str)) else text_value(value)
+                for name, value in zip(names, row)
+            }
+            lines.append(json.dumps(record, ensure_ascii=False))
+            if len(lines) >= STREAM_BLOCK_ROWS:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    # Background Parquet job
+
+    @staticmethod
+    def progress_key(user_id, job_id):
+        return f"transaction_export:{user_id}:{job_id}"
+
+    @classmethod
+    def get_progress(cls, user_id, job_id):
+        return cache.get(cls.progress_key(user_id, job_id))
+
+    def report(self, **changes):
+        self.progress.update(changes)
+        cache.set(self.progress_key(self.user.pk, self.job_id), self.progress, PROGRESS_TTL)
+
+    def storage_path(self, file_format):
+        return f"exports/{self.user.pk}/transactions-{self.job_id}.{file_format}"
+
+    def parquet_schema(self):
+        import pyarrow as pa
+        return pa.schema([
+            ('id', pa.string()),
+            ('date', pa.timestamp('us', tz='UTC')),
+            ('amount', pa.decimal128(15, 2)),
+            ('type', pa.string()),
+            ('description', pa.string()),
+            ('merchant', pa.string()),
+            ('category', pa.string()),
+            ('account', pa.string()),
+            ('notes', pa.string()),
+            ('location', pa.string()),
+            ('external_id', pa.string()),
+            ('pending', pa.bool_()),
+        ])
+
+    def write_parquet(self, target):
+        """Write every row to ``target`` (a path or binary file), one row group per chunk"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self.parquet_schema()
+        converters = {
+            'id': str,
+            'date': lambda value: value.astimezone(dt_timezone.utc),
+        }
+        names = list(EXPORT_COLUMNS)
+
+        def flush(batch):
+            columns = list(zip(*batch))
+            arrays = [
+                pa.array([converters[name](value) if name in converters and value is not None else value
+                          for value in column], type=schema.field(name).type)
+                for name, column in zip(names, columns)
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            self.report(exported=self.progress['exported'] + len(batch))
+
+        with pq.ParquetWriter(target, schema, compression='snappy') as writer:
+            batch = []
+            for row in self.rows():
+                batch.append(row)
+                if len(batch) >= self.chunk_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+
+    def run_job(self, file_format='parquet'):
+        """Export to media storage and return the final progress report"""
+        if file_format not in JOB_FORMATS:
+            raise ExportFormatError(f"Unsupported export job format '{file_format}'")
+        self.report(status='running', format=file_format, exported=0)
+        try:
+            with tempfile.TemporaryFile() as handle:
+                self.write_parquet(handle)
+                handle.seek(0)
+                name = default_storage.save(self.storage_path(file_format), File(handle))
+        except Exception as e:
+            self.report(status='failed', error=str(e))
+            raise
+        self.report(status='completed', file=name)
+        return self.progress
+
+    def start_job(self, file_format='parquet'):
+        """Run the export on a background thread; poll ``get_progress`` for the result"""
+        if file_format not in JOB_FORMATS:
+            raise ExportFormatError(f"Unsupported export job format '{file_format}'")
+        if not parquet_available():
+            raise ExportFormatError('Parquet export needs pyarrow, which is not installed')
+        self.report(status='queued', format=file_format)
+
+        def work():
+            try:
+                self.run_job(file_format)
+            except Exception as e:
+                logger.exception("Transaction export %s failed", self.job_id)
+                self.report(status='failed', error=str(e))
+            finally:
+                connection.close()
+
+        threading.Thread(target=work, name=f"export-{self.job_id}", daemon=True).start()
+        return self.progress
@@ -0,0 +1,420 @@
+# Core Import - Streaming bank statement import
+"""
+Import transactions from CSV, OFX and QFX statement files.
+
+Files are read incrementally (CSV line by line, OFX/QFX in fixed-size
+blocks) and handled in chunks, so memory depends on the chunk size, not on
+the file. For each chunk the importer:
+
+1. normalizes rows (dates, signed amounts, text) and records per-row errors,
+2. drops rows whose fingerprint or bank id is already stored for the
+   account, using one indexed query,
+3. categorizes rows that have no category with the local categorization
+   engine (no model calls),
+4. writes the rest with one ``executemany`` (see ``bulk_insert``).
+
+Progress is kept in the cache under the job id so another request can
+poll it while an import runs.
+"""
+import codecs
+import csv
+import hashlib
+import re
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import Category, Transaction
+from .services import ChangeFeed, bulk_insert, rollup_month
+from .signals import transactions_bulk_changed
+
+CHUNK_SIZE = 2000
+READ_BLOCK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+PROGRESS_TTL = 60 * 60
+
+# Rows without a bank id are told apart by how often the same row has
+# been seen; only the most recent keys are remembered
+OCCURRENCE_WINDOW = 50000
+
+FORMATS = {'.csv': 'csv', '.ofx': 'ofx', '.qfx': 'ofx'}
+
+# Header synonyms, matched in this order; each column is used once
+CSV_COLUMNS = OrderedDict([
+    ('date', ('date', 'transaction date', 'posted date', 'posting date', 'trans date')),
+    ('amount', ('amount', 'transaction amount', 'value')),
+    ('debit', ('debit', 'withdrawal', 'withdrawals', 'money out')),
+    ('credit', ('credit', 'deposit', 'deposits', 'money in')),
+    ('external_id', ('id', 'transaction id', 'fitid', 'reference number', 'external id')),
+    ('merchant_name', ('merchant', 'merchant name')),
+    ('category', ('category',)),
+    ('description', ('description', 'payee', 'name', 'details', 'narrative', 'memo')),
+    ('notes', ('memo', 'notes', 'note')),
+])
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%m/%d/%y', '%Y/%m/%d', '%d-%m-%Y', '%d.%m.%Y', '%Y%m%d')
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+OFX_DATE = re.compile(r'(\d{4})(\d{2})(\d{2})(?:(\d{2})(\d{2})(\d{2})?)?(?:\.\d+)?(?:\[([+-]?\d+(?:\.\d+)?)(?::\w+)?\])?')
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be imported at all"""
+
+
+class ImportedRow(NamedTuple):
+    line: int
+    transaction_date: datetime
+    amount: Decimal  # Signed: negative for money out
+    description: str
+    notes: str
+    external_id: str
+    merchant_name: str
+    category: str
+
+
+def detect_format(filename, requested=None):
+    if requested:
+        requested = requested.lower()
+        if requested in ('csv', 'ofx', 'qfx'):
+            return 'ofx' if requested == 'qfx' else requested
+        raise ImportFormatError(f"Unsupported format '{requested}'")
+    for extension, file_format in FORMATS.items():
+        if (filename or '').lower().endswith(extension):
+            return file_format
+    raise ImportFormatError('Cannot tell the file format; pass format=csv, ofx or qfx')
+
+
+def parse_amount(value):
+    text = (value or '').strip().replace(',', '').replace(' ', '')
+    negative = text.startswith('(') and text.endswith(')') or text.endswith('-')
+    text = re.sub(r'[^0-9.\-+]', '', text.strip('()').rstrip('-'))
+    if not text:
+        raise ValueError(f"Invalid amount '{value}'")
+    try:
+        amount = Decimal(text).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount '{value}'")
+    return -abs(amount) if negative else amount
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value, tz=None):
+    """Aware datetime for a statement date; statements repeat dates, so results are cached"""
+    text = (value or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return timezone.make_aware(datetime.strptime(text, date_format), tz)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date '{value}'")
+
+
+@lru_cache(maxsize=4096)
+def parse_ofx_date(value, tz=None):
+    match = OFX_DATE.match((value or '').strip())
+    if not match:
+        raise ValueError(f"Invalid date '{value}'")
+    year, month, day, hour, minute, second, offset = match.groups()
+    moment = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+    if offset is None:
+        return timezone.make_aware(moment, tz)
+    return moment.replace(tzinfo=dt_timezone(timedelta(hours=float(offset))))
+
+
+def read_csv(stream):
+    """Yield ``(line, {field: value})`` for each data row of a CSV file"""
+    reader = csv.reader(codecs.iterdecode(stream, 'utf-8-sig', errors='replace'))
+    header = next(reader, None)
+    if header is None:
+        raise ImportFormatError('The file is empty')
+
+    names = [name.strip().lower() for name in header]
+    columns, used = {}, set()
+    for field, synonyms in CSV_COLUMNS.items():
+        for synonym in synonyms:
+            if synonym in names and names.index(synonym) not in used:
+                columns[field] = names.index(synonym)
+                used.add(columns[field])
+                break
+    if 'date' not in columns or 'description' not in columns or not (
+            'amount' in columns or 'debit' in columns or 'credit' in columns):
+        raise ImportFormatError('CSV needs date, description and amount (or debit/credit) columns')
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        yield reader.line_num, {
+            field: row[index].strip() for field, index in columns.items() if index < len(row)
+        }
+
+
+def read_ofx(stream):
+    """
+    Yield ``(n, {TAG: value})`` for each ``STMTTRN`` of an OFX/QFX file.
+    Works for SGML (unclosed tags) and XML statements alike.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer, current, count = '', None, 0
+    while True:
+        block = stream.read(READ_BLOCK_SIZE)
+        buffer += decoder.decode(block or b'', final=not block)
+        # Only parse up to the last tag start; it may continue in the next block
+        cut = len(buffer) if not block else buffer.rfind('<')
+        if cut <= 0 and block:
+            continue
+        for closing, tag, value in OFX_TAG.findall(buffer[:cut]):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    count += 1
+                    yield count, current
+                current = None if closing else {}
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+        buffer = buffer[cut:]
+        if not block:
+            break
+
+
+def ofx_fields(raw):
+    return {
+        'date': raw.get('DTPOSTED') or raw.get('DTUSER', ''),
+        'amount': raw.get('TRNAMT', ''),
+        'description': raw.get('NAME') or raw.get('PAYEE') or raw.get('MEMO', ''),
+        'notes': raw.get('MEMO', '') if raw.get('NAME') or raw.get('PAYEE') else '',
+        'external_id': raw.get('FITID', ''),
+    }
+
+
+def normalize(line, fields, ofx=False, tz=None):
+    """Turn a parsed row into an ``ImportedRow``; raises ValueError"""
+    if ofx:
+        fields = ofx_fields(fields)
+        transaction_date = parse_ofx_date(fields['date'], tz)
+    else:
+        transaction_date = parse_date(fields.get('date'), tz)
+
+    if fields.get('amount'):
+        amount = parse_amount(fields['amount'])
+    else:
+        credit = parse_amount(fields['credit']) if fields.get('credit') else Decimal('0.00')
+        debit = parse_amount(fields['debit']) if fields.get('debit') else Decimal('0.00')
+        if not fields.get('credit') and not fields.get('debit'):
+            raise ValueError('Missing amount')
+        amount = abs(credit) - abs(debit)
+
+    description = ' '.join((fields.get('description') or '').split())
+    if not description:
+        raise ValueError('Missing description')
+
+    return ImportedRow(
+        line=line,
+        transaction_date=transaction_date,
+        amount=amount,
+        description=description[:255],
+        notes=fields.get('notes') or '',
+        external_id=(fields.get('external_id') or '')[:100],
+        merchant_name=(fields.get('merchant_name') or '')[:100],
+        category=(fields.get('category') or '').strip().lower(),
+    )
+
+
+class TransactionImporter:
+    """Import one statement file into an account"""
+
+    def __init__(self, user, account, job_id=None, chunk_size=CHUNK_SIZE, categorize=True):
+        self.user = user
+        self.account = account
+        self.job_id = job_id or str(uuid.uuid4())
+        self.chunk_size = chunk_size
+        self.categorize = categorize
+        self.occurrences = OrderedDict()
+        self.categories = {
+            category.name.lower(): category.pk for category in Category.objects.filter(user=user)
+        }
+        self.engine = None
+        self.label_categories = {}
+        self.tz = timezone.get_current_timezone()
+        self.months = set()
+        self.month_of = {}
+        self.category_ids = set()
+
+        # Column values shared by every imported row
+        self.columns = [field.attname for field in Transaction._meta.concrete_fields]
+        self.defaults = {
+            field.attname: field.get_default() for field in Transaction._meta.concrete_fields
+        }
+        self.defaults.update(user_id=user.pk, account_id=account.pk)
+        self.progress = {
+            'job_id': self.job_id,
+            'status': 'running',
+            'processed': 0,
+            'imported': 0,
+            'duplicates': 0,
+            'failed': 0,
+            'errors': [],
+        }
+
+    @staticmethod
+    def progress_key(user_id, job_id):
+        return f"transaction_import:{user_id}:{job_id}"
+
+    @classmethod
+    def get_progress(cls, user_id, job_id):
+        return cache.get(cls.progress_key(user_id, job_id))
+
+    def report(self):
+        cache.set(self.progress_key(self.user.pk, self.job_id), self.progress, PROGRESS_TTL)
+
+    def error(self, line, message):
+        self.progress['failed'] += 1
+        if len(self.progress['errors']) < MAX_REPORTED_ERRORS:
+            self.progress['errors'].append({'line': line, 'error': str(message)})
+
+    def fingerprint(self, row):
+        """
+        Stable dedupe key: the bank id when there is one, otherwise the
+        row's date, amount and text plus how many identical rows came before
+        """
+        if row.external_id:
+            key = f"{self.account.pk}|id|{row.external_id}"
+        else:
+            base = f"{self.account.pk}|{row.transaction_date.date().isoformat()}|{row.amount}|{row.description.lower()}"
+            occurrence = self.occurrences.pop(base, 0)
+            self.occurrences[base] = occurrence + 1
+            if len(self.occurrences) > OCCURRENCE_WINDOW:
+                self.occurrences.popitem(last=False)
+            key = f"{base}|{occurrence}"
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+    def run(self, stream, file_format):
+        """Import ``stream`` and return the final progress report"""
+        reader = read_ofx(stream) if file_format == 'ofx' else read_csv(stream)
+        self.report()
+        try:
+            chunk = []
+            for line, fields in reader:
+                self.progress['processed'] += 1
+                try:
+                    row = normalize(line, fields, ofx=file_format == 'ofx', tz=self.tz)
+                except ValueError as e:
+                    self.error(line, e)
+                    continue
+                chunk.append((self.fingerprint(row), row))
+                if len(chunk) >= self.chunk_size:
+                    self.write_chunk(chunk)
+                    chunk = []
+                    self.report()
+            self.write_chunk(chunk)
+        except Exception as e:
+            self.progress.update(status='failed', error=str(e))
+            self.report()
+            raise
+        finally:
+            if self.months:
+                transactions_bulk_changed.send(
+                    sender=Transaction, user=self.user, months=self.months, category_ids=self.category_ids
+                )
+
+        self.progress['status'] = 'completed'
+        self.report()
+        return self.progress
+
+    def write_chunk(self, chunk):
+        if not chunk:
+            return
+        fingerprints = [fingerprint for fingerprint, _ in chunk]
+        external_ids = [row.external_id for _, row in chunk if row.external_id]
+        # Fingerprints embed the account, so the lookups need only their own
+        # indexes (SQLite would otherwise walk the account's date index)
+        existing = set(Transaction.objects.filter(
+            import_fingerprint__in=fingerprints
+        ).values_list('import_fingerprint', flat=True))
+        known_ids = {
+            external_id for account_id, external_id in Transaction.objects.filter(
+                external_id__in=external_ids
+            ).values_list('account_id', 'external_id')
+            if account_id == self.account.pk
+        } if external_ids else set()
+
+        fresh = []
+        for fingerprint, row in chunk:
+            if fingerprint in existing or row.external_id in known_ids:
+                self.progress['duplicates'] += 1
+                continue
+            existing.add(fingerprint)
+            fresh.append((fingerprint, row))
+
+        predictions = self.predict([row for _, row in fresh])
+        now = timezone.now()
+        defaults = dict(self.defaults, created_at=now, updated_at=now)
+        rows, ids = [], []
+        for (fingerprint, row), prediction in zip(fresh, predictions):
+            category_id, confidence, predicted = self.categories.get(row.category), 1.0, False
+            if category_id is None and prediction is not None:
+                (category_id, confidence), predicted = prediction, True
+            values = dict(
+                defaults,
+                id=uuid.uuid4(),
+                category_id=category_id,
+                amount=abs(row.amount),
+                transaction_type='debit' if row.amount < 0 else 'credit',
+                description=row.description,
+                notes=row.notes,
+                external_id=row.external_id,
+                merchant_name=row.merchant_name,
+                transaction_date=row.transaction_date,
+                confidence_score=confidence,
+                ai_categorized=predicted,
+                import_fingerprint=fingerprint,
+            )
+            rows.append(tuple(values[column] for column in self.columns))
+            ids.append(values['id'])
+            if row.transaction_date not in self.month_of:
+                self.month_of[row.transaction_date] = rollup_month(row.transaction_date)
+                self.months.add(self.month_of[row.transaction_date])
+            self.category_ids.add(category_id)
+
+        with db_transaction.atomic():
+            bulk_insert(Transaction, self.columns, rows)
+            ChangeFeed.record(self.user.pk, 'Transaction', ids, created=True)
+        self.progress['imported'] += len(rows)
+
+    def predict(self, rows):
+        """(category id, confidence) for uncategorized rows the engine is sure about"""
+        if not self.categorize or not rows:
+            return [None] * len(rows)
+        try:
+            from apps.ai.categorization import BatchCategorizer, get_categorization_engine
+            if self.engine is None:
+                self.engine = get_categorization_engine()
+            pending = [i for i, row in enumerate(rows) if row.category not in self.categories]
+            predictions = self.engine.categorize_batch(
+                [f"{rows[i].merchant_name} {rows[i].description}".strip() for i in pending]
+            )
+        except (ImportError, RuntimeError):
+            return [None] * len(rows)
+
+        confident = {
+            i: prediction for i, prediction in zip(pending, predictions)
+            if prediction.source != 'default' and self.engine.is_confident(prediction)
+        }
+        missing = {prediction.category for prediction in confident.values()} - set(self.label_categories)
+        if missing:
+            resolved = BatchCategorizer.resolve_categories(self.user, missing)
+            self.label_categories.update({label: category.pk for label, category in resolved.items()})
+
+        results = [None] * len(rows)
+        for i, prediction in confident.items():
+            category_id = self.label_categories.get(prediction.category)
+            if category_id is not None:
+                results[i] = (category_id, round(prediction.confidence, 4))
+        return results
@@ -0,0 +1,29 @@
+# Management Command - Replay history into month-end health scores
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import User
+from apps.core.scoring import HealthScoreBackfill, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Compute month-end financial health scores from transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only backfill this user email')
+        parser.add_argument('--months', type=int, default=12, help='Complete months to score')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users per batch')
+
+    def handle(self, *args, **options):
+        if options['months'] < 1:
+            raise CommandError('--months must be at least 1')
+        users = User.objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        report = HealthScoreBackfill(months=options['months']).run(users, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {report['scores']} month-end scores for {report['users']} users "
+            f"in {report['batches']} batches"
+        ))
@@ -0,0 +1,25 @@
+# Management Command - Score every user's financial health in batches
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import User
+from apps.core.scoring import HealthScoreEngine, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Calculate and store a financial health score for every active user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only score this user email')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users per batch')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        report = HealthScoreEngine().run(users, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {report['users']} users in {report['batches']} batches"
+        ))
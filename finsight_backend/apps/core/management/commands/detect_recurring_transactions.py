@@ -0,0 +1,32 @@
+# Management Command - Detect recurring charges in transaction history
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.detection import RecurringChargeDetector
+from apps.core.models import User
+
+
+class Command(BaseCommand):
+    help = 'Find subscriptions and other periodic charges in users\' transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only analyse this user email')
+        parser.add_argument('--full', action='store_true', help='Re-analyse every merchant, not only changed ones')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        totals = {'users': 0, 'detected': 0, 'created': 0, 'removed': 0}
+        for user in users.iterator():
+            report = RecurringChargeDetector(user).run(full=options['full'])
+            totals['users'] += 1
+            for name in ('detected', 'created', 'removed'):
+                totals[name] += report[name]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Analysed {totals['users']} users: {totals['detected']} recurring charges, "
+            f"{totals['created']} new, {totals['removed']} removed"
+        ))
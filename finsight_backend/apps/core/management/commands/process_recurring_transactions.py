@@ -0,0 +1,36 @@
+# Management Command - Generate transactions owed by recurring templates
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+
+from apps.core.models import User
+from apps.core.recurring import RecurringScheduler, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Generate every transaction that recurring templates owe, catching up on missed runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only process templates of this user email')
+        parser.add_argument('--date', help='Process as of this day (YYYY-MM-DD) instead of today')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Templates per batch')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(email=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Date must be given as YYYY-MM-DD')
+
+        report = RecurringScheduler(today=today, user=user, batch_size=options['batch_size']).run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} transactions from {report['templates']} templates "
+            f"in {report['batches']} batches"
+        ))
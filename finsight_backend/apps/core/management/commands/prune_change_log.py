@@ -0,0 +1,28 @@
+# Management Command - Remove old delete tombstones from the change feed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.core.services import ChangeFeed
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove change feed tombstones older than the retention period. Clients whose cursor is older '
+        'than the removed tombstones get 410 Gone (reset) and resync from scratch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CHANGE_LOG_RETENTION_DAYS,
+            help='Keep tombstones from this many days (default: CHANGE_LOG_RETENTION_DAYS)'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('Days must be at least 1')
+
+        removed = ChangeFeed.prune(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} tombstones older than {options['days']} days"))
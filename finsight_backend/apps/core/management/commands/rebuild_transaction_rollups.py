@@ -0,0 +1,37 @@
+# Management Command - Rebuild the monthly transaction rollup table
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+
+from apps.core.models import User
+from apps.core.services import TransactionRollupService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild TransactionMonthlyRollup rows from raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this user email')
+        parser.add_argument(
+            '--month',
+            action='append',
+            dest='months',
+            help='Only rebuild this month (YYYY-MM); may be repeated'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(email=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        months = None
+        if options['months']:
+            try:
+                months = [datetime.strptime(value, '%Y-%m').date() for value in options['months']]
+            except ValueError:
+                raise CommandError('Months must be given as YYYY-MM')
+
+        count = TransactionRollupService.rebuild(user=user, months=months)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rollup rows'))
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.7 on 2026-10-17 04:32
+
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    """Fill the table from existing transactions so readers never see empty months"""
+    from apps.core.services import TransactionRollupService
+
+    Transaction = apps.get_model('core', 'Transaction')
+    TransactionMonthlyRollup = apps.get_model('core', 'TransactionMonthlyRollup')
+    TransactionMonthlyRollup.objects.bulk_create(
+        TransactionRollupService.grouped(Transaction.objects.all(), TransactionMonthlyRollup), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionMonthlyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('debit', 'Debit'), ('credit', 'Credit'), ('transfer', 'Transfer')], max_length=10)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('min_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('max_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='core.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'transaction_monthly_rollups',
+                'indexes': [models.Index(fields=['user', 'month'], name='transaction_user_id_c8ef6f_idx')],
+                'unique_together': {('user', 'category', 'month', 'transaction_type')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
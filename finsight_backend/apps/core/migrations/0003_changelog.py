@@ -0,0 +1,75 @@
+# Generated by Django 5.0.7 on 2026-10-17 04:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+FEED_MODELS = ['Account', 'Category', 'Transaction', 'Budget', 'Goal']
+
+
+def seed_change_log(apps, schema_editor):
+    """Give every existing row an upsert entry so a since=0 pull is complete"""
+    ChangeSequence = apps.get_model('core', 'ChangeSequence')
+    ChangeLogEntry = apps.get_model('core', 'ChangeLogEntry')
+    sequences = {}
+    now = timezone.now()
+
+    for name in FEED_MODELS:
+        model = apps.get_model('core', name)
+        batch = []
+        rows = model.objects.order_by('updated_at').values_list('user_id', 'id').iterator(chunk_size=2000)
+        for user_id, entity_id in rows:
+            sequences[user_id] = sequences.get(user_id, 0) + 1
+            batch.append(ChangeLogEntry(
+                user_id=user_id, seq=sequences[user_id], entity_type=name,
+                entity_id=entity_id, action='upsert', changed_at=now
+            ))
+            if len(batch) >= 2000:
+                ChangeLogEntry.objects.bulk_create(batch, batch_size=500)
+                batch = []
+        ChangeLogEntry.objects.bulk_create(batch, batch_size=500)
+
+    ChangeSequence.objects.bulk_create(
+        [ChangeSequence(user_id=user_id, value=value) for user_id, value in sequences.items()],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_transactionmonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='change_sequence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('value', models.BigIntegerField(default=0)),
+                ('pruned_through', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'change_sequences',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('seq', models.BigIntegerField()),
+                ('entity_type', models.CharField(max_length=50)),
+                ('entity_id', models.UUIDField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('changed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='change_log', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'change_log',
+                'indexes': [models.Index(fields=['user', 'seq'], name='change_log_user_id_579d73_idx')],
+                'unique_together': {('user', 'entity_type', 'entity_id')},
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,114 @@
+"""
+Full-text index over transaction descriptions, merchants, notes and locations.
+
+SQLite gets an FTS5 table kept in step by triggers; the doc map gives each
+transaction a stable integer key for the FTS rowid. PostgreSQL gets GIN
+expression indexes (tsvector for ranked prefix search, pg_trgm for fuzzy
+matches) that the database maintains itself. Other backends have no index
+and fall back to icontains in ``apps.core.search``.
+"""
+from django.db import migrations
+
+# Kept separate so later migrations that rebuild the transactions table on
+# SQLite can recreate them
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER transaction_search_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO transaction_search_docs (transaction_id) VALUES (NEW.id);
+        INSERT INTO transaction_search (rowid, user_id, description, merchant_name, notes, location)
+        VALUES (last_insert_rowid(), NEW.user_id, NEW.description, NEW.merchant_name, NEW.notes, NEW.location);
+    END
+    """,
+    """
+    CREATE TRIGGER transaction_search_update
+    AFTER UPDATE OF user_id, description, merchant_name, notes, location ON transactions BEGIN
+        UPDATE transaction_search
+        SET user_id = NEW.user_id, description = NEW.description, merchant_name = NEW.merchant_name,
+            notes = NEW.notes, location = NEW.location
+        WHERE rowid = (SELECT doc FROM transaction_search_docs WHERE transaction_id = NEW.id);
+    END
+    """,
+    """
+    CREATE TRIGGER transaction_search_delete AFTER DELETE ON transactions BEGIN
+        DELETE FROM transaction_search
+        WHERE rowid = (SELECT doc FROM transaction_search_docs WHERE transaction_id = OLD.id);
+        DELETE FROM transaction_search_docs WHERE transaction_id = OLD.id;
+    END
+    """,
+]
+
+SQLITE_TRIGGERS_REVERSE = [
+    "DROP TRIGGER IF EXISTS transaction_search_delete",
+    "DROP TRIGGER IF EXISTS transaction_search_update",
+    "DROP TRIGGER IF EXISTS transaction_search_insert",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE TABLE transaction_search_docs (
+        doc INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id CHAR(32) NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE transaction_search USING fts5(
+        user_id, description, merchant_name, notes, location,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    *SQLITE_TRIGGERS,
+    "INSERT INTO transaction_search_docs (transaction_id) SELECT id FROM transactions",
+    """
+    INSERT INTO transaction_search (rowid, user_id, description, merchant_name, notes, location)
+    SELECT d.doc, t.user_id, t.description, t.merchant_name, t.notes, t.location
+    FROM transactions t JOIN transaction_search_docs d ON d.transaction_id = t.id
+    """,
+]
+
+SQLITE_REVERSE = [
+    *SQLITE_TRIGGERS_REVERSE,
+    "DROP TABLE IF EXISTS transaction_search",
+    "DROP TABLE IF EXISTS transaction_search_docs",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS transactions_search_tsv ON transactions USING GIN (
+        to_tsvector('simple', description || ' ' || merchant_name || ' ' || notes || ' ' || location)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS transactions_search_trgm ON transactions USING GIN (
+        (description || ' ' || merchant_name) gin_trgm_ops
+    )
+    """,
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS transactions_search_trgm",
+    "DROP INDEX IF EXISTS transactions_search_tsv",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_changelog'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-17 05:18
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search = import_module('apps.core.migrations.0004_transaction_search')
+
+
+def restore_search_triggers(apps, schema_editor):
+    """
+    SQLite adds the column by rebuilding the transactions table, which drops
+    the full-text triggers from 0004; put them back.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in search.SQLITE_TRIGGERS_REVERSE + search.SQLITE_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_transaction_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='transaction',
+            name='import_fingerprint',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['import_fingerprint'], name='transaction_import__40e9cd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['external_id'], name='transaction_externa_b026b5_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
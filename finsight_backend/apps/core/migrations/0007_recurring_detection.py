@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-17 05:30
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recurringtransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='confidence_score',
+            field=models.FloatField(default=1.0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='last_occurrence',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='merchant_key',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='occurrence_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='source',
+            field=models.CharField(choices=[('manual', 'Manual'), ('detected', 'Detected')], default='manual', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='recurringtransaction',
+            index=models.Index(fields=['user', 'source', 'merchant_key'], name='recurring_t_user_id_f2d0ba_idx'),
+        ),
+    ]
@@ -123,6 +123,7 @@ class Transaction(models.Model):
     external_id = models.CharField(max_length=100, blank=True)  # Bank transaction ID
     merchant_name = models.CharField(max_length=100, blank=True)
     location = models.CharField(max_length=255, blank=True)
+    import_fingerprint = models.CharField(max_length=32, blank=True)  # Dedupe key for file imports
     
     # Dates
     transaction_date = models.DateTimeField()
@@ -149,6 +150,62 @@ class Transaction(models.Model):
             models.Index(fields=['user', 'transaction_date']),
             models.Index(fields=['account', 'transaction_date']),
             models.Index(fields=['category']),
+            models.Index(fields=['import_fingerprint']),
+            models.Index(fields=['external_id']),
+        ]
+
+class RecurringTransaction(models.Model):
+    """Template that generates a transaction on every due date"""
+    
+    FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('quarterly', 'Quarterly'),
+        ('yearly', 'Yearly'),
+    ]
+    
+    SOURCES = [
+        ('manual', 'Manual'),
+        ('detected', 'Detected'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_transactions')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='recurring_transactions')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='recurring_transactions')
+    
+    # Generated transaction details
+    name = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    description = models.CharField(max_length=255)
+    merchant_name = models.CharField(max_length=100, blank=True)
+    
+    # Schedule; occurrences fall on start_date's day of the month
+    frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    next_due_date = models.DateField()
+    is_active = models.BooleanField(default=True)
+    
+    # Detection; detected templates start inactive until the user confirms them
+    source = models.CharField(max_length=10, choices=SOURCES, default='manual')
+    merchant_key = models.CharField(max_length=100, blank=True)  # Normalized merchant
+    confidence_score = models.FloatField(default=1.0, validators=[MinValueValidator(0.0), MaxValueValidator(1.0)])
+    occurrence_count = models.IntegerField(default=0)
+    last_occurrence = models.DateField(null=True, blank=True)
+    
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'recurring_transactions'
+        ordering = ['next_due_date']
+        indexes = [
+            models.Index(fields=['is_active', 'next_due_date']),
+            models.Index(fields=['user', 'source', 'merchant_key']),
         ]
 
 class Budget(models.Model):
@@ -339,3 +396,64 @@ class SyncOperation(models.Model):
     class Meta:
         db_table = 'sync_operations'
         ordering = ['priority', 'client_timestamp']
+
+class TransactionMonthlyRollup(models.Model):
+    """Materialized per-user monthly transaction totals"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name='monthly_rollups')
+    
+    # Bucket key
+    month = models.DateField()  # First day of the month
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    
+    # Aggregates
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    transaction_count = models.IntegerField(default=0)
+    min_amount = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    max_amount = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    
+    # Metadata
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'transaction_monthly_rollups'
+        unique_together = ['user', 'category', 'month', 'transaction_type']
+        indexes = [
+            models.Index(fields=['user', 'month']),
+        ]
+
+class ChangeSequence(models.Model):
+    """Per-user counter behind the change feed"""
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='change_sequence')
+    value = models.BigIntegerField(default=0)
+    pruned_through = models.BigIntegerField(default=0)  # Highest tombstone seq removed
+    
+    class Meta:
+        db_table = 'change_sequences'
+
+class ChangeLogEntry(models.Model):
+    """Latest change of one entity in a user's change feed"""
+    
+    CHANGE_ACTIONS = [
+        ('upsert', 'Upsert'),
+        ('delete', 'Delete'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='change_log')
+    seq = models.BigIntegerField()
+    
+    entity_type = models.CharField(max_length=50)  # Transaction, Account, etc.
+    entity_id = models.UUIDField()
+    action = models.CharField(max_length=10, choices=CHANGE_ACTIONS)
+    changed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'change_log'
+        unique_together = ['user', 'entity_type', 'entity_id']
+        indexes = [
+            models.Index(fields=['user', 'seq']),
+        ]
@@ -0,0 +1,147 @@
+# Core Recurring - Batched generation of scheduled transactions
+"""
+Generate the transactions that recurring templates owe.
+
+Due templates are taken in ``next_due_date`` order, a batch at a time.
+For each template every missed occurrence up to today is worked out in
+memory, so a month of downtime costs no extra queries. Each
+batch then makes a fixed set of writes, however many users it spans:
+
+- one batched insert for the new transactions (``bulk_insert``),
+- one ``bulk_update`` that advances ``next_due_date`` (and retires
+  templates past their ``end_date``),
+- grouped rollup and change-feed writes for the new transactions.
+
+Budget spend and per-user data versions are cache bumps. A batch commits
+as a whole, and templates locked by another worker are skipped, so runs
+can overlap or repeat without generating an occurrence twice.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import RecurringTransaction, Transaction
+from .services import (
+    BudgetProgressService, ChangeFeed, FinancialDataVersion, TransactionRollupService, bulk_insert, rollup_month
+)
+
+BATCH_SIZE = 1000
+
+# Longest catch-up per template in one batch; the rest follows in the next
+MAX_OCCURRENCES = 400
+
+# Step of each frequency as (unit, amount)
+FREQUENCY_STEPS = {
+    'daily': ('days', 1),
+    'weekly': ('days', 7),
+    'monthly': ('months', 1),
+    'quarterly': ('months', 3),
+    'yearly': ('months', 12),
+}
+
+
+def next_occurrence(template, current):
+    """
+    The occurrence after ``current``. Month-based schedules count from
+    ``start_date``, so a template started on the 31st comes back to the 31st
+    after a short month.
+    """
+    unit, amount = FREQUENCY_STEPS[template.frequency]
+    if unit == 'days':
+        return current + relativedelta(days=amount)
+    start = template.start_date
+    elapsed = (current.year - start.year) * 12 + current.month - start.month
+    return start + relativedelta(months=elapsed + amount)
+
+
+def due_dates(template, today, limit=MAX_OCCURRENCES):
+    """
+    Occurrences owed up to ``today`` and the following due date. Occurrences
+    after ``end_date`` are never owed.
+    """
+    dates = []
+    current = template.next_due_date
+    last = min(today, template.end_date) if template.end_date else today
+    while current <= last and len(dates) < limit:
+        dates.append(current)
+        current = next_occurrence(template, current)
+    return dates, current
+
+
+class RecurringScheduler:
+    """Generate owed transactions for all due templates, or one user's"""
+
+    def __init__(self, today=None, user=None, batch_size=BATCH_SIZE):
+        self.today = today or timezone.localdate()
+        self.user = user
+        self.batch_size = batch_size
+
+    def due(self):
+        templates = RecurringTransaction.objects.filter(is_active=True, next_due_date__lte=self.today)
+        if self.user is not None:
+            templates = templates.filter(user=self.user)
+        return templates.order_by('next_due_date', 'id')
+
+    def run(self):
+        """Process batches until nothing is due; return totals"""
+        report = {'templates': 0, 'created': 0, 'batches': 0}
+        while True:
+            with db_transaction.atomic():
+                templates = list(self.due().select_for_update(skip_locked=True)[:self.batch_size])
+                if not templates:
+                    break
+                created = self.process(templates)
+            self.expire_caches(created)
+            report['templates'] += len(templates)
+            report['created'] += len(created)
+            report['batches'] += 1
+        return report
+
+    def process(self, templates):
+        """Write the occurrences of one locked batch; return the new transactions"""
+        now = timezone.now()
+        tz = timezone.get_current_timezone()
+        created = []
+        for template in templates:
+            dates, following = due_dates(template, self.today)
+            for day in dates:
+                created.append(Transaction(
+                    user_id=template.user_id,
+                    account_id=template.account_id,
+                    category_id=template.category_id,
+                    amount=template.amount,
+                    transaction_type=template.transaction_type,
+                    description=template.description,
+                    merchant_name=template.merchant_name,
+                    transaction_date=timezone.make_aware(datetime.combine(day, time.min), tz),
+                    is_recurring=True,
+                    created_at=now,
+                    updated_at=now,
+                ))
+            template.next_due_date = following
+            if template.end_date and following > template.end_date:
+                template.is_active = False
+            template.updated_at = now
+
+        columns = [field.attname for field in Transaction._meta.concrete_fields]
+        bulk_insert(Transaction, columns, (tuple(getattr(row, column) for column in columns) for row in created))
+        RecurringTransaction.objects.bulk_update(
+            templates, ['next_due_date', 'is_active', 'updated_at'], batch_size=500
+        )
+        TransactionRollupService.add_many(created)
+        ids_by_user = defaultdict(list)
+        for transaction in created:
+            ids_by_user[transaction.user_id].append(transaction.pk)
+        ChangeFeed.record_many('Transaction', ids_by_user, created=True)
+        return created
+
+    @staticmethod
+    def expire_caches(created):
+        buckets = {(transaction.category_id, rollup_month(transaction.transaction_date)) for transaction in created}
+        for category_id, month in buckets:
+            BudgetProgressService.invalidate(category_id, month)
+        for user_id in {transaction.user_id for transaction in created}:
+            FinancialDataVersion.bump(user_id)
@@ -0,0 +1,491 @@
+# Core Scoring - Financial health scores for one user or many
+"""
+Score financial health from a user's accounts, cash flow and budgets.
+
+Inputs for a whole batch of users come from one grouped query per table
+(monthly rollups, accounts, budgets) and are laid out as NumPy arrays
+with one entry per user. Every component is a smooth 0-100 score:
+
+- savings rate: income kept, full marks at ``TARGET_SAVINGS_RATE``,
+- debt to income: loan and card balances against a year of income,
+- credit utilization: card balances against their limits,
+- emergency fund: months of expenses covered by checking and savings,
+- budget adherence: share of active budgets within their amount,
+- investment diversity: kinds of asset accounts held.
+
+The overall score is their weighted mean. Results are written as
+``FinancialHealthScore`` rows with ``bulk_create``, so the dashboard reads
+the latest row instead of scoring on every request. A row records the
+user's data version; a stale one is rescored and, within the same day,
+overwritten, keeping one row per user per day.
+"""
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Account, Budget, FinancialHealthScore, Transaction, TransactionMonthlyRollup, User
+from .services import (
+    FinancialDataVersion, annotate_budget_spent, bulk_insert, month_window, rollup_month
+)
+
+BATCH_SIZE = 1000
+
+# Months of rollups averaged for income and expenses
+INCOME_MONTHS = 3
+
+TARGET_SAVINGS_RATE = 0.2
+EMERGENCY_FUND_TARGET = 6.0
+
+# Debt at which debt-to-income scores zero, in years of income
+DEBT_TO_INCOME_LIMIT = 1.0
+
+# Utilization scores full marks up to the first value and zero at the second
+UTILIZATION_RANGE = (0.1, 0.9)
+
+# Asset account kinds needed for full diversity marks
+DIVERSITY_TYPES = ('checking', 'savings', 'investment', 'other')
+
+# Score given when there is nothing to judge a component by
+NEUTRAL_SCORE = 50.0
+
+WEIGHTS = OrderedDict([
+    ('savings_rate', 0.25),
+    ('debt_to_income', 0.2),
+    ('emergency_fund', 0.2),
+    ('budget_adherence', 0.15),
+    ('credit_utilization', 0.1),
+    ('investment_diversity', 0.1),
+])
+
+# Lowest overall score of each grade, best first
+GRADES = (
+    (90, 'A+'), (80, 'A'), (75, 'B+'), (70, 'B'), (65, 'C+'), (60, 'C'), (50, 'D'), (0, 'F'),
+)
+
+LIQUID_TYPES = ('checking', 'savings')
+DEBT_TYPES = ('credit', 'loan')
+
+METRICS = (
+    'income', 'expenses', 'liquid', 'debt', 'card_balance', 'card_limit',
+    'asset_types', 'budgets', 'budgets_within', 'budget_usage',
+)
+
+
+def grade_for(scores):
+    """Letter grades for an array of overall scores"""
+    bounds = np.array([bound for bound, _ in GRADES])
+    letters = np.array([letter for _, letter in GRADES])
+    return letters[np.argmax(np.asarray(scores)[:, None] >= bounds[None, :], axis=1)]
+
+
+def score_metrics(metrics):
+    """
+    Component scores, raw ratios and the overall score for arrays of
+    metrics (see ``METRICS``), one entry per user.
+    """
+    income = metrics['income']
+    expenses = metrics['expenses']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        savings_rate = np.where(income > 0, (income - expenses) / income, np.where(expenses > 0, -1.0, 0.0))
+        debt_to_income = np.where(
+            metrics['debt'] > 0,
+            np.where(income > 0, metrics['debt'] / (12 * income), np.inf),
+            0.0,
+        )
+        utilization = np.where(metrics['card_limit'] > 0, metrics['card_balance'] / metrics['card_limit'], 0.0)
+        emergency_months = np.where(
+            expenses > 0,
+            metrics['liquid'] / expenses,
+            np.where(metrics['liquid'] > 0, EMERGENCY_FUND_TARGET, 0.0),
+        )
+        budget_variance = np.where(metrics['budgets'] > 0, metrics['budget_usage'] / metrics['budgets'] - 1, 0.0)
+        adherence = np.where(
+            metrics['budgets'] > 0, metrics['budgets_within'] / metrics['budgets'], NEUTRAL_SCORE / 100
+        )
+
+    low, high = UTILIZATION_RANGE
+    components = OrderedDict([
+        ('savings_rate', np.clip(savings_rate / TARGET_SAVINGS_RATE, 0, 1)),
+        ('debt_to_income', np.clip(1 - debt_to_income / DEBT_TO_INCOME_LIMIT, 0, 1)),
+        ('emergency_fund', np.clip(emergency_months / EMERGENCY_FUND_TARGET, 0, 1)),
+        ('budget_adherence', adherence),
+        ('credit_utilization', np.clip(1 - (utilization - low) / (high - low), 0, 1)),
+        ('investment_diversity', np.clip(metrics['asset_types'] / len(DIVERSITY_TYPES), 0, 1)),
+    ])
+    components = OrderedDict((name, np.rint(100 * values)) for name, values in components.items())
+    overall = np.rint(sum(WEIGHTS[name] * values for name, values in components.items()))
+    return {
+        'overall': overall,
+        'components': components,
+        'ratios': {
+            'debt_to_income_ratio': np.minimum(debt_to_income, 99.0),
+            'savings_rate': savings_rate * 100,
+            'budget_variance': budget_variance,
+            'credit_utilization_ratio': utilization,
+            'emergency_fund_months': np.minimum(emergency_months, 99.0),
+        },
+    }
+
+
+def score_rows(user_ids, metrics, details):
+    """
+    Unsaved ``FinancialHealthScore`` rows for parallel ``user_ids``, metric
+    arrays and ``calculation_data`` dicts
+    """
+    scored = score_metrics(metrics)
+    grades = grade_for(scored['overall'])
+    components = scored['components']
+    ratios = scored['ratios']
+
+    rows = []
+    for i, user_id in enumerate(user_ids):
+        calculation_data = dict(details[i])
+        calculation_data.update({
+            'monthly_income': round(float(metrics['income'][i]), 2),
+            'monthly_expenses': round(float(metrics['expenses'][i]), 2),
+            'active_budgets': int(metrics['budgets'][i]),
+        })
+        rows.append(FinancialHealthScore(
+            user_id=user_id,
+            overall_score=int(scored['overall'][i]),
+            grade=str(grades[i]),
+            debt_to_income_score=int(components['debt_to_income'][i]),
+            savings_rate_score=int(components['savings_rate'][i]),
+            budget_adherence_score=int(components['budget_adherence'][i]),
+            credit_utilization_score=int(components['credit_utilization'][i]),
+            emergency_fund_score=int(components['emergency_fund'][i]),
+            investment_diversity_score=int(components['investment_diversity'][i]),
+            debt_to_income_ratio=round(float(ratios['debt_to_income_ratio'][i]), 4),
+            savings_rate=round(float(ratios['savings_rate'][i]), 2),
+            budget_variance=round(float(ratios['budget_variance'][i]), 4),
+            credit_utilization_ratio=round(float(ratios['credit_utilization_ratio'][i]), 4),
+            emergency_fund_months=round(float(ratios['emergency_fund_months'][i]), 2),
+            calculation_data=calculation_data,
+        ))
+    return rows
+
+
+class HealthScoreEngine:
+    """Score and persist financial health for a batch of users"""
+
+    def __init__(self, as_of=None):
+        self.now = timezone.now() if as_of is None else as_of
+        self.today = timezone.localtime(self.now).date()
+
+    def metrics(self, user_ids):
+        """Arrays of ``METRICS`` for ``user_ids``, one grouped query per table"""
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        metrics = {name: np.zeros(len(user_ids)) for name in METRICS}
+
+        # Average monthly income and expenses over the months with activity
+        first_month = rollup_month(self.today) - relativedelta(months=INCOME_MONTHS - 1)
+        active_months = np.zeros(len(user_ids))
+        seen = set()
+        rollups = TransactionMonthlyRollup.objects.filter(
+            user_id__in=user_ids, month__gte=first_month, month__lte=self.today
+        ).values_list('user_id', 'month', 'transaction_type').annotate(total=Sum('total_amount')).order_by()
+        for user_id, month, transaction_type, total in rollups:
+            i = position[user_id]
+            if (i, month) not in seen:
+                seen.add((i, month))
+                active_months[i] += 1
+            if transaction_type == 'credit':
+                metrics['income'][i] += float(total)
+            elif transaction_type == 'debit':
+                metrics['expenses'][i] += float(total)
+        months = np.maximum(active_months, 1)
+        metrics['income'] /= months
+        metrics['expenses'] /= months
+
+        accounts = Account.objects.filter(user_id__in=user_ids, is_active=True).values_list(
+            'user_id', 'account_type'
+        ).annotate(balance=Sum('balance'), limit=Sum('credit_limit')).order_by()
+        for user_id, account_type, balance, limit in accounts:
+            i = position[user_id]
+            balance = float(balance or 0)
+            if account_type in LIQUID_TYPES:
+                metrics['liquid'][i] += max(balance, 0.0)
+            if account_type in DEBT_TYPES:
+                metrics['debt'][i] += abs(balance)
+            if account_type == 'credit':
+                metrics['card_balance'][i] += abs(balance)
+                metrics['card_limit'][i] += float(limit or 0)
+            if account_type in DIVERSITY_TYPES and balance > 0:
+                metrics['asset_types'][i] += 1
+
+        budgets = annotate_budget_spent(Budget.objects.filter(
+            user_id__in=user_ids, is_active=True, start_date__lte=self.today, end_date__gte=self.today
+        )).values_list('user_id', 'amount', 'spent_total')
+        for user_id, amount, spent in budgets:
+            i = position[user_id]
+            metrics['budgets'][i] += 1
+            metrics['budgets_within'][i] += spent <= amount
+            if amount > 0:
+                metrics['budget_usage'][i] += float(spent / amount)
+        return metrics
+
+    def build(self, user_ids, versions=None):
+        """Unsaved ``FinancialHealthScore`` rows for ``user_ids``"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        details = []
+        for user_id in user_ids:
+            detail = {'as_of': self.today.isoformat()}
+            if versions is not None:
+                detail['data_version'] = versions[user_id]
+            details.append(detail)
+        return score_rows(user_ids, self.metrics(user_ids), details)
+
+    def run(self, users=None, batch_size=BATCH_SIZE):
+        """Score every active user (or ``users``) a batch at a time; return totals"""
+        if users is None:
+            users = User.objects.filter(is_active=True)
+        user_ids = [user.pk for user in users.only('pk')] if hasattr(users, 'only') else [user.pk for user in users]
+        report = {'users': 0, 'batches': 0}
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            versions = {user_id: FinancialDataVersion.current(user_id) for user_id in batch}
+            FinancialHealthScore.objects.bulk_create(self.build(batch, versions), batch_size=500)
+            report['users'] += len(batch)
+            report['batches'] += 1
+        return report
+
+    def current(self, user):
+        """
+        The user's latest persisted score, rescored first when their data
+        changed since it was written
+        """
+        version = FinancialDataVersion.current(user.pk)
+        latest = FinancialHealthScore.objects.filter(user=user).order_by('-calculated_at').first()
+        if latest is not None and latest.calculation_data.get('data_version') == version:
+            return latest
+
+        score = self.build([user.pk], {user.pk: version})[0]
+        if latest is not None and timezone.localtime(latest.calculated_at).date() == self.today:
+            fields = [field.attname for field in FinancialHealthScore._meta.concrete_fields
+                      if field.attname not in ('id', 'user_id', 'calculated_at')]
+            for name in fields:
+                setattr(latest, name, getattr(score, name))
+            latest.save(update_fields=fields)
+            return latest
+        score.save(force_insert=True)
+        return score
+
+    def history(self, user, months=3):
+        """
+        Month-end scores of the ``months`` complete months before this one,
+        oldest first; missing months are backfilled once
+        """
+        current_month = rollup_month(self.today)
+        start = month_window(month_start(current_month, -months))[0]
+        end = month_window(current_month)[0]
+        for attempt in range(2):
+            points = OrderedDict()
+            rows = FinancialHealthScore.objects.filter(
+                user=user, calculated_at__gte=start, calculated_at__lt=end
+            ).order_by('calculated_at').values_list('calculated_at', 'overall_score', 'grade')
+            for calculated_at, score, grade in rows:
+                points[rollup_month(calculated_at)] = {'score': score, 'grade': grade}
+            if len(points) >= months or attempt:
+                break
+            HealthScoreBackfill(months=months, today=self.today).run([user])
+        return [dict(month=month.strftime('%Y-%m'), **point) for month, point in points.items()]
+
+    def project(self, user, incomes, expenses):
+        """Overall scores with the user's current balances and budgets for each income/expense pair"""
+        metrics = self.metrics([user.pk])
+        count = len(incomes)
+        metrics = {name: np.repeat(values, count) for name, values in metrics.items()}
+        metrics['income'] = np.asarray(incomes, dtype=float)
+        metrics['expenses'] = np.asarray(expenses, dtype=float)
+        return [int(value) for value in score_metrics(metrics)['overall']]
+
+
+def month_start(month, offset):
+    return month + relativedelta(months=offset)
+
+
+class HealthScoreBackfill:
+    """
+    Historical month-end scores replayed from transaction history.
+
+    Per batch of users, one grouped query per table gives monthly totals
+    by user, account and category. Income and expense averages are
+    differences of prefix sums over the month axis. Past balances are
+    today's balances less the flows booked after each month (suffix sums).
+    Budget spend is the prefix sum of the category's debits from the
+    budget's start month. All months of all users are then scored at once
+    and written as ``FinancialHealthScore`` rows dated at the month end and
+    marked ``backfill`` in ``calculation_data``; a rerun replaces the
+    backfilled rows of the months it covers and keeps older ones.
+    """
+
+    def __init__(self, months=12, today=None):
+        self.months = months
+        self.today = today or timezone.localdate()
+        self.current_month = rollup_month(self.today)
+        # Scored months end with the last complete one; the extra months
+        # before them feed the income averages
+        self.first_target = month_start(self.current_month, -months)
+        self.first_month = month_start(self.first_target, -(INCOME_MONTHS - 1))
+
+    def month_index(self, month, months):
+        return (month.year - months[0].year) * 12 + month.month - months[0].month
+
+    def metrics(self, user_ids):
+        """Metric arrays for every (user, scored month), flattened user-major"""
+        users = len(user_ids)
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        budgets = list(Budget.objects.filter(user_id__in=user_ids).values_list(
+            'user_id', 'category_id', 'amount', 'start_date', 'end_date'
+        ))
+        first = min([self.first_month] + [rollup_month(row[3]) for row in budgets])
+        count = self.month_index(self.current_month, [first]) + 1
+        months = [month_start(first, k) for k in range(count)]
+        targets = np.arange(self.month_index(self.first_target, months), count - 1)
+
+        # Monthly totals per user and per category
+        income = np.zeros((users, count))
+        expenses = np.zeros((users, count))
+        categories = {}
+        category_debits = []
+        rollups = TransactionMonthlyRollup.objects.filter(
+            user_id__in=user_ids, month__gte=first, month__lte=self.current_month
+        ).values_list('user_id', 'category_id', 'month', 'transaction_type').annotate(
+            total=Sum('total_amount')
+        ).order_by()
+        for user_id, category_id, month, transaction_type, total in rollups:
+            i, k = position[user_id], self.month_index(month, months)
+            if transaction_type == 'credit':
+                income[i, k] += float(total)
+            elif transaction_type == 'debit':
+                expenses[i, k] += float(total)
+                if category_id is not None:
+                    row = categories.setdefault(category_id, len(categories))
+                    category_debits.append((row, k, float(total)))
+
+        active = np.cumsum((income > 0) | (expenses > 0), axis=1)
+        income_sum = np.cumsum(income, axis=1)
+        expense_sum = np.cumsum(expenses, axis=1)
+
+        def window(prefix):
+            # Total of the INCOME_MONTHS months ending at each target month
+            before = targets - INCOME_MONTHS
+            return prefix[:, targets] - np.where(before >= 0, prefix[:, np.maximum(before, 0)], 0)
+
+        metrics = {name: np.zeros((users, len(targets))) for name in METRICS}
+        months_seen = np.maximum(window(active), 1)
+        metrics['income'] = window(income_sum) / months_seen
+        metrics['expenses'] = window(expense_sum) / months_seen
+
+        # Balances at each month end: today's balance less later flows
+        accounts = list(Account.objects.filter(user_id__in=user_ids, is_active=True).values_list(
+            'id', 'user_id', 'account_type', 'balance', 'credit_limit'
+        ))
+        account_rows = {row[0]: n for n, row in enumerate(accounts)}
+        flows = np.zeros((len(accounts), count))
+        moves = Transaction.objects.filter(
+            account_id__in=list(account_rows), transaction_date__gte=month_window(months[0])[0]
+        ).annotate(
+            bucket=TruncMonth('transaction_date')
+        ).values_list('account_id', 'bucket', 'transaction_type').annotate(total=Sum('amount')).order_by()
+        for account_id, bucket, transaction_type, total in moves:
+            k = min(self.month_index(rollup_month(bucket), months), count - 1)
+            n = account_rows[account_id]
+            owed = accounts[n][2] in DEBT_TYPES
+            sign = {'credit': -1 if owed else 1, 'debit': 1 if owed else -1}.get(transaction_type, 0)
+            flows[n, k] += sign * float(total)
+        later = flows.sum(axis=1, keepdims=True) - np.cumsum(flows, axis=1)
+
+        kinds = {}
+        for n, (_, user_id, account_type, balance, limit) in enumerate(accounts):
+            i = position[user_id]
+            balance = float(balance or 0)
+            if account_type in DEBT_TYPES:
+                history = np.abs(balance) - later[n, targets]
+                metrics['debt'][i] += np.abs(history)
+                if account_type == 'credit':
+                    metrics['card_balance'][i] += np.abs(history)
+                    metrics['card_limit'][i] += float(limit or 0)
+            else:
+                history = balance - later[n, targets]
+                if account_type in LIQUID_TYPES:
+                    metrics['liquid'][i] += np.maximum(history, 0)
+                if account_type in DIVERSITY_TYPES:
+                    kinds.setdefault((i, account_type), np.zeros(len(targets)))
+                    kinds[(i, account_type)] += history
+        for (i, _), balances in kinds.items():
+            metrics['asset_types'][i] += balances > 0
+
+        # Budget spend from the start month through each month end
+        spent = np.zeros((len(categories), count))
+        if category_debits:
+            rows, columns, totals = zip(*category_debits)
+            np.add.at(spent, (np.array(rows), np.array(columns)), totals)
+        spent_sum = np.cumsum(spent, axis=1)
+        month_ends = np.array([(month_start(months[k], 1) - timedelta(days=1)).toordinal() for k in targets])
+        for user_id, category_id, amount, start_date, end_date in budgets:
+            live = (start_date.toordinal() <= month_ends) & (month_ends <= end_date.toordinal())
+            if not live.any():
+                continue
+            i = position[user_id]
+            row = categories.get(category_id)
+            begin = self.month_index(rollup_month(start_date), months)
+            used = np.zeros(len(targets)) if row is None else (
+                spent_sum[row, targets] - (spent_sum[row, begin - 1] if begin > 0 else 0)
+            )
+            metrics['budgets'][i] += live
+            metrics['budgets_within'][i] += live & (used <= float(amount))
+            if amount > 0:
+                metrics['budget_usage'][i] += np.where(live, used / float(amount), 0)
+
+        return {name: values.ravel() for name, values in metrics.items()}, [months[k] for k in targets]
+
+    def build(self, user_ids):
+        """Unsaved month-end rows for ``user_ids``"""
+        metrics, months = self.metrics(user_ids)
+        owners, details, moments = [], [], []
+        tz = timezone.get_current_timezone()
+        for user_id in user_ids:
+            for month in months:
+                month_end = month_start(month, 1) - timedelta(days=1)
+                owners.append(user_id)
+                details.append({'as_of': month_end.isoformat(), 'backfill': True})
+                moments.append(timezone.make_aware(datetime.combine(month_end, time.max), tz))
+        rows = score_rows(owners, metrics, details)
+        for row, moment in zip(rows, moments):
+            row.calculated_at = moment
+        return rows
+
+    def run(self, users=None, batch_size=BATCH_SIZE):
+        """Replace the backfilled history of every active user (or ``users``); return totals"""
+        if users is None:
+            users = User.objects.filter(is_active=True)
+        user_ids = [user.pk for user in users.only('pk')] if hasattr(users, 'only') else [user.pk for user in users]
+        columns = [field.attname for field in FinancialHealthScore._meta.concrete_fields]
+        # Only the scored months are rewritten; a shorter run keeps older history
+        window_start = month_window(self.first_target)[0]
+        window_end = month_window(self.current_month)[0]
+        report = {'users': 0, 'scores': 0, 'batches': 0}
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            rows = self.build(batch)
+            with db_transaction.atomic():
+                FinancialHealthScore.objects.filter(
+                    user_id__in=batch, calculation_data__backfill=True,
+                    calculated_at__gte=window_start, calculated_at__lt=window_end,
+                ).delete()
+                bulk_insert(FinancialHealthScore, columns, (
+                    tuple(getattr(row, column) for column in columns) for row in rows
+                ))
+            report['users'] += len(batch)
+            report['scores'] += len(rows)
+            report['batches'] += 1
+        return report
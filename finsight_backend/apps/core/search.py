@@ -0,0 +1,247 @@
+# Core Search - Ranked full-text transaction search
+"""
+Search over a user's transaction descriptions, merchants, notes and
+locations.
+
+Every query word is a prefix match and all words must appear. On SQLite
+the query runs against the ``transaction_search`` FTS5 table ranked by
+bm25; on PostgreSQL against the GIN tsvector index ranked by ts_rank, with
+a trigram similarity pass when nothing matches exactly. Both indexes are
+created and kept current by migration 0004. Facet filters (amount, date,
+category, account) are applied in the same statement.
+"""
+import re
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Q, Count, Min, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Transaction
+
+MAX_QUERY_WORDS = 8
+MAX_LIMIT = 100
+DEFAULT_LIMIT = 20
+
+# Relative weight of each column in the ranking
+COLUMN_WEIGHTS = {'description': 3.0, 'merchant_name': 2.0, 'notes': 1.0, 'location': 1.0}
+
+POSTGRES_DOCUMENT = "t.description || ' ' || t.merchant_name || ' ' || t.notes || ' ' || t.location"
+POSTGRES_TRIGRAM_DOCUMENT = "t.description || ' ' || t.merchant_name"
+
+
+def query_words(text):
+    """Lower-cased words of the query; punctuation and FTS syntax are dropped"""
+    return re.findall(r'\w+', (text or '').lower())[:MAX_QUERY_WORDS]
+
+
+class TransactionSearch:
+    """Ranked search over one user's transactions"""
+
+    FILTERS = {
+        'amount_min': ('amount', '>='),
+        'amount_max': ('amount', '<='),
+        'date_from': ('transaction_date', '>='),
+        'date_to': ('transaction_date', '<='),
+    }
+
+    def __init__(self, user, amount_min=None, amount_max=None, date_from=None, date_to=None,
+                 categories=(), accounts=()):
+        self.user = user
+        self.bounds = {
+            'amount_min': amount_min, 'amount_max': amount_max,
+            'date_from': date_from, 'date_to': date_to,
+        }
+        self.categories = list(categories)
+        self.accounts = list(accounts)
+
+    @staticmethod
+    def prep(field_name, value):
+        field = Transaction._meta.get_field(field_name)
+        return field.get_db_prep_value(value, connection)
+
+    def filter_sql(self):
+        """WHERE fragments on ``t`` (the transactions table) for the facets"""
+        clauses = ['t.user_id = %s']
+        params = [self.prep('user', self.user.pk)]
+        for name, (field_name, operator) in self.FILTERS.items():
+            if self.bounds[name] is not None:
+                column = Transaction._meta.get_field(field_name).column
+                clauses.append(f't.{column} {operator} %s')
+                params.append(self.prep(field_name, self.bounds[name]))
+        for field_name, values in (('category', self.categories), ('account', self.accounts)):
+            if values:
+                column = Transaction._meta.get_field(field_name).column
+                clauses.append(f"t.{column} IN ({', '.join(['%s'] * len(values))})")
+                params += [self.prep(field_name, value) for value in values]
+        return clauses, params
+
+    def filtered(self):
+        """The facet filters as a queryset, for backends without an index"""
+        queryset = Transaction.objects.filter(user=self.user)
+        for name, (field_name, operator) in self.FILTERS.items():
+            if self.bounds[name] is not None:
+                lookup = 'gte' if operator == '>=' else 'lte'
+                queryset = queryset.filter(**{f'{field_name}__{lookup}': self.bounds[name]})
+        if self.categories:
+            queryset = queryset.filter(category__in=self.categories)
+        if self.accounts:
+            queryset = queryset.filter(account__in=self.accounts)
+        return queryset
+
+    # Matching
+
+    def match_sql(self, words):
+        """
+        (FROM/JOIN fragment, WHERE clauses, params, rank expression, rank
+        params) for the current backend, or None when it has no index.
+        """
+        if connection.vendor == 'sqlite':
+            # The user id is an indexed token, so matching stays inside the
+            # user's postings instead of filtering every user's hits
+            user_token = self.prep('user', self.user.pk)
+            terms = ' AND '.join(f'"{word}"*' for word in words)
+            expression = (
+                f'user_id : "{user_token}" AND '
+                f'{{{" ".join(COLUMN_WEIGHTS)}}} : ({terms})'
+            )
+            weights = ', '.join(str(weight) for weight in [0.0] + list(COLUMN_WEIGHTS.values()))
+            return (
+                'transaction_search '
+                'JOIN transaction_search_docs d ON d.doc = transaction_search.rowid '
+                'JOIN transactions t ON t.id = d.transaction_id',
+                ['transaction_search MATCH %s'], [expression],
+                f'bm25(transaction_search, {weights})', [],
+            )
+        if connection.vendor == 'postgresql':
+            tsquery = ' & '.join(f'{word}:*' for word in words)
+            return (
+                'transactions t',
+                [f"to_tsvector('simple', {POSTGRES_DOCUMENT}) @@ to_tsquery('simple', %s)"], [tsquery],
+                f"-ts_rank(to_tsvector('simple', {POSTGRES_DOCUMENT}), to_tsquery('simple', %s))", [tsquery],
+            )
+        return None
+
+    def trigram_sql(self, text):
+        """Fuzzy fallback for PostgreSQL when no word matched exactly"""
+        return (
+            'transactions t',
+            [f'%s <%% ({POSTGRES_TRIGRAM_DOCUMENT})'], [text],
+            f'-word_similarity(%s, {POSTGRES_TRIGRAM_DOCUMENT})', [text],
+        )
+
+    def run(self, match, limit, offset, facets):
+        source, match_clauses, match_params, rank, rank_params = match
+        clauses, params = self.filter_sql()
+        where = ' AND '.join(match_clauses + clauses)
+        where_params = match_params + params
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT t.id, {rank} AS rank FROM {source} WHERE {where} '
+                f'ORDER BY rank, t.transaction_date DESC LIMIT %s OFFSET %s',
+                rank_params + where_params + [limit + 1, offset]
+            )
+            rows = cursor.fetchall()
+
+            summary = None
+            if facets:
+                summary = self.facets(cursor, source, where, where_params)
+
+        id_field = Transaction._meta.pk
+        ids = [id_field.to_python(row[0]) for row in rows]
+        return ids, summary
+
+    def facets(self, cursor, source, where, params):
+        """Match counts per category and account plus the amount/date ranges"""
+        result = {}
+        for name, column in (('categories', 'category_id'), ('accounts', 'account_id')):
+            cursor.execute(
+                f'SELECT t.{column}, COUNT(*) FROM {source} WHERE {where} GROUP BY t.{column} '
+                f'ORDER BY COUNT(*) DESC', params
+            )
+            field = Transaction._meta.get_field(column[:-3]).target_field
+            result[name] = [
+                {'id': field.to_python(value) if value is not None else None, 'count': count}
+                for value, count in cursor.fetchall()
+            ]
+        cursor.execute(
+            f'SELECT COUNT(*), MIN(t.amount), MAX(t.amount), MIN(t.transaction_date), '
+            f'MAX(t.transaction_date) FROM {source} WHERE {where}', params
+        )
+        total, low, high, first, last = cursor.fetchone()
+        result.update({
+            'total': total,
+            'amount': {'min': self.amount_value(low), 'max': self.amount_value(high)},
+            'date': {'min': self.date_value(first), 'max': self.date_value(last)},
+        })
+        return result
+
+    @staticmethod
+    def amount_value(value):
+        return None if value is None else Decimal(str(value)).quantize(Decimal('0.01'))
+
+    @staticmethod
+    def date_value(value):
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        if value is not None and timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        return value
+
+    def fallback(self, words, limit, offset, facets):
+        """icontains scan for backends without a search index"""
+        queryset = self.filtered()
+        for word in words:
+            queryset = queryset.filter(
+                Q(description__icontains=word) | Q(merchant_name__icontains=word)
+                | Q(notes__icontains=word) | Q(location__icontains=word)
+            )
+        ids = list(queryset.order_by('-transaction_date').values_list('id', flat=True)[offset:offset + limit + 1])
+        summary = None
+        if facets:
+            ranges = queryset.aggregate(
+                total=Count('id'), amount_min=Min('amount'), amount_max=Max('amount'),
+                date_min=Min('transaction_date'), date_max=Max('transaction_date'),
+            )
+            summary = {
+                'categories': [
+                    {'id': row['category'], 'count': row['count']}
+                    for row in queryset.order_by().values('category').annotate(count=Count('id')).order_by('-count')
+                ],
+                'accounts': [
+                    {'id': row['account'], 'count': row['count']}
+                    for row in queryset.order_by().values('account').annotate(count=Count('id')).order_by('-count')
+                ],
+                'total': ranges['total'],
+                'amount': {'min': ranges['amount_min'], 'max': ranges['amount_max']},
+                'date': {'min': ranges['date_min'], 'max': ranges['date_max']},
+            }
+        return ids, summary
+
+    def search(self, text, limit=DEFAULT_LIMIT, offset=0, facets=False):
+        """
+        Return ``(transactions, has_more, facets)`` for a page of results,
+        best match first.
+        """
+        words = query_words(text)
+        if not words:
+            return [], False, None
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        offset = max(0, int(offset))
+
+        match = self.match_sql(words)
+        if match is None:
+            ids, summary = self.fallback(words, limit, offset, facets)
+        else:
+            ids, summary = self.run(match, limit, offset, facets)
+            if not ids and not offset and connection.vendor == 'postgresql':
+                ids, summary = self.run(self.trigram_sql(' '.join(words)), limit, offset, facets)
+
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        rows = Transaction.objects.filter(pk__in=ids).select_related('account', 'category')
+        by_id = {row.pk: row for row in rows}
+        return [by_id[pk] for pk in ids if pk in by_id], has_more, summary
@@ -1,7 +1,11 @@
 # Core API Serializers - Complete Implementation
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from .models import User, Account, Category, Transaction, Budget, Goal, FinancialHealthScore, AIInsight, SyncOperation
+from .models import (
+    User, Account, Category, Transaction, RecurringTransaction, Budget, Goal, FinancialHealthScore, AIInsight,
+    SyncOperation
+)
+from .services import BudgetProgressService
 from decimal import Decimal
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -103,6 +107,47 @@ class TransactionSerializer(serializers.ModelSerializer):
         sign = '+' if obj.transaction_type == 'credit' else '-'
         return f"{sign}${obj.amount:,.2f}"
 
+class RecurringTransactionSerializer(serializers.ModelSerializer):
+    """Recurring transaction template serializer"""
+    next_due_date = serializers.DateField(required=False)
+    
+    class Meta:
+        model = RecurringTransaction
+        fields = ['id', 'account', 'category', 'name', 'amount', 'transaction_type', 'description',
+                 'merchant_name', 'frequency', 'start_date', 'end_date', 'next_due_date', 'is_active',
+                 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The scheduler writes transactions to these, so only the user's own are accepted
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            self.fields['account'].queryset = Account.objects.filter(user=user)
+            self.fields['category'].queryset = Category.objects.filter(user=user)
+
+    def validate(self, attrs):
+        start_date = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if end_date and start_date and end_date < start_date:
+            raise serializers.ValidationError("end_date cannot be before start_date")
+        if self.instance is None and 'next_due_date' not in attrs:
+            attrs['next_due_date'] = start_date
+        return attrs
+
+class BudgetListSerializer(serializers.ListSerializer):
+    """Resolves spent amounts for the whole list before serializing rows"""
+
+    def to_representation(self, data):
+        iterable = data.all() if hasattr(data, 'all') else data
+        budgets = list(iterable)
+        memo = self.context.setdefault('budget_spent', {})
+        pending = [budget for budget in budgets if budget.pk not in memo]
+        if pending:
+            memo.update(BudgetProgressService.spent_amounts(pending))
+        return super().to_representation(budgets)
+
 class BudgetSerializer(serializers.ModelSerializer):
     """Budget serializer"""
     category_name = serializers.CharField(source='category.name', read_only=True)
@@ -116,16 +161,14 @@ class BudgetSerializer(serializers.ModelSerializer):
                  'start_date', 'end_date', 'alert_threshold', 'is_active', 'rollover_unused',
                  'spent_amount', 'remaining_amount', 'progress_percentage', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
+        list_serializer_class = BudgetListSerializer
 
     def get_spent_amount(self, obj):
-        # Calculate spent amount for this budget period
-        transactions = Transaction.objects.filter(
-            user=obj.user,
-            category=obj.category,
-            transaction_date__range=[obj.start_date, obj.end_date],
-            transaction_type='debit'
-        )
-        return sum(t.amount for t in transactions)
+        # Memoized per request; list serialization preloads the whole page
+        memo = self.context.setdefault('budget_spent', {})
+        if obj.pk not in memo:
+            memo.update(BudgetProgressService.spent_amounts([obj]))
+        return memo[obj.pk]
 
     def get_remaining_amount(self, obj):
         spent = self.get_spent_amount(obj)
@@ -0,0 +1,646 @@
+# Core Services - Query engines shared by the API views
+from django.core.cache import cache
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import (
+    Q, F, Sum, Count, Min, Max, OuterRef, Subquery, DecimalField, BigIntegerField, Value, Case, When
+)
+from django.db.models.functions import Coalesce, Greatest, Least, TruncMonth
+from django.utils import timezone
+from datetime import date, datetime
+from decimal import Decimal
+import hashlib
+import time
+
+from .models import (
+    Account, Category, Transaction, Budget, Goal, AIInsight, TransactionMonthlyRollup,
+    ChangeSequence, ChangeLogEntry
+)
+
+
+# Field types whose Python values the database adapters take as they are
+PLAIN_FIELD_TYPES = {
+    'CharField', 'TextField', 'BooleanField', 'FloatField', 'IntegerField',
+    'BigIntegerField', 'PositiveIntegerField', 'SmallIntegerField',
+}
+
+
+def bulk_insert(model, field_names, rows, batch_size=2000):
+    """
+    INSERT new rows with one ``executemany`` per batch.
+
+    ``rows`` yields tuples of Python values in ``field_names`` order (use
+    attnames such as ``user_id`` for foreign keys). Unlike ``bulk_create``
+    nothing is compiled per value and no defaults, ``auto_now`` values or
+    signals are applied, so callers pass every column including the primary
+    key. Meant for large loads where ORM overhead dominates.
+    """
+    connection = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(name) for name in field_names]
+    preparers = [
+        None if field.get_internal_type() in PLAIN_FIELD_TYPES else field.get_db_prep_save
+        for field in fields
+    ]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+
+    # Rows of a load share many values (timestamps, owners, dates); each
+    # column remembers the last value it prepared
+    last = [(object(), None)] * len(fields)
+
+    def prepare_row(row):
+        prepared = []
+        for i, (prepare, value) in enumerate(zip(preparers, row)):
+            if prepare is None or value is None:
+                prepared.append(value)
+            elif value is last[i][0]:
+                prepared.append(last[i][1])
+            else:
+                last[i] = (value, prepare(value, connection))
+                prepared.append(last[i][1])
+        return prepared
+
+    inserted = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(prepare_row(row))
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            inserted += len(batch)
+    return inserted
+
+
+def month_bounds(moment):
+    """Return the [start, end) datetimes of the month containing ``moment``"""
+    start = moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+
+def rollup_month(moment):
+    """Month bucket (first day of the month) for a date or datetime"""
+    if isinstance(moment, datetime) and timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return date(moment.year, moment.month, 1)
+
+
+def month_window(month):
+    """Return the [start, end) aware datetimes of a rollup month bucket"""
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    return month_bounds(start)
+
+
+class TransactionRollupService:
+    """
+    Maintains ``TransactionMonthlyRollup`` buckets keyed by
+    (user, category, month, transaction_type).
+
+    Creates are applied incrementally with F() expressions. Updates and
+    deletes recompute the affected buckets from their month range, since
+    min/max cannot be decremented.
+    """
+
+    @staticmethod
+    def bucket_key(user_id, category_id, transaction_date, transaction_type):
+        return (user_id, category_id, rollup_month(transaction_date), transaction_type)
+
+    @classmethod
+    def key_for(cls, transaction):
+        return cls.bucket_key(
+            transaction.user_id,
+            transaction.category_id,
+            transaction.transaction_date,
+            transaction.transaction_type,
+        )
+
+    @staticmethod
+    def add(transaction):
+        """Add a newly created transaction to its bucket"""
+        amount = transaction.amount
+        with db_transaction.atomic():
+            rollup, created = TransactionMonthlyRollup.objects.select_for_update().get_or_create(
+                user_id=transaction.user_id,
+                category_id=transaction.category_id,
+                month=rollup_month(transaction.transaction_date),
+                transaction_type=transaction.transaction_type,
+                defaults={
+                    'total_amount': amount,
+                    'transaction_count': 1,
+                    'min_amount': amount,
+                    'max_amount': amount,
+                }
+            )
+            if not created:
+                TransactionMonthlyRollup.objects.filter(pk=rollup.pk).update(
+                    total_amount=F('total_amount') + amount,
+                    transaction_count=F('transaction_count') + 1,
+                    min_amount=Least(F('min_amount'), Value(amount)),
+                    max_amount=Greatest(F('max_amount'), Value(amount)),
+                    updated_at=timezone.now(),
+                )
+
+    @classmethod
+    def add_many(cls, transactions):
+        """
+        Add newly created transactions of any users to their buckets with one
+        locked read of the touched buckets, one bulk update and one bulk insert
+        """
+        deltas = {}
+        for transaction in transactions:
+            key = cls.key_for(transaction)
+            amount = transaction.amount
+            total, count, low, high = deltas.get(key, (Decimal('0.00'), 0, amount, amount))
+            deltas[key] = (total + amount, count + 1, min(low, amount), max(high, amount))
+        if not deltas:
+            return
+
+        now = timezone.now()
+        with db_transaction.atomic():
+            existing = TransactionMonthlyRollup.objects.select_for_update().filter(
+                user_id__in={key[0] for key in deltas}, month__in={key[2] for key in deltas}
+            )
+            changed = []
+            for rollup in existing:
+                key = (rollup.user_id, rollup.category_id, rollup.month, rollup.transaction_type)
+                if key not in deltas:
+                    continue
+                total, count, low, high = deltas.pop(key)
+                rollup.total_amount += total
+                rollup.transaction_count += count
+                rollup.min_amount = min(rollup.min_amount, low)
+                rollup.max_amount = max(rollup.max_amount, high)
+                rollup.updated_at = now
+                changed.append(rollup)
+            TransactionMonthlyRollup.objects.bulk_update(
+                changed, ['total_amount', 'transaction_count', 'min_amount', 'max_amount', 'updated_at'],
+                batch_size=500
+            )
+            TransactionMonthlyRollup.objects.bulk_create([
+                TransactionMonthlyRollup(
+                    user_id=user_id, category_id=category_id, month=month, transaction_type=transaction_type,
+                    total_amount=total, transaction_count=count, min_amount=low, max_amount=high,
+                )
+                for (user_id, category_id, month, transaction_type), (total, count, low, high) in deltas.items()
+            ], batch_size=1000)
+
+    @staticmethod
+    def refresh_bucket(user_id, category_id, month, transaction_type):
+        """Recompute a single bucket from its month of transactions"""
+        start, end = month_window(month)
+        totals = Transaction.objects.filter(
+            user_id=user_id,
+            category_id=category_id,
+            transaction_type=transaction_type,
+            transaction_date__gte=start,
+            transaction_date__lt=end,
+        ).aggregate(
+            total=Sum('amount'),
+            count=Count('id'),
+            low=Min('amount'),
+            high=Max('amount'),
+        )
+        key = {
+            'user_id': user_id,
+            'category_id': category_id,
+            'month': month,
+            'transaction_type': transaction_type,
+        }
+        if not totals['count']:
+            TransactionMonthlyRollup.objects.filter(**key).delete()
+            return
+        TransactionMonthlyRollup.objects.update_or_create(
+            defaults={
+                'total_amount': totals['total'],
+                'transaction_count': totals['count'],
+                'min_amount': totals['low'],
+                'max_amount': totals['high'],
+            },
+            **key
+        )
+
+    @staticmethod
+    def rebuild(user=None, months=None):
+        """
+        Rebuild buckets from raw transactions with one grouped query.
+
+        ``user`` limits the rebuild to one user and ``months`` to an iterable
+        of month buckets; with neither, the whole table is rebuilt.
+        """
+        transactions = Transaction.objects.all()
+        rollups = TransactionMonthlyRollup.objects.all()
+        if user is not None:
+            transactions = transactions.filter(user=user)
+            rollups = rollups.filter(user=user)
+        if months is not None:
+            months = sorted(set(months))
+            if not months:
+                return 0
+            window = Q()
+            for month in months:
+                start, end = month_window(month)
+                window |= Q(transaction_date__gte=start, transaction_date__lt=end)
+            transactions = transactions.filter(window)
+            rollups = rollups.filter(month__in=months)
+
+        with db_transaction.atomic():
+            rollups.delete()
+            created = TransactionMonthlyRollup.objects.bulk_create(
+                TransactionRollupService.grouped(transactions), batch_size=1000
+            )
+        return len(created)
+
+    @staticmethod
+    def grouped(transactions, model=TransactionMonthlyRollup):
+        """
+        Unsaved ``model`` rows for ``transactions``, aggregated in one grouped
+        query. ``model`` may be a migration's historical rollup model.
+        """
+        grouped = (
+            transactions.order_by()
+            .annotate(bucket=TruncMonth('transaction_date'))
+            .values('user_id', 'category_id', 'bucket', 'transaction_type')
+            .annotate(total=Sum('amount'), count=Count('id'), low=Min('amount'), high=Max('amount'))
+        )
+        return [
+            model(
+                user_id=row['user_id'],
+                category_id=row['category_id'],
+                month=rollup_month(row['bucket']),
+                transaction_type=row['transaction_type'],
+                total_amount=row['total'],
+                transaction_count=row['count'],
+                min_amount=row['low'],
+                max_amount=row['high'],
+            )
+            for row in grouped.iterator()
+        ]
+
+    @staticmethod
+    def month_totals(user, month):
+        """Income and expense totals for a month, read from the rollups"""
+        totals = TransactionMonthlyRollup.objects.filter(user=user, month=month).aggregate(
+            income=Sum('total_amount', filter=Q(category__category_type='income')),
+            expenses=Sum('total_amount', filter=Q(category__category_type='expense')),
+        )
+        return totals['income'] or Decimal('0.00'), totals['expenses'] or Decimal('0.00')
+
+
+def annotate_budget_spent(queryset):
+    """
+    Annotate budgets with ``spent_total``: the debit total of the budget's
+    category inside its date window, computed as a correlated subquery so a
+    whole list of budgets costs a single query.
+    """
+    spent = Transaction.objects.filter(
+        user=OuterRef('user'),
+        category=OuterRef('category'),
+        transaction_type='debit',
+        transaction_date__date__gte=OuterRef('start_date'),
+        transaction_date__date__lte=OuterRef('end_date'),
+    ).order_by().values('category').annotate(total=Sum('amount')).values('total')
+
+    return queryset.annotate(
+        spent_total=Coalesce(
+            Subquery(spent, output_field=DecimalField(max_digits=15, decimal_places=2)),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        )
+    )
+
+
+class BudgetProgressService:
+    """
+    Spent amounts for budgets.
+
+    A page of budgets is resolved with one grouped aggregate and the results
+    are cached per budget. Cache keys embed a version counter for every
+    (category, month) in the budget window; transaction writes bump the
+    counters of the buckets they touch, so only affected budgets miss.
+    """
+
+    CACHE_TIMEOUT = 60 * 60 * 24
+
+    @staticmethod
+    def version_key(category_id, month):
+        return f"budget_spend_version:{category_id}:{month:%Y-%m}"
+
+    @staticmethod
+    def new_version():
+        # Time-based so an evicted counter never reuses an old value
+        return int(time.time() * 1000)
+
+    @staticmethod
+    def window_months(budget):
+        months = []
+        month = rollup_month(budget.start_date)
+        while month <= budget.end_date:
+            months.append(month)
+            month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        return months
+
+    @classmethod
+    def cache_key(cls, budget, versions):
+        fingerprint = ':'.join(str(version) for version in versions)
+        digest = hashlib.md5(fingerprint.encode()).hexdigest()
+        return f"budget_spent:{budget.pk}:{budget.category_id}:{budget.start_date}:{budget.end_date}:{digest}"
+
+    @classmethod
+    def spent_amounts(cls, budgets):
+        """Return ``{budget.pk: spent}`` for an iterable of budgets"""
+        budgets = list(budgets)
+        if not budgets:
+            return {}
+
+        window_keys = {
+            budget.pk: [cls.version_key(budget.category_id, month) for month in cls.window_months(budget)]
+            for budget in budgets
+        }
+        all_version_keys = {key for keys in window_keys.values() for key in keys}
+        versions = cache.get_many(all_version_keys)
+        missing_versions = {key: cls.new_version() for key in all_version_keys if key not in versions}
+        if missing_versions:
+            cache.set_many(missing_versions, None)
+            versions.update(missing_versions)
+
+        keys = {
+            budget.pk: cls.cache_key(budget, [versions[key] for key in window_keys[budget.pk]])
+            for budget in budgets
+        }
+        cached = cache.get_many(keys.values())
+        spent = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+        missing = [budget.pk for budget in budgets if budget.pk not in spent]
+        if missing:
+            computed = dict(
+                annotate_budget_spent(Budget.objects.filter(pk__in=missing))
+                .values_list('pk', 'spent_total')
+            )
+            spent.update(computed)
+            cache.set_many({keys[pk]: computed[pk] for pk in computed}, cls.CACHE_TIMEOUT)
+
+        return spent
+
+    @classmethod
+    def invalidate(cls, category_id, month):
+        """Bump the version of one (category, month) bucket"""
+        if category_id is None:
+            return
+        key = cls.version_key(category_id, month)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, cls.new_version(), None)
+
+
+class FinancialDataVersion:
+    """
+    Per-user counter bumped by every Transaction, Budget and Goal write.
+
+    Caches of anything derived from a user's financial data (chat context,
+    AI responses) embed the current version in their keys instead of
+    tracking individual rows.
+    """
+
+    @staticmethod
+    def key(user_id):
+        return f"financial_data_version:{user_id}"
+
+    @classmethod
+    def current(cls, user_id):
+        return cache.get_or_set(cls.key(user_id), BudgetProgressService.new_version, None)
+
+    @classmethod
+    def bump(cls, user_id):
+        key = cls.key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, BudgetProgressService.new_version(), None)
+
+
+class ChangeFeed:
+    """
+    Per-user change sequence for delta sync.
+
+    Every write to an Account, Category, Transaction, Budget or Goal moves
+    that entity's single ``ChangeLogEntry`` to the user's next sequence
+    number; deletes leave it behind as a tombstone. Clients keep the highest
+    sequence they have seen and ask for everything after it, so the feed
+    holds one row per entity however often it changes.
+
+    Tombstones are kept for ``CHANGE_LOG_RETENTION_DAYS`` and then removed
+    by ``prune_change_log``. A client asking from before the removed ones
+    gets 410 Gone with ``reset`` and must drop its copy and pull from 0.
+    """
+
+    BATCH_SIZE = 500
+
+    @staticmethod
+    def allocate(user_id, count):
+        """
+        Reserve ``count`` sequence numbers and return the last one. The
+        counter row stays locked until the caller's transaction commits, so
+        numbers become visible in order.
+        """
+        sequence = ChangeSequence.objects.filter(user_id=user_id)
+        if not sequence.update(value=F('value') + count):
+            ChangeSequence.objects.get_or_create(user_id=user_id)
+            sequence.update(value=F('value') + count)
+        return sequence.values_list('value', flat=True).get()
+
+    @staticmethod
+    def allocate_many(counts):
+        """``allocate`` for several users at once: ``{user_id: count}`` -> ``{user_id: last}``"""
+        ChangeSequence.objects.bulk_create(
+            [ChangeSequence(user_id=user_id) for user_id in counts], ignore_conflicts=True
+        )
+        sequences = ChangeSequence.objects.filter(user_id__in=list(counts))
+        sequences.update(value=F('value') + Case(
+            *[When(user_id=user_id, then=Value(count)) for user_id, count in counts.items()],
+            default=Value(0), output_field=BigIntegerField()
+        ))
+        return dict(sequences.values_list('user_id', 'value'))
+
+    @classmethod
+    def record(cls, user_id, entity_type, entity_ids, action='upsert', created=False):
+        """
+        Log changes to ``entity_ids`` of ``entity_type`` with one upsert.
+        ``created`` promises the entities are new, which allows a plain insert.
+        """
+        entity_ids = list(dict.fromkeys(entity_ids))
+        if not entity_ids:
+            return
+        with db_transaction.atomic():
+            first = cls.allocate(user_id, len(entity_ids)) - len(entity_ids) + 1
+            cls.write(entity_type, action, created, (
+                (user_id, first + offset, entity_id) for offset, entity_id in enumerate(entity_ids)
+            ))
+
+    @classmethod
+    def record_many(cls, entity_type, ids_by_user, action='upsert', created=False):
+        """``record`` for several users at once, with one sequence allocation"""
+        ids_by_user = {
+            user_id: list(dict.fromkeys(entity_ids)) for user_id, entity_ids in ids_by_user.items() if entity_ids
+        }
+        if not ids_by_user:
+            return
+        with db_transaction.atomic():
+            last = cls.allocate_many({user_id: len(entity_ids) for user_id, entity_ids in ids_by_user.items()})
+            cls.write(entity_type, action, created, (
+                (user_id, last[user_id] - len(entity_ids) + 1 + offset, entity_id)
+                for user_id, entity_ids in ids_by_user.items()
+                for offset, entity_id in enumerate(entity_ids)
+            ))
+
+    @classmethod
+    def write(cls, entity_type, action, created, entries):
+        """Store ``(user_id, seq, entity_id)`` entries"""
+        if created:
+            now = timezone.now()
+            bulk_insert(
+                ChangeLogEntry,
+                ['user_id', 'seq', 'entity_type', 'entity_id', 'action', 'changed_at'],
+                ((user_id, seq, entity_type, entity_id, action, now) for user_id, seq, entity_id in entries),
+            )
+            return
+        ChangeLogEntry.objects.bulk_create(
+            [
+                ChangeLogEntry(
+                    user_id=user_id, seq=seq, entity_type=entity_type, entity_id=entity_id, action=action
+                )
+                for user_id, seq, entity_id in entries
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'entity_type', 'entity_id'],
+            update_fields=['seq', 'action', 'changed_at'],
+            batch_size=cls.BATCH_SIZE,
+        )
+
+    @staticmethod
+    def prune(before):
+        """
+        Drop tombstones older than ``before``. Clients whose cursor predates
+        a removed tombstone are told to resync from scratch.
+        """
+        tombstones = ChangeLogEntry.objects.filter(action='delete', changed_at__lt=before)
+        for row in tombstones.values('user_id').annotate(last=Max('seq')):
+            ChangeSequence.objects.filter(user_id=row['user_id'], pruned_through__lt=row['last']).update(
+                pruned_through=row['last']
+            )
+        removed, _ = tombstones.delete()
+        return removed
+
+
+class DashboardEngine:
+    """
+    Dashboard query engine.
+
+    Builds every dashboard figure from a fixed number of grouped queries so the
+    endpoint cost does not grow with the number of categories, budgets or
+    goals a user has.
+    """
+
+    RECENT_TRANSACTION_LIMIT = 10
+    PENDING_INSIGHT_LIMIT = 5
+
+    def __init__(self, user, now=None):
+        self.user = user
+        self.now = timezone.localtime(now or timezone.now())
+        self.month = rollup_month(self.now)
+
+    def account_summary(self):
+        """Total balance and count of active accounts in one query"""
+        summary = Account.objects.filter(user=self.user, is_active=True).aggregate(
+            total=Sum('balance'),
+            count=Count('id'),
+        )
+        return summary['total'] or Decimal('0.00'), summary['count']
+
+    def category_totals(self):
+        """Current month totals for every category (GROUP BY category_id)"""
+        month_filter = Q(
+            monthly_rollups__user=self.user,
+            monthly_rollups__month=self.month,
+        )
+        return list(
+            Category.objects.filter(user=self.user)
+            .annotate(month_total=Sum('monthly_rollups__total_amount', filter=month_filter))
+            .values('id', 'name', 'category_type', 'month_total')
+        )
+
+    def recent_transactions(self):
+        return list(
+            Transaction.objects.filter(user=self.user)
+            .select_related('account', 'category')
+            .order_by('-transaction_date')[:self.RECENT_TRANSACTION_LIMIT]
+        )
+
+    def active_budgets(self):
+        return list(
+            Budget.objects.filter(
+                user=self.user,
+                is_active=True,
+                end_date__gte=self.now.date()
+            ).select_related('category')
+        )
+
+    def active_goals(self):
+        return list(Goal.objects.filter(user=self.user, is_active=True).order_by('target_date'))
+
+    def pending_insights(self):
+        return list(
+            AIInsight.objects.filter(user=self.user, is_read=False, is_dismissed=False)
+            .prefetch_related('related_transactions', 'related_categories')
+            .order_by('-created_at')[:self.PENDING_INSIGHT_LIMIT]
+        )
+
+    def health_score(self):
+        """Latest persisted health score, rescored only if the data changed"""
+        from .scoring import HealthScoreEngine
+        return HealthScoreEngine(self.now).current(self.user)
+
+    def build(self):
+        """Collect the raw dashboard data (model instances and totals)"""
+        total_balance, account_count = self.account_summary()
+
+        monthly_income = Decimal('0.00')
+        monthly_expenses = Decimal('0.00')
+        category_spending = {}
+        for row in self.category_totals():
+            total = row['month_total'] or Decimal('0.00')
+            if row['category_type'] == 'income':
+                monthly_income += total
+            elif row['category_type'] == 'expense':
+                monthly_expenses += total
+                category_spending[row['name']] = float(total)
+
+        savings_rate = 0.0
+        if monthly_income > 0:
+            savings_rate = ((monthly_income - monthly_expenses) / monthly_income) * 100
+
+        active_budgets = self.active_budgets()
+        active_goals = self.active_goals()
+
+        return {
+            'total_balance': total_balance,
+            'account_count': account_count,
+            'monthly_income': monthly_income,
+            'monthly_expenses': monthly_expenses,
+            'savings_rate': savings_rate,
+            'recent_transactions': self.recent_transactions(),
+            'active_budgets': active_budgets,
+            'active_goals': active_goals,
+            'financial_health': self.health_score(),
+            'pending_insights': self.pending_insights(),
+            'category_spending': category_spending,
+        }
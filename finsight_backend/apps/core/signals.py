@@ -0,0 +1,229 @@
+"""
+Core app signals for FinSight Backend
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver, Signal
+from .models import Account, Category, Transaction, TransactionMonthlyRollup, Budget, Goal
+from .services import (
+    TransactionRollupService, BudgetProgressService, FinancialDataVersion, ChangeFeed, rollup_month
+)
+
+# Sent by code paths that write transactions without model signals
+# (bulk_create, queryset.update/delete). Receivers get ``user``,
+# ``months``: the month buckets (see ``rollup_month``) whose
+# transactions changed, and optionally ``category_ids`` when the writer
+# knows which categories were touched.
+transactions_bulk_changed = Signal()
+
+_suspension = threading.local()
+
+
+@contextmanager
+def suspend_row_signals():
+    """
+    Skip the per-row Transaction/Budget/Goal receivers in this thread.
+
+    For bulk writers that touch many rows at once; they must send
+    ``transactions_bulk_changed`` (and bump ``FinancialDataVersion`` for
+    budget/goal writes) when done instead, and record their rows in the
+    ``ChangeFeed``.
+    """
+    previous = getattr(_suspension, 'active', False)
+    _suspension.active = True
+    try:
+        yield
+    finally:
+        _suspension.active = previous
+
+
+def row_signals_suspended():
+    return getattr(_suspension, 'active', False)
+
+
+@receiver(pre_save, sender=Transaction)
+def capture_previous_rollup_key(sender, instance, raw=False, **kwargs):
+    """
+    Remember the bucket an existing transaction belonged to before it changes
+    """
+    instance._previous_rollup_key = None
+    if raw or instance._state.adding or row_signals_suspended():
+        return
+    previous = Transaction.objects.filter(pk=instance.pk).values(
+        'user_id', 'category_id', 'transaction_date', 'transaction_type'
+    ).first()
+    if previous:
+        instance._previous_rollup_key = TransactionRollupService.bucket_key(
+            previous['user_id'],
+            previous['category_id'],
+            previous['transaction_date'],
+            previous['transaction_type'],
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep the monthly rollups in step with a saved transaction
+    """
+    if raw or row_signals_suspended():
+        return
+    previous_key = getattr(instance, '_previous_rollup_key', None)
+    if created or previous_key is None:
+        TransactionRollupService.add(instance)
+        return
+
+    # Updates recompute the old and the new bucket
+    current_key = TransactionRollupService.key_for(instance)
+    TransactionRollupService.refresh_bucket(*previous_key)
+    if current_key != previous_key:
+        TransactionRollupService.refresh_bucket(*current_key)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    """
+    Recompute the bucket of a deleted transaction
+    """
+    if row_signals_suspended():
+        return
+    TransactionRollupService.refresh_bucket(*TransactionRollupService.key_for(instance))
+
+
+@receiver(pre_delete, sender=Category)
+def capture_category_rollup_months(sender, instance, **kwargs):
+    """
+    Remember the months touched by a category before its rollups cascade away
+    """
+    instance._rollup_months = list(
+        TransactionMonthlyRollup.objects.filter(category=instance).values_list('month', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def rebuild_rollups_on_category_delete(sender, instance, **kwargs):
+    """
+    Transactions of a deleted category become uncategorized; refold them
+    """
+    months = getattr(instance, '_rollup_months', None)
+    if months:
+        TransactionRollupService.rebuild(user=instance.user_id, months=months)
+
+
+@receiver(transactions_bulk_changed)
+def rebuild_rollups_on_bulk_change(sender, user, months, **kwargs):
+    """
+    Rebuild the rollups of months touched by a bulk write
+    """
+    TransactionRollupService.rebuild(user=user, months=months)
+
+
+@receiver(post_save, sender=Transaction)
+def invalidate_budget_spend_on_save(sender, instance, raw=False, **kwargs):
+    """
+    Expire cached budget spend for the buckets a transaction moved between
+    """
+    if raw or row_signals_suspended():
+        return
+    keys = {TransactionRollupService.key_for(instance)}
+    previous_key = getattr(instance, '_previous_rollup_key', None)
+    if previous_key:
+        keys.add(previous_key)
+    for user_id, category_id, month, transaction_type in keys:
+        BudgetProgressService.invalidate(category_id, month)
+
+
+@receiver(post_delete, sender=Transaction)
+def invalidate_budget_spend_on_delete(sender, instance, **kwargs):
+    """
+    Expire cached budget spend for a deleted transaction
+    """
+    if row_signals_suspended():
+        return
+    BudgetProgressService.invalidate(instance.category_id, rollup_month(instance.transaction_date))
+
+
+@receiver(transactions_bulk_changed)
+def invalidate_budget_spend_on_bulk_change(sender, user, months, category_ids=None, **kwargs):
+    """
+    Expire cached budget spend for every bucket a bulk write touched
+    """
+    if category_ids is None:
+        category_ids = Category.objects.filter(user=user).values_list('id', flat=True)
+    for category_id in category_ids:
+        for month in months:
+            BudgetProgressService.invalidate(category_id, month)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+def bump_financial_data_version(sender, instance, raw=False, **kwargs):
+    """
+    Retire per-user caches built from the changed financial data
+    """
+    if raw or row_signals_suspended():
+        return
+    FinancialDataVersion.bump(instance.user_id)
+
+
+@receiver(transactions_bulk_changed)
+def bump_financial_data_version_on_bulk_change(sender, user, **kwargs):
+    """
+    Retire per-user caches after a bulk transaction write
+    """
+    FinancialDataVersion.bump(user.pk)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Budget)
+@receiver(post_save, sender=Goal)
+def record_change_on_save(sender, instance, raw=False, **kwargs):
+    """
+    Move a saved entity to the head of its user's change feed
+    """
+    if raw or row_signals_suspended():
+        return
+    ChangeFeed.record(instance.user_id, sender.__name__, [instance.pk])
+
+
+@receiver(post_delete, sender=Account)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Budget)
+@receiver(post_delete, sender=Goal)
+def record_change_on_delete(sender, instance, **kwargs):
+    """
+    Leave a tombstone for a deleted entity
+    """
+    if row_signals_suspended():
+        return
+    ChangeFeed.record(instance.user_id, sender.__name__, [instance.pk], action='delete')
+    
+    # Transactions pointing at the row were detached without signals
+    detached = getattr(instance, '_detached_transaction_ids', None)
+    if detached:
+        ChangeFeed.record(instance.user_id, 'Transaction', detached)
+
+
+@receiver(pre_delete, sender=Account)
+@receiver(pre_delete, sender=Category)
+def capture_detached_transactions(sender, instance, **kwargs):
+    """
+    Remember transactions whose SET_NULL reference the delete will clear
+    """
+    if row_signals_suspended():
+        return
+    reference = Q(category=instance) if sender is Category else Q(transfer_to_account=instance)
+    instance._detached_transaction_ids = list(
+        Transaction.objects.filter(reference).values_list('id', flat=True)
+    )
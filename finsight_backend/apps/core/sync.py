@@ -0,0 +1,489 @@
+# Core Sync - Offline-first push/pull engine
+"""
+Devices push batches of operations shaped like ``SyncOperation`` rows and pull
+everything that changed since their last cursor.
+
+A push verifies each operation's checksum, collapses repeated operations on
+the same entity, then applies them per entity type in dependency order with
+``bulk_create``/``bulk_update``/one ``DELETE`` per batch, each batch in its own
+transaction. Conflicts with newer server rows are resolved last-writer-wins
+or, when the client sends the ``base`` values it last saw, per field. Every
+operation is recorded as a ``SyncOperation`` with its outcome.
+
+Pulls read the per-user change feed (``ChangeFeed``), so they see every
+write and delete whichever path made it.
+
+Checksum: SHA-256 hex digest of ``json.dumps(data, sort_keys=True,
+separators=(',', ':'))``.
+"""
+import base64
+import datetime
+import hashlib
+import json
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import nullcontext
+
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Account, Category, Transaction, Budget, Goal, SyncOperation, ChangeSequence, ChangeLogEntry
+)
+from .services import FinancialDataVersion, ChangeFeed, rollup_month
+from .signals import suspend_row_signals, transactions_bulk_changed
+
+# Entity types in the order they are applied (referenced rows first)
+SYNC_MODELS = OrderedDict([
+    ('Account', Account),
+    ('Category', Category),
+    ('Transaction', Transaction),
+    ('Budget', Budget),
+    ('Goal', Goal),
+])
+
+# Leaf models applied with their per-row receivers suspended. Accounts and
+# categories keep them so cascaded deletes still refresh rollups and the feed.
+BULK_MODELS = (Transaction, Budget, Goal)
+
+READ_ONLY_FIELDS = {'id', 'user', 'import_fingerprint', 'created_at', 'updated_at'}
+CONFLICT_STRATEGIES = ('lww', 'merge')
+BATCH_SIZE = 500
+MAX_PUSH_OPERATIONS = 10000
+DEFAULT_PULL_LIMIT = 500
+MAX_PULL_LIMIT = 2000
+
+
+class SyncError(Exception):
+    """An operation that cannot be applied"""
+
+
+def compute_checksum(data):
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def writable_fields(model):
+    return {
+        field.name: field for field in model._meta.concrete_fields
+        if field.name not in READ_ONLY_FIELDS
+    }
+
+
+def serialize_instance(instance):
+    """Compact row for pull responses; foreign keys are sent as ids"""
+    row = {'id': instance.pk}
+    for field in instance._meta.concrete_fields:
+        if field.name not in ('id', 'user'):
+            row[field.name] = field.value_from_object(instance)
+    return row
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, default=str).encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return {}
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        raise SyncError('Invalid cursor')
+
+
+def changes_since(user, since=0, limit=DEFAULT_PULL_LIMIT):
+    """
+    One page of the user's change feed after sequence number ``since``:
+    current rows for upserts, ids for tombstones and the cursor to send
+    next. ``reset`` means tombstones the client never saw were pruned and
+    it must start again from 0.
+    """
+    limit = max(1, min(int(limit), MAX_PULL_LIMIT))
+    pruned_through = ChangeSequence.objects.filter(user=user).values_list('pruned_through', flat=True).first() or 0
+    if 0 < since < pruned_through:
+        return {'changes': {}, 'deleted': [], 'cursor': 0, 'has_more': True, 'reset': True}
+
+    entries = list(
+        ChangeLogEntry.objects.filter(user=user, seq__gt=since)
+        .order_by('seq').only('seq', 'entity_type', 'entity_id', 'action')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    upserts, deleted = defaultdict(list), []
+    for entry in entries:
+        if entry.action == 'delete':
+            deleted.append({'entity_type': entry.entity_type, 'entity_id': entry.entity_id})
+        elif entry.entity_type in SYNC_MODELS:
+            upserts[entry.entity_type].append(entry.entity_id)
+
+    changes = {
+        entity_type: [
+            serialize_instance(row)
+            for row in SYNC_MODELS[entity_type].objects.filter(user=user, pk__in=ids)
+        ]
+        for entity_type, ids in upserts.items()
+    }
+    return {
+        'changes': changes,
+        'deleted': deleted,
+        'cursor': entries[-1].seq if entries else since,
+        'has_more': has_more,
+        'reset': False,
+    }
+
+
+class PendingOperation:
+    """One pushed operation and its outcome"""
+
+    def __init__(self, raw, action, entity_type, entity_id, data, client_timestamp, priority, checksum, base):
+        self.raw = raw
+        self.action = action
+        self.entity_type = entity_type
+        self.entity_id = entity_id
+        self.data = data
+        self.client_timestamp = client_timestamp
+        self.priority = priority
+        self.checksum = checksum
+        self.base = base
+        self.values = {}
+        self.status = 'PENDING'
+        self.resolution = ''
+        self.error = ''
+
+    @property
+    def done(self):
+        return self.status != 'PENDING'
+
+    def complete(self, resolution='applied'):
+        self.status = 'COMPLETED'
+        self.resolution = resolution
+
+    def fail(self, error):
+        self.status = 'FAILED'
+        self.error = str(error)
+
+    def result(self):
+        return {
+            'entity_type': self.entity_type,
+            'entity_id': str(self.entity_id),
+            'status': self.status,
+            'resolution': self.resolution,
+            'error': self.error,
+        }
+
+
+class SyncEngine:
+    """Apply pushed operations and serve delta pulls for one user"""
+
+    def __init__(self, user, device_id='', strategy='lww'):
+        if strategy not in CONFLICT_STRATEGIES:
+            raise SyncError(f"Unknown conflict strategy '{strategy}'")
+        self.user = user
+        self.device_id = device_id
+        self.strategy = strategy
+        self.transaction_months = set()
+        self.transaction_categories = set()
+        self.touched_models = set()
+
+    # Parsing
+
+    def parse(self, raw):
+        if not isinstance(raw, dict):
+            raise SyncError('Operation must be an object')
+        action = str(raw.get('action', '')).upper()
+        if action not in dict(SyncOperation.SYNC_ACTIONS):
+            raise SyncError(f"Unknown action '{raw.get('action')}'")
+        entity_type = raw.get('entity_type')
+        if entity_type not in SYNC_MODELS:
+            raise SyncError(f"Unknown entity type '{entity_type}'")
+        try:
+            entity_id = uuid.UUID(str(raw.get('entity_id')))
+        except ValueError:
+            raise SyncError('Invalid entity_id')
+
+        data = raw.get('data') or {}
+        if not isinstance(data, dict):
+            raise SyncError('data must be an object')
+        checksum = raw.get('checksum', '')
+        if checksum != compute_checksum(data):
+            raise SyncError('Checksum mismatch')
+
+        client_timestamp = parse_datetime(str(raw.get('client_timestamp', '')))
+        if client_timestamp is None:
+            raise SyncError('Invalid client_timestamp')
+        if timezone.is_naive(client_timestamp):
+            client_timestamp = timezone.make_aware(client_timestamp)
+
+        try:
+            priority = int(raw.get('priority', 1))
+        except (TypeError, ValueError):
+            raise SyncError('Invalid priority')
+
+        return PendingOperation(
+            raw, action, entity_type, entity_id, data, client_timestamp, priority, checksum,
+            raw.get('base') if isinstance(raw.get('base'), dict) else None
+        )
+
+    @staticmethod
+    def coalesce(operations):
+        """
+        Collapse operations on the same entity into the one that must run:
+        updates fold into a preceding create/update, deletes win. Returns the
+        effective operations and the superseded ones.
+        """
+        effective = OrderedDict()
+        superseded = []
+        for op in sorted(operations, key=lambda op: op.client_timestamp):
+            key = (op.entity_type, op.entity_id)
+            previous = effective.get(key)
+            if previous is not None and op.action == 'UPDATE' and previous.action in ('CREATE', 'UPDATE'):
+                op.action = previous.action
+                op.data = {**previous.data, **op.data}
+                op.checksum = compute_checksum(op.data)
+                op.base = previous.base if previous.base is not None else op.base
+            if previous is not None:
+                previous.complete('coalesced')
+                superseded.append(previous)
+            effective[key] = op
+        return list(effective.values()), superseded
+
+    def coerce(self, model, data):
+        """Convert pushed JSON values to model values keyed by attname"""
+        fields = writable_fields(model)
+        by_attname = {field.attname: field for field in fields.values()}
+        values = {}
+        for key, value in data.items():
+            field = fields.get(key) or by_attname.get(key)
+            if field is None:
+                raise SyncError(f"Unknown field '{key}' for {model.__name__}")
+            try:
+                if field.is_relation:
+                    value = None if value in (None, '') else field.target_field.to_python(value)
+                else:
+                    value = field.to_python(value)
+                    if field.choices and value not in dict(field.flatchoices):
+                        raise ValidationError(f"'{value}' is not a valid choice")
+                    if isinstance(value, datetime.datetime) and timezone.is_naive(value):
+                        value = timezone.make_aware(value)
+            except ValidationError as e:
+                raise SyncError(f"{key}: {'; '.join(e.messages)}")
+            values[field.attname] = value
+        return values
+
+    @staticmethod
+    def missing_required(model, values):
+        return [
+            field.name for field in writable_fields(model).values()
+            if field.attname not in values and not (field.null or field.blank or field.has_default())
+        ]
+
+    # Push
+
+    def push(self, operations):
+        if len(operations) > MAX_PUSH_OPERATIONS:
+            raise SyncError(f"At most {MAX_PUSH_OPERATIONS} operations per push")
+
+        parsed, results = [], []
+        for raw in operations:
+            try:
+                parsed.append(self.parse(raw))
+            except SyncError as e:
+                results.append({'entity_id': str((raw or {}).get('entity_id', '')) if isinstance(raw, dict) else '',
+                                'status': 'FAILED', 'resolution': '', 'error': str(e)})
+
+        effective, superseded = self.coalesce(parsed)
+        for entity_type, model in SYNC_MODELS.items():
+            typed = [op for op in effective if op.entity_type == entity_type]
+            for start in range(0, len(typed), BATCH_SIZE):
+                batch = typed[start:start + BATCH_SIZE]
+                try:
+                    with db_transaction.atomic(), \
+                            suspend_row_signals() if model in BULK_MODELS else nullcontext():
+                        self.apply_batch(model, batch)
+                except Exception as e:
+                    for op in batch:
+                        op.fail(f"Batch failed: {e}")
+
+        self.after_push()
+        self.record(superseded + effective)
+
+        results += [op.result() for op in superseded + effective]
+        return {
+            'applied': sum(1 for op in effective if op.status == 'COMPLETED'
+                           and op.resolution in ('applied', 'created', 'merged')),
+            'conflicts': sum(1 for op in effective if op.resolution in ('server_wins', 'merged')),
+            'failed': sum(1 for result in results if result['status'] == 'FAILED'),
+            'results': results,
+            'server_time': timezone.now(),
+        }
+
+    def apply_batch(self, model, ops):
+        existing = {obj.pk: obj for obj in model.objects.filter(pk__in=[op.entity_id for op in ops])}
+
+        for op in ops:
+            obj = existing.get(op.entity_id)
+            if obj is not None and obj.user_id != self.user.pk:
+                op.fail('Entity belongs to another user')
+            elif op.action != 'DELETE':
+                try:
+                    op.values = self.coerce(model, op.data)
+                except SyncError as e:
+                    op.fail(e)
+        self.check_references(model, ops)
+
+        creates, updates, deletes = [], OrderedDict(), []
+        update_fields = set()
+        now = timezone.now()
+        for op in ops:
+            if op.done:
+                continue
+            obj = existing.get(op.entity_id)
+
+            if op.action == 'DELETE':
+                if obj is None:
+                    op.complete('already_deleted')
+                elif self.strategy == 'lww' and obj.updated_at > op.client_timestamp:
+                    op.complete('server_wins')
+                else:
+                    deletes.append(obj)
+                    op.complete()
+                continue
+
+            if obj is None:
+                missing = self.missing_required(model, op.values)
+                if missing:
+                    op.fail(f"Missing required fields: {', '.join(missing)}")
+                    continue
+                creates.append(model(pk=op.entity_id, user=self.user, **op.values))
+                op.complete('created')
+                continue
+
+            resolution, values = self.resolve(model, obj, op)
+            if values:
+                self.track_transaction(model, obj)
+                for attname, value in values.items():
+                    setattr(obj, attname, value)
+                obj.updated_at = now
+                updates[obj.pk] = obj
+                update_fields.update(values)
+                self.track_transaction(model, obj)
+            op.complete(resolution)
+
+        if creates:
+            model.objects.bulk_create(creates, batch_size=BATCH_SIZE)
+            for obj in creates:
+                self.track_transaction(model, obj)
+        if updates:
+            names = [field.name for field in writable_fields(model).values() if field.attname in update_fields]
+            model.objects.bulk_update(list(updates.values()), names + ['updated_at'], batch_size=BATCH_SIZE)
+        if deletes:
+            for obj in deletes:
+                self.track_transaction(model, obj)
+            model.objects.filter(user=self.user, pk__in=[obj.pk for obj in deletes]).delete()
+            if model in BULK_MODELS:
+                ChangeFeed.record(self.user.pk, model.__name__, [obj.pk for obj in deletes], action='delete')
+
+        # Bulk writes skip post_save, so they enter the change feed here
+        ChangeFeed.record(self.user.pk, model.__name__, [obj.pk for obj in creates] + list(updates))
+
+        if creates or updates or deletes:
+            self.touched_models.add(model)
+
+    def check_references(self, model, ops):
+        """Fail operations pointing at rows the user does not own"""
+        relations = [
+            field for field in writable_fields(model).values()
+            if field.is_relation and field.related_model in SYNC_MODELS.values()
+        ]
+        for field in relations:
+            referenced = {op.values.get(field.attname) for op in ops if not op.done} - {None}
+            if not referenced:
+                continue
+            owned = set(field.related_model.objects.filter(
+                user=self.user, pk__in=referenced
+            ).values_list('pk', flat=True))
+            if field.related_model is model:
+                owned |= {op.entity_id for op in ops if not op.done}
+            for op in ops:
+                value = op.values.get(field.attname)
+                if not op.done and value is not None and value not in owned:
+                    op.fail(f"Unknown {field.name} '{value}'")
+
+    def resolve(self, model, obj, op):
+        """Return (resolution, values to write) for an update of an existing row"""
+        if obj.updated_at <= op.client_timestamp:
+            return 'applied', op.values
+        if self.strategy == 'lww' or op.base is None:
+            return 'server_wins', {}
+
+        # Field-level merge: keep the client's value only where the server
+        # still holds what the client based its edit on
+        try:
+            base = self.coerce(model, op.base)
+        except SyncError:
+            return 'server_wins', {}
+        values = {
+            attname: value for attname, value in op.values.items()
+            if attname in base and getattr(obj, attname) == base[attname]
+        }
+        return ('merged' if values else 'server_wins'), values
+
+    def track_transaction(self, model, obj):
+        if model is Transaction:
+            self.transaction_months.add(rollup_month(obj.transaction_date))
+            self.transaction_categories.add(obj.category_id)
+
+    def after_push(self):
+        if Transaction in self.touched_models:
+            transactions_bulk_changed.send(
+                sender=Transaction, user=self.user, months=self.transaction_months,
+                category_ids=self.transaction_categories - {None}
+            )
+        elif self.touched_models:
+            FinancialDataVersion.bump(self.user.pk)
+
+    def record(self, ops):
+        SyncOperation.objects.bulk_create([
+            SyncOperation(
+                user=self.user,
+                action=op.action,
+                entity_type=op.entity_type,
+                entity_id=op.entity_id,
+                data=op.data,
+                device_id=self.device_id,
+                client_timestamp=op.client_timestamp,
+                status=op.status,
+                priority=op.priority,
+                conflict_resolution=op.resolution,
+                checksum=op.checksum,
+                error_message=op.error,
+            )
+            for op in ops
+        ], batch_size=BATCH_SIZE)
+
+    # Pull
+
+    def pull(self, cursor=None, limit=DEFAULT_PULL_LIMIT):
+        """
+        ``changes_since`` behind an opaque cursor. Paging follows the change
+        feed's sequence, so rows committed late are never skipped and
+        deletions made anywhere (REST, bulk delete, cascades, pushes) arrive
+        as tombstones. A cursor from before the feed, or one older than the
+        pruned tombstones, comes back with ``reset`` and a cursor to start
+        again from.
+        """
+        position = decode_cursor(cursor)
+        since = position.get('seq', 0)
+        if not isinstance(since, int) or since < 0:
+            raise SyncError('Invalid cursor')
+
+        if position and 'seq' not in position:
+            page = {'changes': {}, 'deleted': [], 'cursor': 0, 'has_more': True, 'reset': True}
+        else:
+            page = changes_since(self.user, since, limit)
+        page['cursor'] = encode_cursor({'seq': page['cursor']})
+        return page
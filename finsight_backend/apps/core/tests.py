@@ -1,3 +1,1337 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+import uuid
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from decimal import Decimal
+
+from .models import (
+    User, Account, Category, Transaction, Budget, Goal, TransactionMonthlyRollup, SyncOperation,
+    ChangeLogEntry, AIInsight, RecurringTransaction, FinancialHealthScore
+)
+from .services import TransactionRollupService, BudgetProgressService, ChangeFeed, FinancialDataVersion, rollup_month
+from .sync import SyncEngine, changes_since, compute_checksum, encode_cursor
+from .importing import TransactionImporter
+from .exporting import TransactionExporter
+from .recurring import RecurringScheduler
+from .detection import RecurringChargeDetector, merchant_key
+from .scoring import HealthScoreBackfill, HealthScoreEngine
+
+
+class DashboardQueryCountTests(TestCase):
+    """The dashboard must cost the same number of queries for any data size"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='dash', email='dash@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(
+            user=self.user, name='Checking', account_type='checking', balance=Decimal('1000.00')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_categories(self, count, offset=0):
+        today = timezone.now()
+        for i in range(offset, offset + count):
+            category = Category.objects.create(
+                user=self.user, name=f'Expense {i}', category_type='expense'
+            )
+            Transaction.objects.create(
+                user=self.user, account=self.account, category=category,
+                amount=Decimal('10.00'), transaction_type='debit',
+                description=f'Purchase {i}', transaction_date=today
+            )
+            Budget.objects.create(
+                user=self.user, category=category, name=f'Budget {i}',
+                amount=Decimal('100.00'), period='monthly',
+                start_date=today.date() - timedelta(days=1),
+                end_date=today.date() + timedelta(days=30)
+            )
+            Goal.objects.create(
+                user=self.user, name=f'Goal {i}', goal_type='savings',
+                target_amount=Decimal('500.00'),
+                target_date=today.date() + timedelta(days=90)
+            )
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.add_categories(3)
+        _, small = self.dashboard_queries()
+
+        self.add_categories(50, offset=3)
+        response, large = self.dashboard_queries()
+
+        self.assertEqual(small, large)
+        # Includes rescoring financial health after the data changed
+        self.assertLessEqual(large, 12)
+        self.assertEqual(len(response.data['category_spending']), 53)
+
+        # Unchanged data: the persisted score is read back as it is
+        _, unchanged = self.dashboard_queries()
+        self.assertLessEqual(unchanged, large - 4)
+
+    def test_totals_and_budget_progress(self):
+        self.add_categories(2)
+        salary = Category.objects.create(user=self.user, name='Salary', category_type='income')
+        Transaction.objects.create(
+            user=self.user, account=self.account, category=salary,
+            amount=Decimal('200.00'), transaction_type='credit',
+            description='Payroll', transaction_date=timezone.now()
+        )
+
+        response, _ = self.dashboard_queries()
+
+        self.assertEqual(response.data['monthly_income'], Decimal('200.00'))
+        self.assertEqual(response.data['monthly_expenses'], Decimal('20.00'))
+        self.assertEqual(response.data['savings_rate'], Decimal('90'))
+        self.assertEqual(response.data['category_spending']['Expense 0'], 10.0)
+        budget = response.data['active_budgets'][0]
+        self.assertEqual(budget['spent_amount'], Decimal('10.00'))
+        self.assertEqual(budget['remaining_amount'], Decimal('90.00'))
+
+
+class TransactionRollupTests(TestCase):
+    """Incremental rollup maintenance must match a full rebuild"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='rollup', email='rollup@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.food = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        self.fuel = Category.objects.create(user=self.user, name='Fuel', category_type='expense')
+
+    def add(self, amount, category, when=None):
+        return Transaction.objects.create(
+            user=self.user, account=self.account, category=category,
+            amount=Decimal(amount), transaction_type='debit',
+            description='Purchase', transaction_date=when or timezone.now()
+        )
+
+    def snapshot(self):
+        return sorted(
+            TransactionMonthlyRollup.objects.filter(user=self.user).values_list(
+                'category_id', 'month', 'transaction_type',
+                'total_amount', 'transaction_count', 'min_amount', 'max_amount'
+            ),
+            key=str
+        )
+
+    def test_incremental_matches_rebuild(self):
+        first = self.add('10.00', self.food)
+        self.add('25.50', self.food)
+        moved = self.add('5.00', self.fuel)
+        self.add('40.00', self.food, when=timezone.now() - timedelta(days=45))
+
+        moved.category = self.food
+        moved.amount = Decimal('7.00')
+        moved.save()
+        first.delete()
+
+        incremental = self.snapshot()
+        TransactionMonthlyRollup.objects.all().delete()
+        TransactionRollupService.rebuild(user=self.user)
+        self.assertEqual(incremental, self.snapshot())
+
+        bucket = TransactionMonthlyRollup.objects.get(
+            category=self.food, month=rollup_month(timezone.now())
+        )
+        self.assertEqual(bucket.total_amount, Decimal('32.50'))
+        self.assertEqual(bucket.transaction_count, 2)
+        self.assertEqual(bucket.min_amount, Decimal('7.00'))
+        self.assertEqual(bucket.max_amount, Decimal('25.50'))
+        self.assertFalse(TransactionMonthlyRollup.objects.filter(category=self.fuel).exists())
+
+    def test_category_delete_refolds_transactions(self):
+        self.add('12.00', self.fuel)
+        self.fuel.delete()
+
+        bucket = TransactionMonthlyRollup.objects.get(user=self.user, category=None)
+        self.assertEqual(bucket.total_amount, Decimal('12.00'))
+
+    def test_migration_fills_rollups_from_existing_transactions(self):
+        self.add('10.00', self.food)
+        self.add('4.00', self.fuel)
+        self.add('40.00', self.food, when=timezone.now() - timedelta(days=45))
+        expected = self.snapshot()
+
+        TransactionMonthlyRollup.objects.all().delete()
+        migration = import_module('apps.core.migrations.0002_transactionmonthlyrollup')
+        migration.build_rollups(django_apps, None)
+        self.assertEqual(self.snapshot(), expected)
+
+
+class BudgetProgressTests(TestCase):
+    """Budget spend is computed per page and cached until transactions change"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='budget', email='budget@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.today = timezone.now().date()
+        self.categories = []
+        for i in range(100):
+            category = Category.objects.create(user=self.user, name=f'Expense {i}', category_type='expense')
+            Budget.objects.create(
+                user=self.user, category=category, name=f'Budget {i}',
+                amount=Decimal('100.00'), period='monthly',
+                start_date=self.today - timedelta(days=1),
+                end_date=self.today + timedelta(days=30)
+            )
+            self.categories.append(category)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def spend_queries(self, ctx):
+        return [q for q in ctx.captured_queries if '"transactions"' in q['sql']]
+
+    def test_page_of_budgets_uses_one_aggregate(self):
+        Transaction.objects.create(
+            user=self.user, account=self.account, category=self.categories[0],
+            amount=Decimal('30.00'), transaction_type='debit',
+            description='Groceries', transaction_date=timezone.now()
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/budgets/?page_size=100')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertEqual(len(self.spend_queries(ctx)), 1)
+
+        spent = {row['category']: row['spent_amount'] for row in response.data['results']}
+        self.assertEqual(spent[self.categories[0].id], Decimal('30.00'))
+
+        # A second listing is served from the cache
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/budgets/?page_size=100')
+        self.assertEqual(len(self.spend_queries(ctx)), 0)
+
+    def test_transaction_write_invalidates_only_its_category(self):
+        BudgetProgressService.spent_amounts(Budget.objects.filter(user=self.user))
+
+        Transaction.objects.create(
+            user=self.user, account=self.account, category=self.categories[1],
+            amount=Decimal('12.00'), transaction_type='debit',
+            description='Fuel', transaction_date=timezone.now()
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            spent = BudgetProgressService.spent_amounts(Budget.objects.filter(user=self.user))
+        budget = Budget.objects.get(category=self.categories[1])
+        self.assertEqual(spent[budget.pk], Decimal('12.00'))
+        recomputed = self.spend_queries(ctx)
+        self.assertEqual(len(recomputed), 1)
+        self.assertIn(str(budget.pk).replace('-', ''), recomputed[0]['sql'])
+
+
+class SyncTests(TestCase):
+    """Pushed batches are applied in bulk and pulled back by cursor"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='sync', email='sync@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.category = Category.objects.create(user=self.user, name='Coffee', category_type='expense')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def op(self, action, entity_type, entity_id, data=None, when=None, **extra):
+        data = data or {}
+        return {
+            'action': action, 'entity_type': entity_type, 'entity_id': str(entity_id),
+            'data': data, 'checksum': compute_checksum(data),
+            'client_timestamp': (when or timezone.now()).isoformat(), **extra
+        }
+
+    def transaction_data(self, i):
+        return {
+            'account': str(self.account.pk), 'category': str(self.category.pk), 'amount': '12.50', 'transaction_type': 'debit',
+            'description': f'Coffee {i}', 'transaction_date': timezone.now().isoformat(),
+        }
+
+    def push(self, operations, **payload):
+        return self.client.post('/api/sync/push/', {'operations': operations, **payload}, format='json')
+
+    def test_checksum_mismatch_is_rejected(self):
+        operation = self.op('CREATE', 'Transaction', uuid.uuid4(), self.transaction_data(0))
+        operation['data']['amount'] = '999.00'
+        response = self.push([operation])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['results'][0]['error'], 'Checksum mismatch')
+        self.assertFalse(Transaction.objects.filter(user=self.user).exists())
+
+    def test_large_push_uses_bulk_writes(self):
+        ids = [uuid.uuid4() for _ in range(2000)]
+        operations = [self.op('CREATE', 'Transaction', pk, self.transaction_data(i)) for i, pk in enumerate(ids)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.push(operations, device_id='phone')
+        self.assertEqual(response.data['applied'], 2000)
+        self.assertLess(len(ctx.captured_queries), len(operations) // 10)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2000)
+        self.assertEqual(SyncOperation.objects.filter(user=self.user, status='COMPLETED').count(), 2000)
+
+        # Rollups are rebuilt once for the whole push
+        month = rollup_month(timezone.now())
+        income, expenses = TransactionRollupService.month_totals(self.user, month)
+        self.assertEqual(expenses, Decimal('25000.00'))
+
+        later = timezone.now() + timedelta(minutes=1)
+        operations = [self.op('UPDATE', 'Transaction', pk, {'notes': 'synced'}, later) for pk in ids[:1000]]
+        operations += [self.op('DELETE', 'Transaction', pk, when=later) for pk in ids[1000:]]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.push(operations)
+        self.assertEqual(response.data['failed'], 0)
+        self.assertLess(len(ctx.captured_queries), len(operations) // 10)
+        self.assertEqual(Transaction.objects.filter(user=self.user, notes='synced').count(), 1000)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1000)
+
+    def test_repeated_operations_are_coalesced(self):
+        pk = uuid.uuid4()
+        start = timezone.now()
+        response = self.push([
+            self.op('CREATE', 'Transaction', pk, self.transaction_data(0), start),
+            self.op('UPDATE', 'Transaction', pk, {'notes': 'edited'}, start + timedelta(seconds=1)),
+        ])
+        self.assertEqual(response.data['failed'], 0)
+        self.assertEqual(Transaction.objects.get(pk=pk).notes, 'edited')
+        resolutions = sorted(result['resolution'] for result in response.data['results'])
+        self.assertEqual(resolutions, ['coalesced', 'created'])
+
+    def test_foreign_rows_and_references_are_refused(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='secret123')
+        foreign = Account.objects.create(user=other, name='Theirs', account_type='checking')
+        data = dict(self.transaction_data(0), account=str(foreign.pk))
+        response = self.push([
+            self.op('CREATE', 'Transaction', uuid.uuid4(), data),
+            self.op('UPDATE', 'Account', foreign.pk, {'name': 'Mine now'}),
+        ])
+        self.assertEqual(response.data['failed'], 2)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.name, 'Theirs')
+
+    def test_last_writer_wins_keeps_newer_server_row(self):
+        stale = timezone.now() - timedelta(hours=1)
+        response = self.push([self.op('UPDATE', 'Account', self.account.pk, {'name': 'Old edit'}, stale)])
+        self.assertEqual(response.data['results'][0]['resolution'], 'server_wins')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.name, 'Checking')
+
+    def test_merge_applies_fields_the_server_did_not_change(self):
+        stale = timezone.now() - timedelta(hours=1)
+        Account.objects.filter(pk=self.account.pk).update(name='Renamed on web', updated_at=timezone.now())
+        response = self.push([self.op(
+            'UPDATE', 'Account', self.account.pk,
+            {'name': 'Renamed on phone', 'bank_name': 'Credit Union'}, stale,
+            base={'name': 'Checking', 'bank_name': ''}
+        )], strategy='merge')
+        self.assertEqual(response.data['results'][0]['resolution'], 'merged')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.name, 'Renamed on web')
+        self.assertEqual(self.account.bank_name, 'Credit Union')
+
+    def test_pull_pages_changes_and_deletions(self):
+        engine = SyncEngine(self.user)
+        categories = [
+            Category.objects.create(user=self.user, name=f'Category {i}', category_type='expense') for i in range(5)
+        ]
+
+        # The account, Coffee and the five new categories, in write order
+        page = engine.pull(limit=4)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(len(page['changes']['Account']), 1)
+        self.assertEqual(len(page['changes']['Category']), 3)
+        rest = engine.pull(page['cursor'], limit=4)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([row['name'] for row in rest['changes']['Category']], ['Category 2', 'Category 3', 'Category 4'])
+        self.assertNotIn('Account', rest['changes'])
+
+        self.push([self.op('DELETE', 'Account', self.account.pk)])
+        response = self.client.get('/api/sync/pull/', {'cursor': rest['cursor']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], [{'entity_type': 'Account', 'entity_id': self.account.pk}])
+
+    def test_pull_sees_deletes_made_outside_sync(self):
+        account = Account.objects.create(user=self.user, name='Savings', account_type='savings')
+        transactions = [
+            Transaction.objects.create(
+                user=self.user, account=self.account, category=self.category, amount=Decimal('3.00'),
+                transaction_type='debit', description=f'Coffee {i}', transaction_date=timezone.now()
+            )
+            for i in range(3)
+        ]
+        cursor = SyncEngine(self.user).pull()['cursor']
+
+        self.assertEqual(self.client.delete(f'/api/transactions/{transactions[0].pk}/').status_code, 204)
+        self.client.post('/api/transactions/bulk-delete/', {'ids': [str(transactions[1].pk)]}, format='json')
+        self.assertEqual(self.client.delete(f'/api/accounts/{account.pk}/').status_code, 204)
+        category_id = self.category.pk
+        self.category.delete()
+
+        page = SyncEngine(self.user).pull(cursor)
+        deleted = {(row['entity_type'], row['entity_id']) for row in page['deleted']}
+        self.assertEqual(deleted, {
+            ('Transaction', transactions[0].pk), ('Transaction', transactions[1].pk),
+            ('Account', account.pk), ('Category', category_id),
+        })
+        # Losing its category updates the remaining transaction
+        self.assertEqual([row['id'] for row in page['changes']['Transaction']], [transactions[2].pk])
+
+    def test_pull_cursor_follows_sequence_not_timestamps(self):
+        cursor = SyncEngine(self.user).pull()['cursor']
+        # A row stamped earlier than rows already paged past is still delivered
+        late = Category.objects.create(user=self.user, name='Late', category_type='expense')
+        Category.objects.filter(pk=late.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        page = SyncEngine(self.user).pull(cursor)
+        self.assertEqual([row['id'] for row in page['changes']['Category']], [late.pk])
+
+    def test_pull_asks_for_resync(self):
+        legacy = encode_cursor({'Account': [timezone.now().isoformat(), str(self.account.pk)]})
+        page = SyncEngine(self.user).pull(legacy)
+        self.assertTrue(page['reset'])
+        self.assertEqual(SyncEngine(self.user).pull(page['cursor'])['changes']['Account'][0]['id'], self.account.pk)
+
+        cursor = SyncEngine(self.user).pull()['cursor']
+        Category.objects.create(user=self.user, name='Tea', category_type='expense').delete()
+        Category.objects.create(user=self.user, name='Juice', category_type='expense')
+        ChangeFeed.prune(timezone.now() + timedelta(seconds=1))
+        self.assertTrue(SyncEngine(self.user).pull(cursor)['reset'])
+
+        response = self.client.get('/api/sync/pull/', {'cursor': encode_cursor({'seq': 'x'})})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChangeFeedTests(TestCase):
+    """The change feed holds one entry per entity, ordered by sequence"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='feed', email='feed@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.category = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_transaction(self, description='Lunch'):
+        return Transaction.objects.create(
+            user=self.user, account=self.account, category=self.category,
+            amount=Decimal('9.00'), transaction_type='debit',
+            description=description, transaction_date=timezone.now()
+        )
+
+    def test_changes_since_cursor(self):
+        first = changes_since(self.user)
+        self.assertEqual(set(first['changes']), {'Account', 'Category'})
+
+        purchase = self.add_transaction()
+        self.account.name = 'Everyday'
+        self.account.save()
+        self.account.save()
+
+        response = self.client.get('/api/changes/', {'since': first['cursor']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['changes']['Account'][0]['name'], 'Everyday')
+        self.assertEqual(response.data['changes']['Transaction'][0]['id'], purchase.pk)
+        self.assertNotIn('Category', response.data['changes'])
+
+        # Repeated writes move the entity instead of adding entries
+        self.assertEqual(ChangeLogEntry.objects.filter(user=self.user).count(), 3)
+
+        quiet = changes_since(self.user, response.data['cursor'])
+        self.assertEqual(quiet['changes'], {})
+        self.assertEqual(quiet['cursor'], response.data['cursor'])
+
+    def test_deletes_leave_tombstones_and_detach_transactions(self):
+        purchase = self.add_transaction()
+        cursor = changes_since(self.user)['cursor']
+
+        category_id = self.category.pk
+        self.category.delete()
+        page = changes_since(self.user, cursor)
+        self.assertEqual(page['deleted'], [{'entity_type': 'Category', 'entity_id': category_id}])
+        self.assertIsNone(page['changes']['Transaction'][0]['category'])
+
+        purchase_id = purchase.pk
+        purchase.delete()
+        page = changes_since(self.user, page['cursor'])
+        self.assertEqual(page['deleted'], [{'entity_type': 'Transaction', 'entity_id': purchase_id}])
+
+    def test_pages_are_bounded(self):
+        for i in range(7):
+            self.add_transaction(f'Lunch {i}')
+        cursor, seen = 0, 0
+        with CaptureQueriesContext(connection) as ctx:
+            while True:
+                page = changes_since(self.user, cursor, limit=4)
+                seen += sum(len(rows) for rows in page['changes'].values())
+                cursor = page['cursor']
+                if not page['has_more']:
+                    break
+        self.assertEqual(seen, 9)
+        self.assertLessEqual(len(ctx.captured_queries), 3 * 4)
+
+    def test_bulk_sync_writes_enter_the_feed(self):
+        cursor = changes_since(self.user)['cursor']
+        engine = SyncEngine(self.user)
+        data = {
+            'account': str(self.account.pk), 'amount': '4.00', 'transaction_type': 'debit',
+            'description': 'Tea', 'transaction_date': timezone.now().isoformat(),
+        }
+        pk = uuid.uuid4()
+        engine.push([{
+            'action': 'CREATE', 'entity_type': 'Transaction', 'entity_id': str(pk), 'data': data,
+            'checksum': compute_checksum(data), 'client_timestamp': timezone.now().isoformat(),
+        }])
+        page = changes_since(self.user, cursor)
+        self.assertEqual([row['id'] for row in page['changes']['Transaction']], [pk])
+
+    def test_pruned_tombstones_force_a_reset(self):
+        purchase = self.add_transaction()
+        cursor = changes_since(self.user)['cursor']
+        purchase.delete()
+        self.add_transaction('Dinner')
+
+        self.assertEqual(ChangeFeed.prune(timezone.now() + timedelta(seconds=1)), 1)
+        self.assertTrue(changes_since(self.user, cursor)['reset'])
+        self.assertFalse(changes_since(self.user, 0)['reset'])
+
+    @override_settings(CHANGE_LOG_RETENTION_DAYS=90)
+    def test_prune_command_keeps_recent_tombstones(self):
+        old, recent = self.add_transaction('Old'), self.add_transaction('Recent')
+        cursor = changes_since(self.user)['cursor']
+        old_id, recent_id = old.pk, recent.pk
+        old.delete()
+        recent.delete()
+        ChangeLogEntry.objects.filter(entity_id=old_id).update(changed_at=timezone.now() - timedelta(days=91))
+
+        out = StringIO()
+        call_command('prune_change_log', stdout=out)
+        self.assertIn('Removed 1 tombstones older than 90 days', out.getvalue())
+        self.assertEqual(
+            list(ChangeLogEntry.objects.filter(action='delete').values_list('entity_id', flat=True)), [recent_id]
+        )
+
+        response = self.client.get('/api/changes/', {'since': cursor})
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(response.data['cursor'], 0)
+        self.assertEqual(self.client.get('/api/changes/', {'since': 0}).status_code, 200)
+
+        sync_cursor = encode_cursor({'seq': cursor})
+        self.assertEqual(self.client.get('/api/sync/pull/', {'cursor': sync_cursor}).status_code, 410)
+
+
+class TransactionKeysetPaginationTests(TestCase):
+    """Cursor pages seek on (transaction_date, id) instead of OFFSET"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='pages', email='pages@example.com', password='secret123'
+        )
+        account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        now = timezone.now()
+        # Pairs share a timestamp so ties must be broken by id
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user, account=account, amount=Decimal('1.00'), transaction_type='debit',
+                description=f'Item {i}', transaction_date=now - timedelta(hours=i // 2)
+            )
+            for i in range(45)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_walks_every_row_once_in_order(self):
+        url, seen = '/api/transactions/?cursor=&page_size=10&count=false', []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+            self.assertNotIn('COUNT(', sql)
+            self.assertNotIn('OFFSET', sql)
+            seen += response.data['results']
+            url = response.data['next']
+
+        ids = [row['id'] for row in seen]
+        self.assertEqual(len(ids), 45)
+        self.assertEqual(len(set(ids)), 45)
+        expected = Transaction.objects.filter(user=self.user).order_by('-transaction_date', '-id')
+        self.assertEqual(ids, [str(pk) for pk in expected.values_list('id', flat=True)])
+
+    def test_count_and_page_numbers_still_available(self):
+        response = self.client.get('/api/transactions/', {'cursor': '', 'page_size': 10})
+        self.assertEqual(response.data['count'], 45)
+        response = self.client.get('/api/transactions/', {'page': 2})
+        self.assertEqual(response.data['count'], 45)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(self.client.get('/api/transactions/', {'cursor': 'bogus'}).status_code, 404)
+
+
+class TransactionSearchTests(TestCase):
+    """Search goes through the full-text index and stays within the user"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='search', email='search@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.card = Account.objects.create(user=self.user, name='Card', account_type='credit')
+        self.food = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        self.now = timezone.now()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, description, amount='10.00', account=None, days_ago=0, **fields):
+        return Transaction.objects.create(
+            user=self.user, account=account or self.account, amount=Decimal(amount),
+            transaction_type='debit', description=description,
+            transaction_date=self.now - timedelta(days=days_ago), **fields
+        )
+
+    def search(self, **params):
+        response = self.client.get('/api/transactions/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_match_ranks_description_hits_first(self):
+        in_notes = self.add('Card payment', notes='starbucks reimbursement')
+        in_description = self.add('Starbucks Reserve', merchant_name='Starbucks')
+        self.add('Shell fuel')
+
+        results = self.search(q='starb')['results']
+        self.assertEqual([row['id'] for row in results], [str(in_description.pk), str(in_notes.pk)])
+
+    def test_index_follows_updates_deletes_and_users(self):
+        purchase = self.add('Corner bakery')
+        other = User.objects.create_user(username='other', email='other@example.com', password='secret123')
+        other_account = Account.objects.create(user=other, name='Checking', account_type='checking')
+        Transaction.objects.create(
+            user=other, account=other_account, amount=Decimal('3.00'), transaction_type='debit',
+            description='Corner bakery', transaction_date=self.now
+        )
+        self.assertEqual(len(self.search(q='bakery')['results']), 1)
+
+        Transaction.objects.filter(pk=purchase.pk).update(description='Corner deli')
+        self.assertEqual(self.search(q='bakery')['results'], [])
+        self.assertEqual(len(self.search(q='deli corner')['results']), 1)
+
+        purchase.delete()
+        self.assertEqual(self.search(q='deli')['results'], [])
+
+    def test_filters_and_facets(self):
+        self.add('Grocery run', amount='25.00', category=self.food)
+        self.add('Grocery run', amount='80.00', category=self.food, days_ago=40)
+        card_purchase = self.add('Grocery delivery', amount='55.00', account=self.card)
+
+        data = self.search(q='grocery', amount_min='50', account=str(self.card.pk))
+        self.assertEqual([row['id'] for row in data['results']], [str(card_purchase.pk)])
+
+        data = self.search(q='grocery', date_from=(self.now - timedelta(days=7)).date().isoformat(), facets='true')
+        self.assertEqual(len(data['results']), 2)
+        facets = data['facets']
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['amount'], {'min': Decimal('25.00'), 'max': Decimal('55.00')})
+        self.assertEqual({row['id']: row['count'] for row in facets['accounts']},
+                         {self.account.pk: 1, self.card.pk: 1})
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.add('Coffee "beans" OR tea')
+        self.assertEqual(len(self.search(q='"beans" OR (')['results']), 1)
+        self.assertEqual(self.search(q='***')['results'], [])
+
+
+OFX_STATEMENT = """OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260105120000[-5:EST]<TRNAMT>-42.10<FITID>A1<NAME>SHELL OIL 1234<MEMO>Fuel
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20260106<TRNAMT>1500.00<FITID>A2<NAME>ACME PAYROLL
+</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>garbage<TRNAMT>-1.00<FITID>A3<NAME>Broken
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+class TransactionImportTests(TestCase):
+    """Statement files are streamed in chunks and deduplicated on re-import"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='importer', email='importer@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.groceries = Category.objects.create(user=self.user, name='Groceries', category_type='expense')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, **data):
+        return self.client.post('/api/transactions/import/', {
+            'file': SimpleUploadedFile(name, content.encode()), 'account': str(self.account.pk), **data
+        }, format='multipart')
+
+    def test_csv_import_in_chunks_with_dedupe(self):
+        lines = ['Date,Description,Amount,Category']
+        for i in range(250):
+            lines.append(f'2026-01-{i % 28 + 1:02d},Store {i % 7},-{i % 50 + 1}.25,Groceries')
+        lines.append('2026-01-03,Store 3,-4.25,Groceries')  # Same as an earlier row: a second purchase
+        lines.append('not a date,Oops,-1.00,')
+        lines.append('2026-01-05,,-3.00,')
+        content = '\n'.join(lines) + '\n'
+
+        importer = TransactionImporter(self.user, self.account, chunk_size=40)
+        with CaptureQueriesContext(connection) as ctx:
+            report = importer.run(BytesIO(content.encode()), 'csv')
+        self.assertEqual(report['status'], 'completed')
+        self.assertEqual(report['processed'], 253)
+        self.assertEqual(report['imported'], 251)
+        self.assertEqual(report['failed'], 2)
+        self.assertEqual([error['line'] for error in report['errors']], [253, 254])
+        self.assertLess(len(ctx.captured_queries), 80)
+
+        rows = Transaction.objects.filter(account=self.account)
+        self.assertEqual(rows.count(), 251)
+        self.assertEqual(rows.filter(category=self.groceries, transaction_type='debit').count(), 251)
+        income, expenses = TransactionRollupService.month_totals(self.user, rollup_month(rows.first().transaction_date))
+        self.assertGreater(expenses, Decimal('0'))
+
+        again = self.upload('statement.csv', content).data
+        self.assertEqual(again['imported'], 0)
+        self.assertEqual(again['duplicates'], 251)
+        progress = self.client.get(f"/api/transactions/import/{again['job_id']}/").data
+        self.assertEqual(progress['status'], 'completed')
+
+    def test_ofx_import(self):
+        report = self.upload('statement.qfx', OFX_STATEMENT).data
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(report['failed'], 1)
+        fuel = Transaction.objects.get(account=self.account, external_id='A1')
+        self.assertEqual(fuel.amount, Decimal('42.10'))
+        self.assertEqual(fuel.transaction_type, 'debit')
+        self.assertEqual(fuel.notes, 'Fuel')
+        self.assertEqual(fuel.transaction_date.isoformat(), '2026-01-05T17:00:00+00:00')
+        payroll = Transaction.objects.get(account=self.account, external_id='A2')
+        self.assertEqual(payroll.transaction_type, 'credit')
+
+        # Bank ids already present are skipped even without a fingerprint
+        Transaction.objects.filter(external_id='A1').update(import_fingerprint='')
+        self.assertEqual(self.upload('statement.ofx', OFX_STATEMENT).data['duplicates'], 2)
+
+    def test_rejects_unknown_layouts(self):
+        self.assertEqual(self.upload('statement.csv', 'Foo,Bar\n1,2\n').status_code, 400)
+        self.assertEqual(self.upload('statement.pdf', 'x').status_code, 400)
+
+
+class InlineThread:
+    """Runs a background job as soon as it is started, inside the test transaction"""
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+class TransactionExportTests(TestCase):
+    """Exports stream rows in blocks and run large files as background jobs"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='exporter', email='exporter@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.savings = Account.objects.create(user=self.user, name='Savings', account_type='savings')
+        self.groceries = Category.objects.create(user=self.user, name='Groceries', category_type='expense')
+        start = timezone.now() - timedelta(days=30)
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user, account=self.account if i % 4 else self.savings,
+                category=self.groceries if i % 2 else None,
+                amount=Decimal(f'{i}.50'), transaction_type='debit',
+                description=f'Purchase, "{i}"', transaction_date=start + timedelta(hours=i)
+            )
+            for i in range(1200)
+        ])
+        other = User.objects.create_user(username='other', email='other@example.com', password='secret123')
+        other_account = Account.objects.create(user=other, name='Other', account_type='checking')
+        Transaction.objects.create(
+            user=other, account=other_account, amount=Decimal('1.00'), transaction_type='debit',
+            description='Not mine', transaction_date=start
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_csv_streams_every_row_in_order(self):
+        response = self.client.get('/api/transactions/export/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+
+        chunks = iter(response.streaming_content)
+        self.assertTrue(next(chunks).startswith(b'id,date,amount,type,description'))
+        rows = list(csv.reader(b''.join(chunks).decode().splitlines()))
+        self.assertEqual(len(rows), 1200)
+        self.assertEqual(rows[0][4], 'Purchase, "0"')
+        self.assertEqual(rows[1][2], '1.50')
+        self.assertEqual(rows[1][6], 'Groceries')
+        self.assertEqual(rows[0][7], 'Savings')
+
+    def test_jsonl_with_filters(self):
+        response = self.client.get('/api/transactions/export/', {
+            'export_format': 'jsonl', 'account': str(self.savings.pk),
+        })
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 300)
+        self.assertEqual(records[0]['amount'], '0.50')
+        self.assertIs(records[0]['pending'], False)
+        self.assertIsNone(records[0]['category'])
+
+    def test_stream_reads_in_chunks(self):
+        exporter = TransactionExporter(self.user, chunk_size=100)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(sum(chunk.count('\n') for chunk in exporter.stream('csv')), 1201)
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+
+    def test_rejects_unknown_formats(self):
+        self.assertEqual(self.client.get('/api/transactions/export/', {'export_format': 'xls'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/transactions/export/', {'export_format': 'csv'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/transactions/export/missing/').status_code, 404)
+
+    def test_parquet_job(self):
+        import pyarrow.parquet as pq
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            exporter = TransactionExporter(self.user, chunk_size=500)
+            report = exporter.run_job('parquet')
+            self.assertEqual(report['status'], 'completed')
+            self.assertEqual(report['exported'], 1200)
+            table = pq.read_table(f"{media}/{report['file']}")
+            self.assertEqual(table.num_rows, 1200)
+            self.assertEqual(table.column('amount')[3].as_py(), Decimal('3.50'))
+            progress = self.client.get(f"/api/transactions/export/{exporter.job_id}/").data
+            self.assertTrue(progress['url'].endswith('.parquet'))
+
+    def test_parquet_job_endpoint(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                mock.patch('apps.core.exporting.threading.Thread', InlineThread), \
+                mock.patch('apps.core.exporting.connection.close'):
+            response = self.client.post('/api/transactions/export/', {'export_format': 'parquet'}, format='json')
+            self.assertEqual(response.status_code, 202)
+            progress = self.client.get(f"/api/transactions/export/{response.data['job_id']}/").data
+            self.assertEqual(progress['status'], 'completed')
+            self.assertEqual(progress['exported'], 1200)
+
+    def test_failed_job_is_logged_and_reported(self):
+        with mock.patch('apps.core.exporting.threading.Thread', InlineThread), \
+                mock.patch('apps.core.exporting.connection.close'), \
+                mock.patch.object(TransactionExporter, 'write_parquet', side_effect=OSError('disk full')), \
+                self.assertLogs('apps.core.exporting', 'ERROR'):
+            exporter = TransactionExporter(self.user)
+            exporter.start_job('parquet')
+        progress = TransactionExporter.get_progress(self.user.pk, exporter.job_id)
+        self.assertEqual(progress['status'], 'failed')
+        self.assertEqual(progress['error'], 'disk full')
+
+
+class TransactionBulkEditTests(TestCase):
+    """Bulk edits are one statement and keep rollups and the feed in step"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='bulk', email='bulk@example.com', password='secret123'
+        )
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.food = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        self.coffee = Category.objects.create(user=self.user, name='Coffee', category_type='expense')
+        march = timezone.make_aware(datetime(2026, 3, 1, 12))
+        april = timezone.make_aware(datetime(2026, 4, 1, 12))
+        for i in range(40):
+            Transaction.objects.create(
+                user=self.user, account=self.account, category=self.food, amount=Decimal('4.50'),
+                transaction_type='debit', description='Card purchase',
+                merchant_name='Starbucks' if i % 2 else 'Deli', ai_categorized=True, confidence_score=0.6,
+                transaction_date=(march if i < 30 else april) + timedelta(days=i % 28)
+            )
+        other = User.objects.create_user(username='other', email='other@example.com', password='secret123')
+        other_account = Account.objects.create(user=other, name='Other', account_type='checking')
+        self.foreign = Transaction.objects.create(
+            user=other, account=other_account, amount=Decimal('4.50'), transaction_type='debit',
+            description='Card purchase', merchant_name='Starbucks', transaction_date=march
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def rollups(self):
+        return sorted(TransactionMonthlyRollup.objects.filter(user=self.user).values_list(
+            'category_id', 'month', 'total_amount', 'transaction_count'
+        ), key=str)
+
+    def test_filter_update_is_one_statement(self):
+        cursor = changes_since(self.user)['cursor']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/transactions/bulk-update/', {
+                'filter': {'text': 'starbucks', 'date_from': '2026-03-01', 'date_to': '2026-03-31'},
+                'changes': {'category': str(self.coffee.pk), 'notes': 'Coffee run'},
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'matched': 15, 'updated': 15})
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "transactions"')]
+        self.assertEqual(len(updates), 1)
+
+        moved = Transaction.objects.filter(user=self.user, category=self.coffee)
+        self.assertEqual(moved.count(), 15)
+        self.assertFalse(moved.filter(ai_categorized=True).exists())
+        self.assertEqual(set(moved.values_list('notes', flat=True)), {'Coffee run'})
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.notes, '')
+
+        incremental = self.rollups()
+        TransactionRollupService.rebuild(user=self.user)
+        self.assertEqual(incremental, self.rollups())
+        self.assertEqual(len(changes_since(self.user, cursor)['changes']['Transaction']), 15)
+
+    def test_delete_by_ids(self):
+        doomed = list(Transaction.objects.filter(user=self.user, merchant_name='Deli').values_list('id', flat=True))
+        insight = AIInsight.objects.create(
+            user=self.user, insight_type='spending_pattern', title='Deli', content='...', confidence_score=0.9
+        )
+        insight.related_transactions.set(doomed[:3])
+        cursor = changes_since(self.user)['cursor']
+
+        response = self.client.post('/api/transactions/bulk-delete/', {
+            'ids': [str(pk) for pk in doomed] + [str(self.foreign.pk)],
+        }, format='json')
+        self.assertEqual(response.data, {'matched': 20, 'deleted': 20})
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 20)
+        self.assertTrue(Transaction.objects.filter(pk=self.foreign.pk).exists())
+        self.assertEqual(insight.related_transactions.count(), 0)
+
+        incremental = self.rollups()
+        TransactionRollupService.rebuild(user=self.user)
+        self.assertEqual(incremental, self.rollups())
+        self.assertEqual(len(changes_since(self.user, cursor)['deleted']), 20)
+
+    def test_invalid_requests(self):
+        def update(body):
+            return self.client.post('/api/transactions/bulk-update/', body, format='json').status_code
+
+        self.assertEqual(update({'changes': {'notes': 'x'}}), 400)
+        self.assertEqual(update({'filter': {'merchant': 'x'}, 'changes': {'notes': 'x'}}), 400)
+        self.assertEqual(update({'filter': {'text': 'deli'}, 'changes': {'amount': '1.00'}}), 400)
+        self.assertEqual(update({'filter': {'text': 'deli'}, 'changes': {'transaction_type': 'gift'}}), 400)
+        self.assertEqual(update({'filter': {'text': 'deli'}, 'changes': {'category': str(uuid.uuid4())}}), 400)
+        self.assertEqual(self.client.post('/api/transactions/bulk-delete/', {}, format='json').status_code, 400)
+        self.assertEqual(Transaction.objects.filter(user=self.user, notes='x').count(), 0)
+
+
+class RecurringSchedulerTests(TestCase):
+    """Missed occurrences are generated in batches with a fixed query count"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(
+                username=f'recurring{i}', email=f'recurring{i}@example.com', password='secret123'
+            )
+            account = Account.objects.create(user=user, name='Checking', account_type='checking')
+            category = Category.objects.create(user=user, name='Bills', category_type='expense')
+            self.users.append((user, account, category))
+
+    def template(self, user, account, category, frequency, start, **extra):
+        return RecurringTransaction.objects.create(
+            user=user, account=account, category=category, name=frequency, amount=Decimal('10.00'),
+            transaction_type='debit', description=f'{frequency} charge', frequency=frequency,
+            start_date=start, next_due_date=extra.pop('next_due_date', start), **extra
+        )
+
+    def test_catch_up_in_fixed_queries(self):
+        today = timezone.localdate()
+        for user, account, category in self.users:
+            for i in range(10):
+                self.template(user, account, category, 'daily', today - timedelta(days=29))
+        with CaptureQueriesContext(connection) as ctx:
+            report = RecurringScheduler(today=today, batch_size=100).run()
+        self.assertEqual(report, {'templates': 30, 'created': 900, 'batches': 1})
+        self.assertLess(len(ctx.captured_queries), 25)
+
+        user, account, category = self.users[0]
+        self.assertEqual(Transaction.objects.filter(user=user, is_recurring=True).count(), 300)
+        self.assertFalse(RecurringTransaction.objects.filter(next_due_date__lte=today).exists())
+        self.assertEqual(len(changes_since(user)['changes']['Transaction']), 300)
+
+        incremental = sorted(TransactionMonthlyRollup.objects.values_list(
+            'user_id', 'category_id', 'month', 'total_amount', 'transaction_count'), key=str)
+        TransactionRollupService.rebuild()
+        self.assertEqual(incremental, sorted(TransactionMonthlyRollup.objects.values_list(
+            'user_id', 'category_id', 'month', 'total_amount', 'transaction_count'), key=str))
+
+        # Running again owes nothing
+        self.assertEqual(RecurringScheduler(today=today).run()['created'], 0)
+
+    def test_month_end_schedules_and_end_date(self):
+        user, account, category = self.users[0]
+        monthly = self.template(user, account, category, 'monthly', datetime(2026, 1, 31).date())
+        quarterly = self.template(
+            user, account, category, 'quarterly', datetime(2026, 1, 15).date(), end_date=datetime(2026, 6, 1).date()
+        )
+        RecurringScheduler(today=datetime(2026, 7, 1).date()).run()
+
+        days = sorted(
+            timezone.localtime(moment).date().isoformat() for moment in
+            Transaction.objects.filter(description='monthly charge').values_list('transaction_date', flat=True)
+        )
+        self.assertEqual(days, ['2026-01-31', '2026-02-28', '2026-03-31', '2026-04-30', '2026-05-31', '2026-06-30'])
+        monthly.refresh_from_db()
+        self.assertEqual(monthly.next_due_date.isoformat(), '2026-07-31')
+
+        quarterly.refresh_from_db()
+        self.assertEqual(Transaction.objects.filter(description='quarterly charge').count(), 2)
+        self.assertFalse(quarterly.is_active)
+
+    def test_command_and_endpoint(self):
+        user, account, category = self.users[0]
+        self.template(user, account, category, 'weekly', timezone.localdate() - timedelta(days=14))
+        other, other_account, other_category = self.users[1]
+        self.template(other, other_account, other_category, 'weekly', timezone.localdate())
+
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.post('/api/recurring/process/').data['created'], 3)
+        self.assertFalse(Transaction.objects.filter(user=other).exists())
+
+        call_command('process_recurring_transactions', stdout=StringIO())
+        self.assertEqual(Transaction.objects.filter(user=other).count(), 1)
+
+    def test_templates_only_accept_own_account_and_category(self):
+        user, account, category = self.users[0]
+        other, other_account, other_category = self.users[1]
+        client = APIClient()
+        client.force_authenticate(user)
+        payload = {
+            'account': str(account.id), 'category': str(category.id), 'name': 'Gym', 'description': 'Gym', 'amount': '30.00',
+            'transaction_type': 'debit', 'frequency': 'monthly', 'start_date': '2026-01-01',
+        }
+
+        response = client.post('/api/recurring-transactions/', {**payload, 'account': str(other_account.id)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('account', response.data)
+        response = client.post('/api/recurring-transactions/', {**payload, 'category': str(other_category.id)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.data)
+        self.assertFalse(RecurringTransaction.objects.exists())
+
+        self.assertEqual(client.post('/api/recurring-transactions/', payload, format='json').status_code, 201)
+        template = RecurringTransaction.objects.get()
+        response = client.patch(
+            f'/api/recurring-transactions/{template.id}/', {'account': str(other_account.id)}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class RecurringDetectionTests(TestCase):
+    """Periodic charges are found per merchant and kept up to date incrementally"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='detect', email='detect@example.com', password='secret123')
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.category = Category.objects.create(user=self.user, name='Streaming', category_type='expense')
+        self.today = timezone.localdate()
+
+    def charge(self, merchant, amount, days_ago):
+        moment = timezone.now() - timedelta(days=days_ago)
+        return Transaction.objects.create(
+            user=self.user, account=self.account, category=self.category, amount=Decimal(amount),
+            transaction_type='debit', description=f'POS {merchant}', merchant_name=merchant,
+            transaction_date=moment
+        )
+
+    def test_merchant_key_drops_billing_noise(self):
+        self.assertEqual(merchant_key('NETFLIX.COM #4821', ''), 'netflix')
+        self.assertEqual(merchant_key('', 'POS PURCHASE Spotify 1123'), 'spotify')
+
+    def test_detects_monthly_charges(self):
+        for month in range(6):
+            self.charge(f'NETFLIX.COM #{100 + month}', '15.49', 5 + month * 30)
+        # Irregular purchases at one shop are not a subscription
+        for days_ago, amount in ((2, '12.00'), (9, '87.50'), (51, '5.25'), (140, '43.10')):
+            self.charge('Corner Market', amount, days_ago)
+
+        report = RecurringChargeDetector(self.user, today=self.today).run()
+        self.assertEqual(report['detected'], 1)
+        self.assertEqual(report['flagged'], 6)
+
+        template = RecurringTransaction.objects.get(user=self.user, source='detected')
+        self.assertEqual(template.merchant_key, 'netflix')
+        self.assertEqual(template.frequency, 'monthly')
+        self.assertEqual(template.occurrence_count, 6)
+        self.assertGreater(template.confidence_score, 0.9)
+        self.assertFalse(template.is_active)
+        self.assertFalse(Transaction.objects.filter(merchant_name='Corner Market', is_recurring=True).exists())
+
+        # Detected templates are never generated from until confirmed
+        self.assertEqual(RecurringScheduler(today=self.today + timedelta(days=60)).run()['created'], 0)
+
+    def test_runs_incrementally(self):
+        for month in range(4):
+            self.charge('Spotify', '9.99', 30 + month * 30)
+        detector = RecurringChargeDetector(self.user, today=self.today)
+        self.assertEqual(detector.run()['created'], 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            report = detector.run()
+        self.assertEqual(report['analyzed'], 0)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        self.charge('SPOTIFY', '9.99', 0)
+        report = detector.run()
+        self.assertEqual((report['created'], report['updated'], report['flagged']), (0, 1, 1))
+        template = RecurringTransaction.objects.get(user=self.user, source='detected')
+        self.assertEqual(template.occurrence_count, 5)
+        self.assertEqual(template.last_occurrence, self.today)
+
+    def test_confirmed_templates_keep_user_edits(self):
+        for month in range(4):
+            self.charge('Spotify', '9.99', 30 + month * 30)
+        detector = RecurringChargeDetector(self.user, today=self.today)
+        detector.run()
+
+        savings = Account.objects.create(user=self.user, name='Savings', account_type='savings')
+        template = RecurringTransaction.objects.get(user=self.user, source='detected')
+        template.is_active = True
+        template.name = 'Music'
+        template.amount = Decimal('10.99')
+        template.account = savings
+        template.next_due_date = self.today + timedelta(days=3)
+        template.save()
+
+        self.charge('SPOTIFY', '9.99', 0)
+        self.assertEqual(detector.run()['updated'], 1)
+        template.refresh_from_db()
+        self.assertEqual(
+            (template.name, template.amount, template.account_id, template.next_due_date),
+            ('Music', Decimal('10.99'), savings.pk, self.today + timedelta(days=3))
+        )
+        self.assertEqual(template.occurrence_count, 5)
+        self.assertEqual(template.last_occurrence, self.today)
+
+    def test_endpoint_and_command(self):
+        for month in range(4):
+            self.charge('Gym Membership', '40.00', 3 + month * 30)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.post('/api/recurring/detect/', {'full': True}, format='json').data['detected'], 1)
+
+        RecurringTransaction.objects.filter(source='detected').delete()
+        call_command('detect_recurring_transactions', '--full', stdout=StringIO())
+        self.assertTrue(RecurringTransaction.objects.filter(user=self.user, merchant_key='gym membership').exists())
+
+
+class HealthScoreEngineTests(TestCase):
+    """Health scores for many users come from a fixed set of queries"""
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.saver = User.objects.create_user(username='saver', email='saver@example.com', password='secret123')
+        checking = Account.objects.create(
+            user=self.saver, name='Checking', account_type='checking', balance=Decimal('4000.00')
+        )
+        Account.objects.create(user=self.saver, name='Savings', account_type='savings', balance=Decimal('20000.00'))
+        Account.objects.create(user=self.saver, name='Brokerage', account_type='investment', balance=Decimal('9000.00'))
+        Account.objects.create(
+            user=self.saver, name='Card', account_type='credit', balance=Decimal('250.00'),
+            credit_limit=Decimal('5000.00')
+        )
+        salary = Category.objects.create(user=self.saver, name='Salary', category_type='income')
+        rent = Category.objects.create(user=self.saver, name='Rent', category_type='expense')
+        Transaction.objects.create(
+            user=self.saver, account=checking, category=salary, amount=Decimal('5000.00'),
+            transaction_type='credit', description='Payroll', transaction_date=now
+        )
+        Transaction.objects.create(
+            user=self.saver, account=checking, category=rent, amount=Decimal('3000.00'),
+            transaction_type='debit', description='Rent', transaction_date=now
+        )
+        Budget.objects.create(
+            user=self.saver, category=rent, name='Rent', amount=Decimal('3200.00'), period='monthly',
+            start_date=now.date() - timedelta(days=1), end_date=now.date() + timedelta(days=30)
+        )
+
+        self.borrower = User.objects.create_user(
+            username='borrower', email='borrower@example.com', password='secret123'
+        )
+        card = Account.objects.create(
+            user=self.borrower, name='Card', account_type='credit', balance=Decimal('4500.00'),
+            credit_limit=Decimal('5000.00')
+        )
+        Account.objects.create(user=self.borrower, name='Loan', account_type='loan', balance=Decimal('20000.00'))
+        shopping = Category.objects.create(user=self.borrower, name='Shopping', category_type='expense')
+        Transaction.objects.create(
+            user=self.borrower, account=card, category=shopping, amount=Decimal('1200.00'),
+            transaction_type='debit', description='Shopping', transaction_date=now
+        )
+
+    def test_components_for_a_batch(self):
+        for i in range(20):
+            User.objects.create_user(username=f'idle{i}', email=f'idle{i}@example.com', password='secret123')
+        with CaptureQueriesContext(connection) as ctx:
+            report = HealthScoreEngine().run(batch_size=50)
+        self.assertEqual(report, {'users': 22, 'batches': 1})
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+
+        saver = FinancialHealthScore.objects.get(user=self.saver)
+        self.assertEqual(saver.savings_rate, 40.0)
+        self.assertEqual(saver.savings_rate_score, 100)
+        self.assertEqual(saver.emergency_fund_months, 8.0)
+        self.assertEqual(saver.emergency_fund_score, 100)
+        self.assertEqual(saver.credit_utilization_ratio, 0.05)
+        self.assertEqual(saver.budget_adherence_score, 100)
+        self.assertEqual(saver.investment_diversity_score, 75)
+        self.assertGreaterEqual(saver.overall_score, 90)
+        self.assertEqual(saver.grade, 'A+')
+
+        borrower = FinancialHealthScore.objects.get(user=self.borrower)
+        self.assertEqual(borrower.savings_rate_score, 0)
+        self.assertEqual(borrower.debt_to_income_score, 0)
+        self.assertEqual(borrower.credit_utilization_ratio, 0.9)
+        self.assertEqual(borrower.credit_utilization_score, 0)
+        self.assertEqual(borrower.grade, 'F')
+
+    def test_current_reuses_the_persisted_score(self):
+        engine = HealthScoreEngine()
+        first = engine.current(self.saver)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(engine.current(self.saver).pk, first.pk)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # A data change rescores today's row in place
+        Account.objects.filter(user=self.saver, account_type='savings').update(balance=Decimal('0.00'))
+        FinancialDataVersion.bump(self.saver.pk)
+        rescored = engine.current(self.saver)
+        self.assertEqual(rescored.pk, first.pk)
+        self.assertEqual(rescored.emergency_fund_months, 1.33)
+        self.assertEqual(FinancialHealthScore.objects.filter(user=self.saver).count(), 1)
+
+        client = APIClient()
+        client.force_authenticate(self.saver)
+        response = client.get('/api/dashboard/')
+        self.assertEqual(response.data['financial_health_score'], rescored.overall_score)
+        self.assertEqual(response.data['health_grade'], rescored.grade)
+
+    def test_command(self):
+        call_command('calculate_health_scores', '--user', 'borrower@example.com', stdout=StringIO())
+        self.assertEqual(FinancialHealthScore.objects.filter(user=self.borrower).count(), 1)
+        self.assertFalse(FinancialHealthScore.objects.filter(user=self.saver).exists())
+
+
+class HealthScoreBackfillTests(TestCase):
+    """Month-end scores are replayed from history in one pass per batch"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='history', email='history@example.com', password='secret123')
+        self.account = Account.objects.create(
+            user=self.user, name='Checking', account_type='checking', balance=Decimal('3000.00')
+        )
+        salary = Category.objects.create(user=self.user, name='Salary', category_type='income')
+        groceries = Category.objects.create(user=self.user, name='Groceries', category_type='expense')
+        for month, spent in ((7, '1000.00'), (8, '3500.00'), (9, '5000.00')):
+            for category, amount, kind in ((salary, '4000.00', 'credit'), (groceries, spent, 'debit')):
+                Transaction.objects.create(
+                    user=self.user, account=self.account, category=category, amount=Decimal(amount),
+                    transaction_type=kind, description=category.name,
+                    transaction_date=timezone.make_aware(datetime(2026, month, 10, 12))
+                )
+        Budget.objects.create(
+            user=self.user, category=groceries, name='Groceries', amount=Decimal('4000.00'), period='monthly',
+            start_date=datetime(2026, 8, 1).date(), end_date=datetime(2026, 9, 30).date()
+        )
+        self.today = datetime(2026, 10, 17).date()
+
+    def scores(self):
+        return list(FinancialHealthScore.objects.filter(user=self.user).order_by('calculated_at'))
+
+    def test_replays_month_ends(self):
+        for i in range(10):
+            User.objects.create_user(username=f'quiet{i}', email=f'quiet{i}@example.com', password='secret123')
+        with CaptureQueriesContext(connection) as ctx:
+            report = HealthScoreBackfill(months=3, today=self.today).run()
+        self.assertEqual(report, {'users': 11, 'scores': 33, 'batches': 1})
+        self.assertLessEqual(len(ctx.captured_queries), 9)
+
+        july, august, september = self.scores()
+        self.assertEqual([score.calculation_data['as_of'] for score in (july, august, september)],
+                         ['2026-07-31', '2026-08-31', '2026-09-30'])
+        self.assertEqual([score.savings_rate for score in (july, august, september)], [75.0, 43.75, 20.83])
+        # Balances are today's less the flows booked after each month end
+        self.assertEqual([score.emergency_fund_months for score in (july, august, september)], [3.5, 1.78, 0.95])
+        self.assertEqual([score.budget_adherence_score for score in (july, august, september)], [50, 100, 0])
+
+        # A rerun replaces the backfilled rows
+        HealthScoreBackfill(months=3, today=self.today).run([self.user])
+        self.assertEqual(len(self.scores()), 3)
+
+    def test_short_backfill_keeps_older_history(self):
+        HealthScoreBackfill(months=12, today=self.today).run([self.user])
+        self.assertEqual(len(self.scores()), 12)
+
+        # A month later the dashboard misses the newest month-end and backfills three months
+        engine = HealthScoreEngine(timezone.make_aware(datetime(2026, 11, 17, 12)))
+        history = engine.history(self.user, months=3)
+        self.assertEqual([point['month'] for point in history], ['2026-08', '2026-09', '2026-10'])
+
+        scores = self.scores()
+        self.assertEqual(len(scores), 13)
+        self.assertEqual(scores[0].calculation_data['as_of'], '2025-10-31')
+        self.assertEqual(len({score.calculation_data['as_of'] for score in scores}), 13)
+
+    def test_history_and_forecast_read_stored_points(self):
+        engine = HealthScoreEngine(timezone.make_aware(datetime(2026, 10, 17, 12)))
+        history = engine.history(self.user, months=3)
+        self.assertEqual([point['month'] for point in history], ['2026-07', '2026-08', '2026-09'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(engine.history(self.user, months=3), history)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/analytics/financial-health-forecast/')
+        self.assertEqual(len(response.data['history']), 3)
+
+        # A shorter rerun rewrites its own months and keeps July
+        call_command('backfill_health_scores', '--months', '2', stdout=StringIO())
+        self.assertEqual(FinancialHealthScore.objects.filter(user=self.user, calculation_data__backfill=True).count(), 3)
@@ -8,6 +8,7 @@ router.register(r'users', views.UserViewSet, basename='user')
 router.register(r'accounts', views.AccountViewSet, basename='account')
 router.register(r'transactions', views.TransactionViewSet, basename='transaction')
 router.register(r'categories', views.CategoryViewSet, basename='category')
+router.register(r'recurring-transactions', views.RecurringTransactionViewSet, basename='recurring-transaction')
 router.register(r'budgets', views.BudgetViewSet, basename='budget')
 router.register(r'goals', views.GoalViewSet, basename='goal')
 
@@ -22,6 +23,24 @@ urlpatterns = [
     # Dashboard
     path('dashboard/', views.dashboard, name='dashboard'),
     
+    # Offline sync
+    path('sync/push/', views.sync_push, name='sync_push'),
+    path('sync/pull/', views.sync_pull, name='sync_pull'),
+    path('changes/', views.changes, name='changes'),
+    
+    # Search, import, export and bulk edits (ahead of the router so they are not read as transaction ids)
+    path('transactions/search/', views.transaction_search, name='transaction_search'),
+    path('transactions/import/', views.transaction_import, name='transaction_import'),
+    path('transactions/import/<str:job_id>/', views.transaction_import_progress, name='transaction_import_progress'),
+    path('transactions/export/', views.transaction_export, name='transaction_export'),
+    path('transactions/export/<str:job_id>/', views.transaction_export_progress, name='transaction_export_progress'),
+    path('transactions/bulk-update/', views.transaction_bulk_update, name='transaction_bulk_update'),
+    path('transactions/bulk-delete/', views.transaction_bulk_delete, name='transaction_bulk_delete'),
+    
+    # Recurring transactions
+    path('recurring/process/', views.process_recurring_transactions, name='process_recurring'),
+    path('recurring/detect/', views.detect_recurring_transactions, name='detect_recurring'),
+    
     # API routes
     path('', include(router.urls)),
 ]
@@ -1,24 +1,110 @@
 # Core API Views - Complete Implementation
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 from django.contrib.auth import login, logout
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
 from django.db.models import Q, Sum, Count, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta, date
 from decimal import Decimal
+from django.utils.dateparse import parse_date, parse_datetime
+from decimal import InvalidOperation
+import base64
 import json
+import uuid
 
-from .models import User, Account, Category, Transaction, Budget, Goal, FinancialHealthScore, AIInsight, SyncOperation
+from .models import (
+    User, Account, Category, Transaction, RecurringTransaction, Budget, Goal, FinancialHealthScore, AIInsight,
+    SyncOperation
+)
 from .serializers import *
+from .services import DashboardEngine
+from .scoring import HealthScoreEngine
+from .sync import SyncEngine, SyncError, changes_since
+from .search import TransactionSearch
+from .importing import TransactionImporter, ImportFormatError, detect_format
+from .exporting import TransactionExporter, ExportFormatError, STREAM_FORMATS
+from .bulk import TransactionBulkEditor, BulkEditError
+from .recurring import RecurringScheduler
+from .detection import RecurringChargeDetector
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class TransactionPagination(StandardResultsSetPagination):
+    """
+    Page numbers by default; keyset pages on (transaction_date, id) when the
+    request has ``cursor`` (empty for the first page). Keyset pages seek
+    through the (user, transaction_date) index, so any depth costs the same.
+    ``count=false`` skips the total count.
+    """
+    cursor_query_param = 'cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        
+        self.request = request
+        self.count = None
+        if request.query_params.get('count', 'true').lower() != 'false':
+            self.count = queryset.count()
+        
+        position = self.decode_cursor(request.query_params[self.cursor_query_param])
+        queryset = queryset.order_by('-transaction_date', '-id')
+        if position:
+            moment, pk = position
+            queryset = queryset.filter(
+                Q(transaction_date__lt=moment) | Q(transaction_date=moment, id__lt=pk)
+            )
+        
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        return self.page_rows
+    
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            moment, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            moment = parse_datetime(moment)
+            if moment is None:
+                raise ValueError
+            return moment, uuid.UUID(pk)
+        except (ValueError, TypeError):
+            raise NotFound('Invalid cursor')
+    
+    @staticmethod
+    def encode_cursor(row):
+        return base64.urlsafe_b64encode(f"{row.transaction_date.isoformat()}|{row.pk}".encode()).decode()
+    
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page_rows[-1]))
+    
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        payload = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
 # Authentication Views
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
@@ -165,7 +251,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
     """Transaction management viewset"""
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = TransactionPagination
     
     def get_queryset(self):
         return Transaction.objects.filter(user=self.request.user).order_by('-transaction_date')
@@ -185,6 +271,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+class RecurringTransactionViewSet(viewsets.ModelViewSet):
+    """Recurring transaction template viewset"""
+    serializer_class = RecurringTransactionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    
+    def get_queryset(self):
+        return RecurringTransaction.objects.filter(user=self.request.user).order_by('next_due_date')
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
 class BudgetViewSet(viewsets.ModelViewSet):
     """Budget management viewset"""
     serializer_class = BudgetSerializer
@@ -192,7 +290,7 @@ class BudgetViewSet(viewsets.ModelViewSet):
     pagination_class = StandardResultsSetPagination
     
     def get_queryset(self):
-        return Budget.objects.filter(user=self.request.user).order_by('-created_at')
+        return Budget.objects.filter(user=self.request.user).select_related('category').order_by('-created_at')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -215,161 +313,283 @@ class GoalViewSet(viewsets.ModelViewSet):
 def dashboard(request):
     """Enhanced dashboard data with comprehensive financial overview"""
     user = request.user
-    
-    # Basic financial data
-    accounts = Account.objects.filter(user=user, is_active=True)
-    total_balance = accounts.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
-    
-    # Monthly income and expenses
-    current_month = timezone.now().month
-    current_year = timezone.now().year
-    
-    monthly_income = Transaction.objects.filter(
-        user=user,
-        category__category_type='income',
-        transaction_date__month=current_month,
-        transaction_date__year=current_year
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-    
-    monthly_expenses = Transaction.objects.filter(
-        user=user,
-        category__category_type='expense',
-        transaction_date__month=current_month,
-        transaction_date__year=current_year
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-    
-    # Calculate savings rate
-    savings_rate = 0.0
-    if monthly_income > 0:
-        savings_rate = ((monthly_income - monthly_expenses) / monthly_income) * 100
-    
-    # Recent transactions (last 10)
-    recent_transactions = Transaction.objects.filter(
-        user=user
-    ).select_related('account', 'category').order_by('-transaction_date')[:10]
-    
-    # Active budgets with progress
-    active_budgets = Budget.objects.filter(
-        user=user,
-        is_active=True,
-        end_date__gte=timezone.now().date()
-    ).select_related('category')
-    
-    # Active goals with progress
-    active_goals = Goal.objects.filter(
-        user=user,
-        is_active=True
-    ).order_by('target_date')
-    
-    # Financial health score (simplified calculation)
-    financial_health_score = calculate_financial_health_score(user)
-    
-    # Pending AI insights
-    pending_insights = AIInsight.objects.filter(
-        user=user,
-        is_read=False,
-        is_dismissed=False
-    ).order_by('-created_at')[:5]
-    
-    # Spending analysis by category
-    category_spending = {}
-    for category in Category.objects.filter(user=user, category_type='expense'):
-        spent = Transaction.objects.filter(
-            user=user,
-            category=category,
-            transaction_date__month=current_month,
-            transaction_date__year=current_year
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        category_spending[category.name] = float(spent)
+    data = DashboardEngine(user).build()
     
     return Response({
-        'total_balance': total_balance,
-        'account_count': accounts.count(),
-        'monthly_income': monthly_income,
-        'monthly_expenses': monthly_expenses,
-        'savings_rate': savings_rate,
-        'recent_transactions': TransactionSerializer(recent_transactions, many=True).data,
-        'active_budgets': BudgetSerializer(active_budgets, many=True).data,
-        'active_goals': GoalSerializer(active_goals, many=True).data,
-        'financial_health_score': financial_health_score,
-        'pending_insights': AIInsightSerializer(pending_insights, many=True).data,
-        'category_spending': category_spending,
+        'total_balance': data['total_balance'],
+        'account_count': data['account_count'],
+        'monthly_income': data['monthly_income'],
+        'monthly_expenses': data['monthly_expenses'],
+        'savings_rate': data['savings_rate'],
+        'recent_transactions': TransactionSerializer(data['recent_transactions'], many=True).data,
+        'active_budgets': BudgetSerializer(data['active_budgets'], many=True).data,
+        'active_goals': GoalSerializer(data['active_goals'], many=True).data,
+        'financial_health_score': data['financial_health'].overall_score,
+        'health_grade': data['financial_health'].grade,
+        'pending_insights': AIInsightSerializer(data['pending_insights'], many=True).data,
+        'category_spending': data['category_spending'],
         'user_currency': user.currency,
         'user_timezone': user.timezone,
     })
 
-# Utility functions
-def calculate_financial_health_score(user):
-    """Calculate financial health score (0-100)"""
-    score = 50  # Base score
+def query_moment(params, name, end_of_day=False):
+    """Aware datetime from a date or datetime query parameter, or None"""
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{name} must be a date or datetime")
+        parsed = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def transaction_search(request):
+    """Ranked prefix search over transactions with facet filters"""
+    params = request.query_params
     
     try:
-        # Get current month data
-        current_month = timezone.now().month
-        current_year = timezone.now().year
-        
-        # Calculate monthly income and expenses
-        monthly_income = Transaction.objects.filter(
-            user=user,
-            category__category_type='income',
-            transaction_date__month=current_month,
-            transaction_date__year=current_year
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        monthly_expenses = Transaction.objects.filter(
-            user=user,
-            category__category_type='expense',
-            transaction_date__month=current_month,
-            transaction_date__year=current_year
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        # Savings rate bonus (up to +20 points)
-        if monthly_income > 0:
-            savings_rate = ((monthly_income - monthly_expenses) / monthly_income) * 100
-            if savings_rate >= 20:
-                score += 20
-            elif savings_rate >= 10:
-                score += 15
-            elif savings_rate >= 5:
-                score += 10
-            elif savings_rate >= 0:
-                score += 5
-        
-        # Account diversity bonus (up to +15 points)
-        account_count = Account.objects.filter(user=user, is_active=True).count()
-        if account_count >= 3:
-            score += 15
-        elif account_count >= 2:
-            score += 10
-        elif account_count >= 1:
-            score += 5
-        
-        # Budget adherence bonus (up to +15 points)
-        active_budgets = Budget.objects.filter(
-            user=user,
-            is_active=True,
-            end_date__gte=timezone.now().date()
-        ).count()
-        if active_budgets >= 3:
-            score += 15
-        elif active_budgets >= 1:
-            score += 10
-        
-        # Goal progress bonus (up to +10 points)
-        active_goals = Goal.objects.filter(user=user, is_active=True).count()
-        if active_goals >= 2:
-            score += 10
-        elif active_goals >= 1:
-            score += 5
-        
-        # Ensure score is within bounds
-        score = max(0, min(100, score))
+        search = TransactionSearch(
+            request.user,
+            amount_min=Decimal(params['amount_min']) if params.get('amount_min') else None,
+            amount_max=Decimal(params['amount_max']) if params.get('amount_max') else None,
+            date_from=query_moment(params, 'date_from'),
+            date_to=query_moment(params, 'date_to', end_of_day=True),
+            categories=[uuid.UUID(value) for value in params.getlist('category')],
+            accounts=[uuid.UUID(value) for value in params.getlist('account')],
+        )
+        transactions, has_more, facets = search.search(
+            params.get('q', ''),
+            limit=int(params.get('limit', 20)),
+            offset=int(params.get('offset', 0)),
+            facets=params.get('facets', 'false').lower() == 'true',
+        )
+    except (ValueError, InvalidOperation) as e:
+        return Response({'error': str(e) or 'Invalid search parameters'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    payload = {
+        'results': TransactionSerializer(transactions, many=True).data,
+        'has_more': has_more,
+    }
+    if facets is not None:
+        payload['facets'] = facets
+    return Response(payload)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def transaction_import(request):
+    """Import an uploaded CSV, OFX or QFX statement into one of the user's accounts"""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        account = Account.objects.filter(user=request.user, pk=uuid.UUID(str(request.data.get('account')))).first()
+    except ValueError:
+        account = None
+    if account is None:
+        return Response({'error': 'account not found'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        file_format = detect_format(upload.name, request.data.get('format'))
+        importer = TransactionImporter(
+            request.user, account,
+            job_id=request.data.get('job_id'),
+            categorize=str(request.data.get('categorize', 'true')).lower() != 'false'
+        )
+        return Response(importer.run(upload, file_format))
+    except ImportFormatError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def transaction_import_progress(request, job_id):
+    """Progress of a running or finished import"""
+    progress = TransactionImporter.get_progress(request.user.pk, job_id)
+    if progress is None:
+        return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(progress)
+
+class ExportRenderer(BaseRenderer):
+    """Lets clients ask for text/csv or NDJSON; errors still render as JSON"""
+    media_type = '*/*'
+    format = 'export'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+@renderer_classes([JSONRenderer, ExportRenderer])
+def transaction_export(request):
+    """
+    GET streams the user's transactions as CSV or JSON Lines
+    (``export_format``); POST starts a background Parquet export whose
+    progress is read from ``transactions/export/<job_id>/``.
+    """
+    params = request.query_params if request.method == 'GET' else request.data
+    
+    def ids(name):
+        values = params.getlist(name) if hasattr(params, 'getlist') else params.get(name) or []
+        return [uuid.UUID(str(value)) for value in values]
+    
+    try:
+        exporter = TransactionExporter(
+            request.user,
+            date_from=query_moment(params, 'date_from'),
+            date_to=query_moment(params, 'date_to', end_of_day=True),
+            accounts=ids('account'),
+            categories=ids('category'),
+            job_id=params.get('job_id') if request.method == 'POST' else None,
+        )
+        if request.method == 'POST':
+            progress = exporter.start_job(params.get('export_format', 'parquet'))
+            return Response(progress, status=status.HTTP_202_ACCEPTED)
         
-    except Exception as e:
-        print(f"Error calculating financial health score: {e}")
-        score = 50  # Default score on error
+        file_format = params.get('export_format', 'csv')
+        chunks = exporter.stream(file_format)
+    except (ValueError, ExportFormatError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(chunks, content_type=STREAM_FORMATS[file_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="transactions-{timezone.localdate().isoformat()}.{file_format}"'
+    )
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def transaction_export_progress(request, job_id):
+    """Progress of a background export; includes the file URL once it is written"""
+    progress = TransactionExporter.get_progress(request.user.pk, job_id)
+    if progress is None:
+        return Response({'error': 'Export not found'}, status=status.HTTP_404_NOT_FOUND)
+    if progress.get('file'):
+        progress = dict(progress, url=default_storage.url(progress['file']))
+    return Response(progress)
+
+def bulk_editor(request):
+    """
+    A ``TransactionBulkEditor`` for the request's ``ids`` and ``filter``,
+    e.g. ``{"filter": {"text": "starbucks", "date_from": "2026-03-01",
+    "date_to": "2026-03-31"}}``
+    """
+    ids = request.data.get('ids') or []
+    criteria = request.data.get('filter') or {}
+    if not isinstance(ids, list) or not isinstance(criteria, dict):
+        raise BulkEditError('ids must be a list and filter an object')
+    unknown = set(criteria) - {
+        'text', 'date_from', 'date_to', 'amount_min', 'amount_max', 'categories', 'uncategorized',
+        'accounts', 'transaction_type',
+    }
+    if unknown:
+        raise BulkEditError(f"Unknown filter: {', '.join(sorted(unknown))}")
+    
+    def decimal(name):
+        return Decimal(str(criteria[name])) if criteria.get(name) is not None else None
+    
+    return TransactionBulkEditor(
+        request.user,
+        ids=[uuid.UUID(str(value)) for value in ids],
+        text=criteria.get('text'),
+        date_from=query_moment(criteria, 'date_from'),
+        date_to=query_moment(criteria, 'date_to', end_of_day=True),
+        amount_min=decimal('amount_min'),
+        amount_max=decimal('amount_max'),
+        categories=[uuid.UUID(str(value)) for value in criteria.get('categories') or []],
+        uncategorized=bool(criteria.get('uncategorized')),
+        accounts=[uuid.UUID(str(value)) for value in criteria.get('accounts') or []],
+        transaction_type=criteria.get('transaction_type'),
+    )
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def transaction_bulk_update(request):
+    """Apply ``changes`` to the selected transactions in one statement"""
+    changes = request.data.get('changes')
+    if not isinstance(changes, dict):
+        return Response({'error': 'changes must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return Response(bulk_editor(request).update(changes))
+    except (ValueError, TypeError, InvalidOperation) as e:
+        return Response({'error': str(e) or 'Invalid bulk update'}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def transaction_bulk_delete(request):
+    """Delete the selected transactions in one statement"""
+    try:
+        return Response(bulk_editor(request).delete())
+    except (ValueError, TypeError, InvalidOperation) as e:
+        return Response({'error': str(e) or 'Invalid bulk delete'}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def process_recurring_transactions(request):
+    """Generate every transaction the user's recurring templates owe as of today"""
+    return Response(RecurringScheduler(user=request.user).run())
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def detect_recurring_transactions(request):
+    """Find periodic charges in the user's history; ``full`` re-analyses every merchant"""
+    full = str(request.data.get('full', '')).lower() in ('1', 'true', 'yes')
+    return Response(RecurringChargeDetector(request.user).run(full=full))
+
+# Sync Views
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def sync_push(request):
+    """Apply a batch of offline operations from one device"""
+    operations = request.data.get('operations')
+    if not isinstance(operations, list):
+        return Response({'error': 'operations must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        engine = SyncEngine(
+            request.user,
+            device_id=str(request.data.get('device_id', ''))[:100],
+            strategy=request.data.get('strategy', 'lww')
+        )
+        return Response(engine.push(operations))
+    except SyncError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def sync_pull(request):
+    """Rows changed since the client's cursor; 410 Gone when it must resync from scratch"""
+    try:
+        limit = int(request.query_params.get('limit', 500))
+        page = SyncEngine(request.user).pull(request.query_params.get('cursor'), limit)
+        return Response(page, status=status.HTTP_410_GONE if page['reset'] else status.HTTP_200_OK)
+    except (SyncError, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def changes(request):
+    """
+    Page of the user's change feed after the ``since`` cursor. A cursor
+    older than the pruned tombstones gets 410 Gone with ``reset``: the
+    client drops its local copy and pulls again from ``since=0``.
+    """
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = int(request.query_params.get('limit', 500))
+    except ValueError:
+        return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
     
-    return score
+    page = changes_since(request.user, max(since, 0), limit)
+    return Response(page, status=status.HTTP_410_GONE if page['reset'] else status.HTTP_200_OK)
+
+# Utility functions
+def calculate_financial_health_score(user):
+    """Calculate financial health score (0-100)"""
+    return HealthScoreEngine().current(user).overall_score
 
 def create_default_categories(user):
     """Create default categories for new user"""
@@ -39,10 +39,10 @@ LOCAL_APPS = [
     # 'apps.transactions',    # Replaced by core.Transaction
     # 'apps.budgets',        # Replaced by core.Budget
     'apps.goals',          # Financial goals management
-    # 'apps.analytics',      # Temporarily disabled due to conflicts
+    'apps.analytics',      # Snapshots, spending patterns and category analytics
     'apps.core',
     'apps.learning',       # Learning Management System
-    # 'apps.ai',             # Temporarily disabled due to conflicts
+    'apps.ai',             # Chat conversations, categorization rules and training data
     # 'apps.chat',           # Temporarily disabled
     # 'apps.ml',             # Temporarily disabled
     # 'apps.insights',       # Temporarily disabled
@@ -169,6 +169,11 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Sync change feed: delete tombstones older than this are removed by the
+# prune_change_log command. A client whose cursor predates the removed
+# tombstones gets 410 Gone with reset=true and must resync from cursor 0.
+CHANGE_LOG_RETENTION_DAYS = config('CHANGE_LOG_RETENTION_DAYS', default=90, cast=int)
+
 # Security Settings
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
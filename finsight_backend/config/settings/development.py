@@ -24,6 +24,14 @@ INSTALLED_APPS += [
 # Development middleware
 MIDDLEWARE += []
 
+# In-process cache; sized for the per-budget and per-user cache entries
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
 # CORS settings for development
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -50,6 +58,12 @@ AI_CONFIG = {
     'cache_timeout': 300,  # 5 minutes
     'rate_limit_per_user': 100,  # requests per hour
     'max_context_length': 10,  # conversation history length
+    'prompt_token_budget': 6000,  # estimated tokens per chat prompt
+    'backend': 'gemini',  # 'fake' for offline development and benchmarks
+    'model': 'gemini-1.5-flash',
+    'max_concurrency': 8,  # in-flight model requests per process
+    'request_timeout': 30,  # seconds
+    'max_retries': 3,
 }
 
 # Django Channels Configuration for WebSocket - Temporarily disabled